@@ -0,0 +1,300 @@
+import queue
+import threading
+
+import numpy as np
+
+from typing import NamedTuple
+
+# Longest wait for a block from a running stream before it is considered stalled (in seconds)
+BLOCK_TIMEOUT = 2.0
+
+# Interval at which the state of the backend is checked while waiting for a block (in seconds)
+POLL_INTERVAL = 0.05
+
+
+class BlockTime(NamedTuple):
+    """
+    Stream times of a block (in seconds, on the clock of the backend).
+    """
+    adc: float      # Capture time of the first input frame of the block
+    dac: float      # Playback time of the first output frame of the block
+    current: float  # Time at which the block was handed to the callback
+
+
+class EngineReport(NamedTuple):
+    """
+    Result of AudioEngine.play_record.
+    """
+    fs: int                    # Sampling rate
+    recording: np.ndarray      # Captured (frames, channels) signal, None if not kept
+    block_starts: np.ndarray   # Index of the first frame of every block
+    adc_times: np.ndarray      # Capture time of the first input frame of every block
+    dac_times: np.ndarray      # Playback time of the first output frame of every block
+    current_times: np.ndarray  # Time at which every block was handed to the callback
+    xruns: list                # (first frame of the block, flag) of every under/overflow
+    stream_latency: tuple      # (input, output) latency announced by the backend
+
+    @property
+    def input_latency(self) -> float:
+        """
+        Mean measured time between the capture of a block and its delivery (in seconds).
+        """
+        return float(np.mean(self.current_times - self.adc_times)) if len(self.block_starts) else 0.0
+
+    @property
+    def output_latency(self) -> float:
+        """
+        Mean measured time between the delivery of a block and its playback (in seconds).
+        """
+        return float(np.mean(self.dac_times - self.current_times)) if len(self.block_starts) else 0.0
+
+    @property
+    def round_trip(self) -> float:
+        """
+        Mean measured output-to-input latency (in seconds): a sound played at stimulus frame k
+        is captured at recording frame k + round_trip * fs.
+        """
+        return float(np.mean(self.dac_times - self.adc_times)) if len(self.block_starts) else 0.0
+
+    @property
+    def latency_frames(self) -> int:
+        """
+        The round trip latency in frames.
+        """
+        return int(round(self.round_trip * self.fs))
+
+    def input_time(self, frame) -> np.ndarray:
+        """
+        Capture time of recording frames, from the time stamps of their blocks.
+
+        Parameters:
+        - frame: Index (or array of indices) of recording frames.
+        """
+        block = np.searchsorted(self.block_starts, frame, side='right') - 1
+        return self.adc_times[block] + (np.asarray(frame) - self.block_starts[block]) / self.fs
+
+    def output_time(self, frame) -> np.ndarray:
+        """
+        Playback time of stimulus frames, from the time stamps of their blocks.
+
+        Parameters:
+        - frame: Index (or array of indices) of stimulus frames.
+        """
+        block = np.searchsorted(self.block_starts, frame, side='right') - 1
+        return self.dac_times[block] + (np.asarray(frame) - self.block_starts[block]) / self.fs
+
+
+class SoundDeviceBackend:
+    """
+    Backend playing and recording through the sound card with sounddevice.
+    """
+
+    def __init__(self, device=None, latency='low'):
+        """
+        Parameters:
+        - device: The sounddevice device (or (input, output) pair), None for the default ones.
+        - latency: The latency requested to PortAudio ('low', 'high' or seconds).
+        """
+        self.device = device
+        self.latency = latency
+        self.stream = None
+
+    def start(self, fs: int, in_channels: int, out_channels: int, out_dtype, blocksize: int, callback) -> None:
+        """
+        Opens and starts a duplex stream calling callback(indata, outdata, frames, time, xruns)
+        for every block, until the callback returns False.
+        """
+        import sounddevice as sd  # Only needed with a sound card
+
+        def stream_callback(indata, outdata, frames, time, status):
+            xruns = tuple(flag for flag in ("input_underflow", "input_overflow",
+                                            "output_underflow", "output_overflow")
+                          if getattr(status, flag))
+            block_time = BlockTime(time.inputBufferAdcTime, time.outputBufferDacTime, time.currentTime)
+            if callback(indata, outdata, frames, block_time, xruns) is False:
+                raise sd.CallbackStop
+
+        self.stream = sd.Stream(samplerate=fs, blocksize=blocksize, device=self.device,
+                                channels=(in_channels, out_channels), dtype=('float32', out_dtype),
+                                latency=self.latency, callback=stream_callback)
+        self.stream.start()
+
+    @property
+    def stream_latency(self) -> tuple:
+        return None if self.stream is None else tuple(self.stream.latency)
+
+    @property
+    def active(self) -> bool:
+        """
+        Whether or not the stream is still calling the callback.
+        """
+        return self.stream is not None and self.stream.active
+
+    def stop(self) -> None:
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+
+
+class FakeBackend:
+    """
+    Deterministic in-memory device, to run the engine without audio hardware.
+
+    Blocks are delivered as fast as possible from a thread, with stream times computed from
+    the frame count. The input is the given signal plus, optionally, the output looped back
+    after the round trip latency.
+    """
+
+    def __init__(self, input_signal=None, input_latency: float = 0.005, output_latency: float = 0.005,
+                 loopback: float = 0.0, xruns: dict = None):
+        """
+        Parameters:
+        - input_signal: The (frames, channels) or 1-D signal captured by the fake microphone.
+        - input_latency: Simulated capture latency (in seconds).
+        - output_latency: Simulated playback latency (in seconds).
+        - loopback: Gain of the output captured back by the microphone.
+        - xruns: {block index: flag} of the simulated under/overflows.
+        """
+        self.input_signal = None if input_signal is None else np.asarray(input_signal, dtype=np.float32)
+        self.input_latency = input_latency
+        self.output_latency = output_latency
+        self.loopback = loopback
+        self.xruns = xruns or {}
+        self.thread = None
+        self.stream_latency = (input_latency, output_latency)
+
+    def start(self, fs: int, in_channels: int, out_channels: int, out_dtype, blocksize: int, callback) -> None:
+        delay = int(round((self.input_latency + self.output_latency) * fs))
+        if self.loopback and delay < blocksize:
+            raise ValueError("the simulated round trip latency must cover at least one block")
+        scale = np.iinfo(out_dtype).max + 1 if np.issubdtype(out_dtype, np.integer) else 1
+
+        def run():
+            played = np.zeros((delay, 1), dtype=np.float32)  # Output on its way back to the microphone
+            frame, block = 0, 0
+            while True:
+                indata = np.zeros((blocksize, in_channels), dtype=np.float32)
+                if self.input_signal is not None:
+                    part = self.input_signal[frame:frame + blocksize]
+                    indata[:len(part)] = part.reshape(len(part), -1)[:, :in_channels]
+                if self.loopback:
+                    indata += self.loopback * played[:blocksize]
+                    played = played[blocksize:]
+                outdata = np.zeros((blocksize, out_channels), dtype=out_dtype)
+
+                now = frame / fs
+                block_time = BlockTime(now - self.input_latency, now + self.output_latency, now)
+                xruns = (self.xruns[block],) if block in self.xruns else ()
+                if callback(indata, outdata, blocksize, block_time, xruns) is False:
+                    return
+                if self.loopback:
+                    played = np.concatenate((played, outdata[:, :1].astype(np.float32) / scale))
+                frame += blocksize
+                block += 1
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    @property
+    def active(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.thread.join()
+
+
+class AudioEngine:
+    """
+    Plays a stimulus and records the input in the block callback of a duplex stream.
+
+    The callback only copies the blocks, every other work (keeping the recording, analysing
+    it...) is done by consumers on the calling thread as the blocks arrive. Every block is
+    time stamped with its first frame index and its stream times, which gives the measured
+    latencies, and the under/overflows reported by the backend are kept.
+    """
+
+    def __init__(self, backend=None, blocksize: int = 256):
+        """
+        Parameters:
+        - backend: The audio backend (SoundDeviceBackend by default, FakeBackend for tests).
+        - blocksize: Number of frames per block.
+        """
+        self.backend = SoundDeviceBackend() if backend is None else backend
+        self.blocksize = blocksize
+
+    def _next_block(self, blocks: queue.Queue) -> tuple:
+        """
+        Waits for the next block of the callback.
+
+        Raises a RuntimeError if the stream stopped (an error in the callback or the device)
+        or stalled before delivering it, rather than waiting forever.
+        """
+        waited = 0.0
+        while True:
+            try:
+                return blocks.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                waited += POLL_INTERVAL
+                # The blocks are queued before the stream stops, check the state first
+                if not self.backend.active and blocks.empty():
+                    raise RuntimeError("the stream stopped before the end of the stimulus")
+                if waited >= BLOCK_TIMEOUT:
+                    raise RuntimeError(f"no block received from the stream for {BLOCK_TIMEOUT} s")
+
+    def play_record(self, stimulus, fs: int, in_channels: int = 1, consumers=(),
+                    keep_recording: bool = True) -> EngineReport:
+        """
+        Plays the stimulus while recording, until the whole stimulus has been played.
+
+        Parameters:
+        - stimulus: The signal to play, 1-D or (frames, channels).
+        - fs: The sampling rate.
+        - in_channels: Number of recorded channels.
+        - consumers: Callables called with (first frame, block, block time) for every recorded block.
+        - keep_recording: Whether or not to return the whole recording in the report.
+
+        Returns:
+        - The EngineReport of the take.
+
+        Raises:
+        - RuntimeError: If the stream stops or stalls before the whole stimulus is played.
+        """
+        stimulus = np.asarray(stimulus)
+        if stimulus.ndim == 1:
+            stimulus = stimulus[:, np.newaxis]
+        n_frames = len(stimulus)
+        blocks = queue.Queue()
+        position = [0]
+
+        def callback(indata, outdata, frames, block_time, xruns):
+            start = position[0]
+            part = stimulus[start:start + frames]
+            outdata[:len(part)] = part
+            outdata[len(part):] = 0
+            blocks.put((start, indata[:min(frames, n_frames - start)].copy(), block_time, xruns))
+            position[0] = start + frames
+            return position[0] < n_frames
+
+        recording = np.empty((n_frames, in_channels), dtype=np.float32) if keep_recording else None
+        starts, adc, dac, current, xrun_list = [], [], [], [], []
+        self.backend.start(fs, in_channels, stimulus.shape[1], stimulus.dtype, self.blocksize, callback)
+        try:
+            received = 0
+            while received < n_frames:
+                start, block, block_time, xruns = self._next_block(blocks)
+                received = start + len(block)
+                starts.append(start)
+                adc.append(block_time.adc)
+                dac.append(block_time.dac)
+                current.append(block_time.current)
+                xrun_list.extend((start, flag) for flag in xruns)
+                if recording is not None:
+                    recording[start:received] = block
+                for consumer in consumers:
+                    consumer(start, block, block_time)
+        finally:
+            self.backend.stop()
+
+        return EngineReport(fs, recording, np.array(starts, dtype=np.int64), np.array(adc), np.array(dac),
+                            np.array(current), xrun_list, self.backend.stream_latency)
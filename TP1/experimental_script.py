@@ -2,22 +2,28 @@ import os
 import platform
 
 import numpy as np
-import sounddevice as sd
 
 from time import sleep
 from random import shuffle
+from functools import lru_cache
 from enum import Enum, unique
+from typing import TYPE_CHECKING
 from scipy.io.wavfile import read
-from scipy.io.wavfile import write
-from matplotlib import pyplot as plt
+from audio_engine import AudioEngine
+from online_detection import OnlineTapDetector, find_stimulus_beats, save_events
+from output_worker import OutputWorker
+from wav_writer import StreamingWavWriter
 
+# matplotlib is only imported by the functions plotting, like sounddevice by the audio engine
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-# Paths to resources and output directories
-RESSOURCES_PATH = "res"
+# Paths to resources and output directories, next to this script
+RESSOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "res")
 PERIODIC_AUDIO_PATH = f"{RESSOURCES_PATH}/PeriodicAlong.wav"
 APERIODIC_AUDIO_PATH = f"{RESSOURCES_PATH}/Aperiodic.wav"
 
-OUTPUT_PATH = "output"
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
 RECORDING_OUTPUT_PATH = f"{OUTPUT_PATH}/recordings"
 PLOT_OUTPUT_PATH = f"{OUTPUT_PATH}/plots"
 
@@ -51,6 +57,8 @@ def plot_signal(signal, sample_rate, duration: float = None, start: float = .0)
     - duration: Duration of the signal to plot (in seconds), None to plot the full signal.
     - start: The starting time in the signal (in seconds).
     """
+    from matplotlib import pyplot as plt
+
     signal_duration = len(signal) / sample_rate
 
     # Validate start time
@@ -75,26 +83,79 @@ def plot_signal(signal, sample_rate, duration: float = None, start: float = .0)
     plt.show()
 
 
-def plot_taps_with_beats(beats, taps) -> None:
+def plot_taps_with_beats(beats, taps, fig: "Figure" = None) -> None:
     """
     Plots two signals (beats and taps) one under the other for comparison.
+    Each signal is drawn as its min/max envelope over the pixels of the plot.
 
     Parameters:
     - beats: The beats signal.
     - taps: The taps signal.
+    - fig: The figure to plot in, default is a new pyplot figure.
     """
+    from TP2.envelope_plot import plot_envelope  # Draws long recordings in a fraction of the time
+
     samples = min(len(beats), len(taps))
-    t = np.arange(0, samples)
 
     # Create subplots
-    fig, (ax1, ax2) = plt.subplots(2, figsize=(10, 12))
+    if fig is None:
+        from matplotlib import pyplot as plt
+        fig, (ax1, ax2) = plt.subplots(2, figsize=(10, 12))
+    else:
+        ax1, ax2 = fig.subplots(2)
     fig.suptitle("The two signals")
-    ax1.plot(t, beats[0:samples])
-    ax2.plot(t, taps[0:samples])
+    plot_envelope(ax1, beats[0:samples])
+    plot_envelope(ax2, taps[0:samples])
     ax1.set_title("Beats")
     ax2.set_title("Taps")
 
 
+@lru_cache(maxsize=None)
+def load_stimulus(signal: Signal) -> tuple:
+    """
+    Reads the audio signal of a signal type, once per session.
+
+    Parameters:
+    - signal: The type of signal (PERIODIC or APERIODIC).
+
+    Returns:
+    - The sampling rate and the read-only audio signal.
+    """
+    fs, audio_signal = read(PERIODIC_AUDIO_PATH if signal is Signal.PERIODIC 
+                            else APERIODIC_AUDIO_PATH)
+    audio_signal.flags.writeable = False  # Shared by every task of the session
+    return fs, audio_signal
+
+
+def save_taps(taps_filename: str, taps: list) -> None:
+    """
+    Saves the taps detected while recording.
+    """
+    save_events(taps_filename, taps)
+    print(f"[LOG] {len(taps)} taps saved to {taps_filename}")
+
+
+def save_plot(plt_filename: str, beats, recording_filename: str) -> None:
+    """
+    Saves the plot of the signals, without pyplot so that it can run in a background thread.
+    """
+    from matplotlib.figure import Figure
+
+    _, taps = read(recording_filename, mmap=True)
+    fig = Figure(figsize=(10, 12))
+    plot_taps_with_beats(beats, taps, fig)
+    fig.savefig(plt_filename, dpi=300, bbox_inches='tight')
+    print(f"[LOG] Signals plot saved to {plt_filename}")
+
+
+def show_plots() -> None:
+    """
+    Shows the pyplot figures plotted so far.
+    """
+    from matplotlib import pyplot as plt
+    plt.show()
+
+
 def print_instructions(duration:int=None) -> None:
     """
     Prints instructions for the user before the task begins.
@@ -131,7 +192,8 @@ def clear_terminal():
 
 
 def conduct_task(signal: Signal, subject_id: int = None, duration: float = None, 
-                 countdown: int = 3, show_plot: bool = False) -> None:
+                 countdown: int = 3, show_plot: bool = False, engine: AudioEngine = None,
+                 worker: OutputWorker = None) -> None:
     """
     Conducts the audio task, playing the audio and recording the user's taps.
 
@@ -141,10 +203,13 @@ def conduct_task(signal: Signal, subject_id: int = None, duration: float = None,
     - duration: Duration of the task (in seconds). If None, uses the audio length.
     - countdown: Countdown before the task starts.
     - show_plot: Whether or not to display the plot of the signals after recording.
+    - engine: The audio engine playing and recording, default is the sound card.
+    - worker: Background worker saving the outputs, default is to save them before returning.
+      With a worker, the taps are saved during the next task but the figure is only rendered
+      when the worker is flushed, and the plot is not shown until show_plots() is called.
     """
-    # Read the audio signal based on the signal type
-    fs, audio_signal = read(PERIODIC_AUDIO_PATH if signal is Signal.PERIODIC 
-                            else APERIODIC_AUDIO_PATH)
+    # Get the audio signal based on the signal type
+    fs, audio_signal = load_stimulus(signal)
 
     # Ensure output directories exist
     if not os.path.exists(OUTPUT_PATH):
@@ -174,23 +239,39 @@ def conduct_task(signal: Signal, subject_id: int = None, duration: float = None,
     # Play the audio and start recording
     print("Recording from microphone...")
     print("Tap whenever you hear a beat...")
-    recorded_signal = sd.playrec(audio_signal[0:int(duration * fs)],
-                                 samplerate=fs, channels=1, blocking=False)
-    sleep(duration)
-    print("Recording completed!")
-
-    # Save the recording to a file
     subject = "" if subject_id is None else f"{subject_id}_"
     recording_filename = f"{RECORDING_OUTPUT_PATH}/{subject}{str(signal)}_task.wav"
-    write(recording_filename, fs, recorded_signal)
+    if engine is None:
+        engine = AudioEngine()
+    stimulus = audio_signal[0:int(duration * fs)]
+    detector = OnlineTapDetector(fs, find_stimulus_beats(stimulus, fs))
+
+    # The recording is streamed to its file, which stays readable if the task is interrupted
+    with StreamingWavWriter(recording_filename, fs, channels=1) as writer:
+        report = engine.play_record(stimulus, fs, in_channels=1, keep_recording=False,
+                                    consumers=[detector, lambda start, block, _: writer.write(block)])
+    taps = detector.flush()
+    print("Recording completed!")
     print(f"[LOG] Recording saved to {recording_filename}")
+    print(f"[LOG] Measured latency: input {report.input_latency * 1000:.1f} ms, "
+          f"output {report.output_latency * 1000:.1f} ms, round trip {report.latency_frames} samples")
+    if report.xruns:
+        print(f"[WARNING]: {len(report.xruns)} buffer under/overflows, first at sample {report.xruns[0][0]}")
 
-    # Plot and save the signals
-    plot_taps_with_beats(audio_signal, recorded_signal)
+    # Save the taps detected while recording next to the recording, then the plot of the signals
+    taps_filename = f"{RECORDING_OUTPUT_PATH}/{subject}{str(signal)}_task_taps.csv"
     plt_filename = f"{PLOT_OUTPUT_PATH}/{subject}{str(signal)}_task.png"
-    plt.savefig(plt_filename, dpi=300, bbox_inches='tight')
-    print(f"[LOG] Signals plot saved to {plt_filename}")
-    if show_plot: plt.show()
+    if worker is None:
+        save_taps(taps_filename, taps)
+        save_plot(plt_filename, audio_signal, recording_filename)
+    else:
+        worker.submit(save_taps, taps_filename, taps)
+        # Rendering holds the interpreter for seconds, which would starve the next task's audio callback
+        worker.defer(save_plot, plt_filename, audio_signal, recording_filename)
+
+    if show_plot:
+        plot_taps_with_beats(audio_signal, read(recording_filename, mmap=True)[1])
+        if worker is None: show_plots()
 
     print("\r----- Task completed ----")
 
@@ -202,28 +283,40 @@ def run_trial(start_signal: Signal = None, *args, **kwargs):
     Parameters:
     - start_signal: Optional starting signal type (PERIODIC or APERIODIC), default is random.
     - *args, **kwargs: Additional arguments to pass to conduct_task.
+
+    The outputs of both tasks are saved by a background worker, flushed at the end of the trial.
     """
     task_order = [s for s in Signal]
     shuffle(task_order)
     if not start_signal is None and task_order[0] != start_signal:
         task_order.reverse()
 
+    worker = kwargs.pop('worker', None) or OutputWorker()
+
     print_instructions(kwargs.get('duration', None))
     wait_input()
 
-    # Conduct the first task
-    conduct_task(task_order[0], *args, **kwargs)
-    print("")
+    try:
+        # Conduct the first task
+        conduct_task(task_order[0], *args, worker=worker, **kwargs)
+        print("")
 
-    print("Task 1 completed, one task left.")
-    wait_input()
+        print("Task 1 completed, one task left.")
+        wait_input()
 
-    # Conduct the second task
-    conduct_task(task_order[1], *args, **kwargs)
-    print("")
+        # Conduct the second task
+        conduct_task(task_order[1], *args, worker=worker, **kwargs)
+        print("")
+    finally:
+        # Wait for the recordings and plots to be saved
+        print("Saving the outputs...")
+        errors = worker.flush()
 
+    if errors:
+        print(f"[WARNING]: {len(errors)} outputs could not be saved.")
     print("All tasks completed, thanks for participating!")
     print("---")
+    if kwargs.get('show_plot', False): show_plots()
 
 
 if __name__ == "__main__":
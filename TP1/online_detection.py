@@ -0,0 +1,181 @@
+import csv
+
+import numpy as np
+
+from typing import NamedTuple
+from scipy.signal import find_peaks
+
+# Beat detection settings on the stimulus, as in TP2 (height of the normalized signal, distance in seconds)
+BEATS_HEIGHT = 0.1
+BEATS_DISTANCE = 0.3
+
+
+class TapEvent(NamedTuple):
+    """
+    A tap detected while recording.
+    """
+    frame: int            # Recording frame of the tap peak
+    stimulus_frame: int   # Stimulus frame played when the tap was captured
+    time: float           # Time of the tap from the start of the stimulus (in seconds)
+    beat: int             # Index of the nearest stimulus beat, -1 if there is none
+    asynchrony: float     # Time of the tap minus the time of that beat (in seconds)
+
+
+def find_stimulus_beats(stimulus, fs: int) -> np.ndarray:
+    """
+    Finds the beats of a stimulus, with the settings TP2 uses on the beat channel.
+
+    Parameters:
+    - stimulus: The stimulus signal, 1-D or (frames, channels).
+    - fs: The sampling rate.
+
+    Returns:
+    - The stimulus frames of the beats.
+    """
+    signal = np.asarray(stimulus, dtype=np.float64)
+    if signal.ndim > 1:
+        signal = signal[:, 0]
+    peak = signal.max()
+    if len(signal) == 0 or peak <= 0:
+        return np.empty(0, dtype=np.int64)
+    return find_peaks(signal / peak, height=BEATS_HEIGHT, distance=BEATS_DISTANCE * fs)[0]
+
+
+class RingBuffer:
+    """
+    Keeps the last samples of a signal in a fixed size array.
+    """
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.end = 0  # Number of samples written so far
+
+    def write(self, samples) -> None:
+        """
+        Appends samples, overwriting the oldest ones.
+        """
+        samples = samples[-len(self.data):]
+        start = self.end % len(self.data)
+        first = min(len(samples), len(self.data) - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.end += len(samples)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Gets the samples between two absolute indices, which must still be in the buffer.
+        """
+        if start < self.end - len(self.data) or stop > self.end:
+            raise IndexError("samples not in the ring buffer")
+        index = np.arange(start, stop) % len(self.data)
+        return self.data[index]
+
+
+class OnlineTapDetector:
+    """
+    Detects taps block by block while recording, to be used as an AudioEngine consumer.
+
+    A tap starts when the absolute signal crosses a threshold, at least refractory seconds
+    after the previous tap, and is placed on the highest sample of the following peak
+    window, taken from a ring buffer of the last samples. The threshold follows the noise
+    floor, measured on the blocks without tap. Each tap is located in the stimulus with the
+    stream times of its block, and compared with the nearest stimulus beat.
+    """
+
+    def __init__(self, fs: int, beats=(), height: float = 0.1, noise_factor: float = 4.0,
+                 refractory: float = 0.1, peak_window: float = 0.01, on_tap=None):
+        """
+        Parameters:
+        - fs: The sampling rate.
+        - beats: The stimulus frames of the beats (see find_stimulus_beats).
+        - height: Minimum threshold on the absolute signal (full scale is 1).
+        - noise_factor: The threshold is at least this factor times the noise RMS.
+        - refractory: Minimum time between two taps (in seconds), the TP2 tap distance.
+        - peak_window: Duration after the threshold crossing in which the tap peak is searched (in seconds).
+        - on_tap: Optional callable called with every TapEvent as soon as it is detected.
+        """
+        self.fs = fs
+        self.beats = np.asarray(beats, dtype=np.int64)
+        self.height = height
+        self.noise_factor = noise_factor
+        self.refractory = int(round(refractory * fs))
+        self.peak_window = max(int(round(peak_window * fs)), 1)
+        self.on_tap = on_tap
+        self.ring = RingBuffer(4 * self.peak_window + fs)  # Holds the peak windows of a block
+        self.noise = None          # Running RMS of the blocks without tap
+        self.next_allowed = 0      # First frame at which a new tap may start
+        self.pending = []          # (crossing frame, stimulus offset) of taps waiting for their peak window
+        self.events = []
+
+    def threshold(self) -> float:
+        return self.height if self.noise is None else max(self.height, self.noise_factor * self.noise)
+
+    def __call__(self, start: int, block, block_time) -> None:
+        """
+        Processes a recorded block (AudioEngine consumer).
+
+        Parameters:
+        - start: Recording frame of the first sample of the block.
+        - block: The (frames, channels) block, the first channel is used.
+        - block_time: The stream times of the block (audio_engine.BlockTime).
+        """
+        signal = np.abs(np.asarray(block)[:, 0] if np.ndim(block) > 1 else np.asarray(block))
+        self.ring.write(signal)
+        offset = (block_time.dac - block_time.adc) * self.fs  # Recording frame - stimulus frame
+
+        threshold = self.threshold()
+        crossings = np.flatnonzero(signal >= threshold) + start
+        i = np.searchsorted(crossings, self.next_allowed)
+        while i < len(crossings):
+            self.pending.append((int(crossings[i]), offset))
+            self.next_allowed = crossings[i] + self.refractory
+            i = np.searchsorted(crossings, self.next_allowed)
+        if len(crossings) == 0:
+            rms = float(np.sqrt(np.mean(np.square(signal)))) if len(signal) else 0.0
+            self.noise = rms if self.noise is None else 0.95 * self.noise + 0.05 * rms
+
+        self._resolve(self.ring.end)
+
+    def flush(self) -> list:
+        """
+        Resolves the taps whose peak window was cut by the end of the recording.
+
+        Returns:
+        - The list of every detected TapEvent.
+        """
+        self._resolve(self.ring.end, final=True)
+        return self.events
+
+    def _resolve(self, available: int, final: bool = False) -> None:
+        while self.pending and (final or self.pending[0][0] + self.peak_window <= available):
+            crossing, offset = self.pending.pop(0)
+            window = self.ring.read(crossing, min(crossing + self.peak_window, available))
+            frame = crossing + int(np.argmax(window))
+            self._emit(frame, offset)
+
+    def _emit(self, frame: int, offset: float) -> None:
+        stimulus_frame = int(round(frame - offset))
+        beat, asynchrony = -1, float("nan")
+        if len(self.beats):
+            i = np.searchsorted(self.beats, stimulus_frame)
+            candidates = [j for j in (i - 1, i) if 0 <= j < len(self.beats)]
+            beat = int(min(candidates, key=lambda j: abs(stimulus_frame - self.beats[j])))
+            asynchrony = (stimulus_frame - self.beats[beat]) / self.fs
+        event = TapEvent(frame, stimulus_frame, stimulus_frame / self.fs, beat, asynchrony)
+        self.events.append(event)
+        if self.on_tap is not None:
+            self.on_tap(event)
+
+
+def save_events(fname: str, events: list) -> None:
+    """
+    Writes tap events to a CSV file, one line per tap.
+
+    Parameters:
+    - fname: Name of the CSV file.
+    - events: The TapEvent list.
+    """
+    with open(fname, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TapEvent._fields)
+        writer.writerows(events)
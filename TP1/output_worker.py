@@ -0,0 +1,65 @@
+import queue
+import threading
+
+
+class OutputWorker:
+    """
+    Runs the saving tasks of a session (recordings, events, figures) in a background thread.
+
+    Tasks run one at a time in submission order, so that the subject does not wait for
+    files to be written between two tasks. A failing task is reported and the next ones
+    still run. Heavy tasks (figures) can be deferred to the next flush, so they do not
+    hold the interpreter while the audio callback of a task is running.
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.deferred = []
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> None:
+        """
+        Queues fn(*args, **kwargs).
+
+        Parameters:
+        - fn: The task to run.
+        - args, kwargs: Its arguments, which must not be modified afterwards.
+        """
+        self.tasks.put((fn, args, kwargs))
+
+    def defer(self, fn, *args, **kwargs) -> None:
+        """
+        Keeps fn(*args, **kwargs) to be queued at the next flush, after the submitted tasks.
+
+        Parameters:
+        - fn: The task to run.
+        - args, kwargs: Its arguments, which must not be modified afterwards.
+        """
+        self.deferred.append((fn, args, kwargs))
+
+    def flush(self) -> list:
+        """
+        Queues the deferred tasks and waits for every queued task to be done.
+
+        Returns:
+        - The exceptions raised by the tasks since the last flush.
+        """
+        deferred, self.deferred = self.deferred, []
+        for task in deferred:
+            self.tasks.put(task)
+        self.tasks.join()
+        errors, self.errors = self.errors, []
+        return errors
+
+    def _run(self) -> None:
+        while True:
+            fn, args, kwargs = self.tasks.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"[ERROR]: {getattr(fn, '__name__', fn)} failed: {e!r}")
+                self.errors.append(e)
+            finally:
+                self.tasks.task_done()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from audio_engine import AudioEngine, FakeBackend
+
+FS = 1000
+BLOCKSIZE = 8
+
+
+def test_loopback_round_trip_latency():
+    stimulus = np.zeros(200, dtype=np.float32)
+    stimulus[50] = 0.5
+    backend = FakeBackend(input_latency=0.004, output_latency=0.006, loopback=1.0)
+    report = AudioEngine(backend, BLOCKSIZE).play_record(stimulus, FS)
+    assert report.latency_frames == 10
+    assert np.flatnonzero(report.recording[:, 0]).tolist() == [50 + report.latency_frames]
+    assert report.recording[60, 0] == 0.5
+    np.testing.assert_array_equal(report.block_starts, np.arange(0, 200, BLOCKSIZE))
+
+
+def test_xruns_reported_with_their_frame():
+    backend = FakeBackend(xruns={2: "input_overflow", 5: "output_underflow"})
+    report = AudioEngine(backend, BLOCKSIZE).play_record(np.zeros(100, dtype=np.int16), FS)
+    assert report.xruns == [(2 * BLOCKSIZE, "input_overflow"), (5 * BLOCKSIZE, "output_underflow")]
+
+
+def test_recording_equals_input():
+    signal = np.random.default_rng(0).uniform(-1, 1, (101, 2)).astype(np.float32)
+    blocks = []
+    report = AudioEngine(FakeBackend(signal), BLOCKSIZE).play_record(
+        np.zeros(101), FS, in_channels=2, consumers=[lambda start, block, _: blocks.append((start, block))])
+    np.testing.assert_array_equal(report.recording, signal)
+    np.testing.assert_array_equal(np.concatenate([block for _, block in blocks]), signal)
+
+
+class StoppingBackend(FakeBackend):
+    """
+    Fake device whose stream stops after a few blocks, as on a device error.
+    """
+
+    def start(self, fs, in_channels, out_channels, out_dtype, blocksize, callback):
+        calls = [0]
+
+        def stopping_callback(*args):
+            calls[0] += 1
+            return callback(*args) and calls[0] < 3
+
+        super().start(fs, in_channels, out_channels, out_dtype, blocksize, stopping_callback)
+
+
+def test_stopped_stream_raises():
+    with pytest.raises(RuntimeError, match="stopped"):
+        AudioEngine(StoppingBackend(), BLOCKSIZE).play_record(np.zeros(100), FS)
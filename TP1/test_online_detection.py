@@ -0,0 +1,43 @@
+import numpy as np
+
+from audio_engine import AudioEngine, FakeBackend
+from online_detection import OnlineTapDetector, find_stimulus_beats
+
+FS = 1000
+BLOCKSIZE = 8
+
+# Round trip of the fake device (in frames): input 4 ms + output 6 ms at 1 kHz
+LATENCY = 10
+
+# Shape of a tap, its peak one frame after the threshold crossing
+TAP = np.array([0.3, 0.8, 0.5, 0.2])
+
+
+def test_taps_located_on_the_stimulus_beats():
+    beats = np.array([100, 500, 900, 1300])
+    stimulus = np.zeros(1500, dtype=np.float32)
+    stimulus[beats] = 1.0
+    asynchronies = np.array([-20, 0, 35, 3])  # Stimulus frames, the last tap crosses a block boundary
+    peaks = beats + asynchronies + LATENCY
+    microphone = np.zeros(len(stimulus), dtype=np.float32)
+    for peak in peaks:
+        microphone[peak - 1:peak - 1 + len(TAP)] = TAP
+
+    detector = OnlineTapDetector(FS, find_stimulus_beats(stimulus, FS))
+    engine = AudioEngine(FakeBackend(microphone, input_latency=0.004, output_latency=0.006), BLOCKSIZE)
+    report = engine.play_record(stimulus, FS, consumers=[detector])
+    events = detector.flush()
+
+    assert report.latency_frames == LATENCY
+    assert [event.frame for event in events] == peaks.tolist()
+    assert [event.stimulus_frame for event in events] == (beats + asynchronies).tolist()
+    assert [event.beat for event in events] == [0, 1, 2, 3]
+    np.testing.assert_allclose([event.asynchrony for event in events], asynchronies / FS)
+
+
+def test_tap_cut_by_the_end_of_the_recording():
+    microphone = np.zeros(64, dtype=np.float32)
+    microphone[-2:] = TAP[:2]
+    detector = OnlineTapDetector(FS)
+    AudioEngine(FakeBackend(microphone), BLOCKSIZE).play_record(np.zeros(64), FS, consumers=[detector])
+    assert [event.frame for event in detector.flush()] == [63]
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from scipy.io import wavfile
+from wav_writer import StreamingWavWriter
+
+FS = 8000
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.int16, np.uint8])
+def test_file_readable_after_a_block_cut_midway(tmp_path, dtype):
+    fname = str(tmp_path / "recording.wav")
+    rng = np.random.default_rng(0)
+    scale, offset = {np.float32: (1, 0), np.int16: (30000, 0), np.uint8: (100, 128)}[dtype]
+    blocks = [(rng.uniform(-1, 1, (37, 2)) * scale + offset).astype(dtype) for _ in range(4)]
+
+    writer = StreamingWavWriter(fname, FS, channels=2, dtype=dtype)
+    for block in blocks[:3]:
+        writer.write(block)
+    # The process dies while writing the fourth block: only part of its bytes reach the file
+    writer.file.seek(0, 2)
+    writer.file.write(blocks[3].tobytes()[:51])
+    writer.file.flush()
+
+    fs, data = wavfile.read(fname)
+    assert fs == FS
+    np.testing.assert_array_equal(data, np.concatenate(blocks[:3]))
+    writer.close()
+
+
+def test_closed_file_padded_to_an_even_size(tmp_path):
+    fname = str(tmp_path / "recording.wav")
+    with StreamingWavWriter(fname, FS, channels=1, dtype=np.uint8) as writer:
+        writer.write(np.arange(5, dtype=np.uint8))
+    fs, data = wavfile.read(fname)
+    assert (tmp_path / "recording.wav").stat().st_size % 2 == 0
+    np.testing.assert_array_equal(data, np.arange(5, dtype=np.uint8))
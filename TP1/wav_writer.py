@@ -0,0 +1,88 @@
+import os
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+
+
+class StreamingWavWriter:
+    """
+    Writes a .wav file block by block, keeping its header up to date.
+
+    The RIFF, fact and data sizes are rewritten after every block, so the file on disk is
+    always a valid .wav file holding every block written so far. If the process dies in
+    the middle of a block, readers get the file as it was after the previous block.
+    """
+
+    def __init__(self, fname: str, fs: int, channels: int = 1, dtype=np.float32, fsync: bool = False):
+        """
+        Parameters:
+        - fname: Name of the .wav file.
+        - fs: The sampling rate.
+        - channels: Number of channels.
+        - dtype: Sample type: float32 or float64 (IEEE float), uint8, int16 or int32 (PCM).
+        - fsync: Whether or not to force every block to the disk, not only to the OS.
+        """
+        self.dtype = np.dtype(dtype)
+        self.is_float = self.dtype.kind == 'f'
+        if not (self.is_float or self.dtype in (np.uint8, np.int16, np.int32)):
+            raise ValueError(f"unsupported sample type {self.dtype}")
+        self.fs = fs
+        self.channels = channels
+        self.fsync = fsync
+        self.frames = 0
+        self.file = open(fname, 'wb')
+        self._write_header()
+
+    def _write_header(self) -> None:
+        width = self.dtype.itemsize
+        data_size = self.frames * self.channels * width
+        if self.is_float:
+            # Non-PCM formats have an extended fmt chunk and a fact chunk
+            fmt = struct.pack('<HHIIHHH', WAVE_FORMAT_IEEE_FLOAT, self.channels, self.fs,
+                              self.fs * self.channels * width, self.channels * width, 8 * width, 0)
+            fact = b'fact' + struct.pack('<II', 4, self.frames)
+        else:
+            fmt = struct.pack('<HHIIHH', WAVE_FORMAT_PCM, self.channels, self.fs,
+                              self.fs * self.channels * width, self.channels * width, 8 * width)
+            fact = b''
+        chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt + fact + b'data' + struct.pack('<I', data_size)
+        self.data_offset = 12 + len(chunks)
+        self.file.seek(0)
+        self.file.write(b'RIFF' + struct.pack('<I', 4 + len(chunks) + data_size) + b'WAVE' + chunks)
+
+    def write(self, block) -> None:
+        """
+        Appends a block of frames and updates the header.
+
+        Parameters:
+        - block: The (frames, channels) or 1-D block, converted to the sample type of the file.
+        """
+        block = np.asarray(block, dtype=self.dtype).reshape(-1, self.channels)
+        self.file.seek(self.data_offset + self.frames * self.channels * self.dtype.itemsize)
+        self.file.write(block.astype(self.dtype.newbyteorder('<'), copy=False).tobytes())
+        self.frames += len(block)
+        self._write_header()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        """
+        Pads the data chunk to an even size, as RIFF requires, and closes the file.
+        """
+        if self.file.closed:
+            return
+        size = self.frames * self.channels * self.dtype.itemsize
+        if size % 2:
+            self.file.seek(self.data_offset + size)
+            self.file.write(b'\0')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules of this folder import each other by module name, as when run from it, so the
+# folder is searched for them when it is imported as a package. It is searched last, so the
+# generic module names of the folder do not shadow installed packages
+_FOLDER = os.path.dirname(os.path.abspath(__file__))
+if _FOLDER not in sys.path:
+    sys.path.append(_FOLDER)
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from praatio import textgrid
+from synthetic import generate_corpus
+from detection import detect_peaks, split_trials
+from coupling import couple_trials
+import final_script
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Default file of the stored baseline, next to this script
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Throughput metrics compared with the baseline: True when higher is better
+METRICS = {"files_per_s": True, "beats_per_s": True, "peak_rss_mb": False}
+
+# Relative change beyond which a metric is reported as a regression
+TOLERANCE = 0.1
+
+
+def peak_rss_mb() -> float:
+    """
+    Gets the peak resident set size of this process and of its finished children.
+
+    Returns:
+        float: The largest peak RSS (in MB), or None where it is not available.
+    """
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, kB elsewhere
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * unit / 1e6
+
+
+def time_stages(file_paths: list) -> dict:
+    """
+    Times the stages of the pipeline file by file, without modifying the files.
+
+    Args:
+        file_paths (list): The file paths of the .wav files.
+
+    Returns:
+        dict: The total time (in seconds) spent in each stage.
+    """
+    stages = {"read_textgrid": 0.0, "detect_peaks": 0.0, "couple_trials": 0.0, "datafile_columns": 0.0}
+    for file_path in file_paths:
+        start = time.perf_counter()
+        tg = textgrid.openTextgrid(final_script.get_textGrid_path(file_path), True)
+        trials = final_script.extractInfosFromTier(final_script.without_blanks(tg.getTier(tg.tierNames[0])))
+        lap = time.perf_counter()
+        stages["read_textgrid"] += lap - start
+
+        fs, beats, taps = detect_peaks(file_path, trials)
+        start, lap = lap, time.perf_counter()
+        stages["detect_peaks"] += lap - start
+
+        _, _, cond, _ = final_script.parse_filepath(file_path)
+        couples = couple_trials(split_trials(beats, len(trials)), split_trials(taps, len(trials)), cond)
+        start, lap = lap, time.perf_counter()
+        stages["couple_trials"] += lap - start
+
+        final_script.get_datafile_columns(file_path, fs, couples)
+        stages["datafile_columns"] += time.perf_counter() - lap
+    return stages
+
+
+def measure_process_data(dtfname: str, corpus_dir: str, workers: int) -> tuple:
+    """
+    Runs process_data on a corpus and measures it, meant to run in a fresh process.
+
+    Args:
+        dtfname (str): Name of the output data file.
+        corpus_dir (str): Directory of the corpus.
+        workers (int): Number of worker processes given to process_data.
+
+    Returns:
+        tuple: The number of failures, the time (in seconds) and the peak RSS (in MB) of the process.
+    """
+    start = time.perf_counter()
+    failures = final_script.process_data(dtfname, corpus_dir, workers=workers)
+    return len(failures), time.perf_counter() - start, peak_rss_mb()
+
+
+def run_benchmark(corpus_dir: str, workers: int = 1) -> dict:
+    """
+    Benchmarks the pipeline on a corpus: each stage alone, then process_data end to end.
+
+    process_data rewrites the TextGrids, so the benchmark runs on a temporary copy of the
+    corpus, which is left untouched. The stages are timed first, then process_data runs in
+    a freshly spawned interpreter, so that the peak RSS is the one of the pipeline (and of
+    its workers), not the one of the corpus generation or of the stage timings.
+
+    Args:
+        corpus_dir (str): Directory of the corpus, with the Sxx-GRP/Condition/Sxx_NNNN-BaT layout.
+        workers (int): Number of worker processes given to process_data.
+
+    Returns:
+        dict: The timings (in seconds) and the throughput metrics.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = shutil.copytree(corpus_dir, os.path.join(tmp, "corpus"))
+        file_paths = sorted(glob.glob(corpus_dir + "/**/*.wav", recursive=True))
+        stages = time_stages(file_paths)
+
+        dtfname = os.path.join(tmp, "benchmark_datafile.txt")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            failures, total, rss = pool.submit(measure_process_data, dtfname, corpus_dir, workers).result()
+        n_beats = len(final_script.load_datafile(dtfname))  # Coupled beats
+
+    return {"files": len(file_paths), "failures": failures, "workers": workers,
+            "stages_s": stages, "process_data_s": total,
+            "files_per_s": len(file_paths) / total, "beats_per_s": n_beats / total,
+            "peak_rss_mb": rss}
+
+
+def compare_with_baseline(results: dict, baseline: dict) -> list:
+    """
+    Compares the throughput metrics of a run with a stored baseline.
+
+    Args:
+        results (dict): The results of run_benchmark.
+        baseline (dict): The stored baseline, same keys.
+
+    Returns:
+        list: One (metric, baseline value, value, relative change, regression) row per metric.
+    """
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = baseline.get(metric), results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regression = change < -TOLERANCE if higher_is_better else change > TOLERANCE
+        rows.append((metric, old, new, change, regression))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the TP2 pipeline on a synthetic corpus.")
+    parser.add_argument("--corpus", help="existing corpus directory (a synthetic one is generated otherwise)")
+    parser.add_argument("--subjects", type=int, default=4, help="number of synthetic subjects")
+    parser.add_argument("--files", type=int, default=3, help="recordings per subject and condition")
+    parser.add_argument("--trains", type=int, default=4, help="trains per recording")
+    parser.add_argument("--train-length", type=int, default=8, help="beats per train")
+    parser.add_argument("--fs", type=int, default=20000, help="sampling rate of the synthetic corpus")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of process_data")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(tmp, "corpus")
+            generate_corpus(corpus, args.subjects, args.files, args.trains, args.train_length, args.fs)
+        results = run_benchmark(corpus, args.workers)
+    results["corpus"] = {"path": args.corpus, "subjects": args.subjects, "files": args.files,
+                         "trains": args.trains, "train_length": args.train_length, "fs": args.fs}
+
+    print("\nStage times (s):")
+    for stage, seconds in results["stages_s"].items():
+        print(f"  {stage:<18}{seconds:10.3f}")
+    print(f"  {'process_data':<18}{results['process_data_s']:10.3f}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline stored in {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("corpus") != results["corpus"] or baseline.get("workers") != results["workers"]:
+        print("\n[WARNING] the baseline was measured on another corpus or number of workers")
+
+    print(f"\n{'Metric':<14}{'Baseline':>12}{'Run':>12}{'Change':>10}")
+    regressions = 0
+    for metric, old, new, change, regression in compare_with_baseline(results, baseline):
+        print(f"{metric:<14}{old:12.2f}{new:12.2f}{change:+10.1%}{'  REGRESSION' if regression else ''}")
+        regressions += regression
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
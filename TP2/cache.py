@@ -0,0 +1,139 @@
+import io
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+from detection import BEATS_PEAKS, TAPS_PEAKS
+from coupling import EARLY_WINDOW
+
+# Bump when the stored results or the way they are computed change
+CACHE_VERSION = 2
+
+# Number of bytes hashed at once
+HASH_BLOCK = 1 << 20
+
+
+def get_settings_key() -> str:
+    """
+    Builds the key of the settings the cached results depend on.
+
+    Returns:
+        str: A hash of the cache version and the detection and coupling settings.
+    """
+    settings = {"version": CACHE_VERSION, "beats": BEATS_PEAKS, "taps": TAPS_PEAKS,
+                "early_window": EARLY_WINDOW}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def get_file_state(fpath: str, known: tuple = None) -> tuple:
+    """
+    Gets the size, modification time and content hash of a file.
+
+    The file is only hashed again when its size or modification time differ from the
+    known state, as make or git would do.
+
+    Args:
+        fpath (str): The file path.
+        known (tuple): A previous (size, mtime, hash) state of the file, if any.
+
+    Returns:
+        tuple: The (size, mtime in ns, sha256 hex digest) state of the file.
+    """
+    stat = os.stat(fpath)
+    if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+        return known
+    sha = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            sha.update(block)
+    return (stat.st_size, stat.st_mtime_ns, sha.hexdigest())
+
+
+def _to_blob(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+class ResultCache:
+    """
+    SQLite store of the results of process_file, one row per recording.
+
+    A stored result is reused while the recording and its TextGrid keep the content they
+    had right after the file was processed (the TextGrid is rewritten by the processing)
+    and the settings are unchanged.
+    """
+
+    def __init__(self, fname: str):
+        """
+        Opens or creates the cache database.
+
+        Args:
+            fname (str): Name of the database file.
+        """
+        self.db = sqlite3.connect(fname)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+                               path TEXT PRIMARY KEY, settings TEXT,
+                               wav_size INTEGER, wav_mtime INTEGER, wav_hash TEXT,
+                               tg_size INTEGER, tg_mtime INTEGER, tg_hash TEXT,
+                               fs INTEGER, beats BLOB, taps BLOB, couples BLOB, n_trials INTEGER)""")
+        # Databases of version 1 have no trial count, their rows are invalidated by the settings key
+        if "n_trials" not in [column[1] for column in self.db.execute("PRAGMA table_info(results)")]:
+            self.db.execute("ALTER TABLE results ADD COLUMN n_trials INTEGER")
+        self.settings = get_settings_key()
+        self.states = {}  # States of the recordings checked by lookup
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def lookup(self, file_path: str):
+        """
+        Gets the cached result of a recording if it is still valid.
+
+        Args:
+            file_path (str): The file path of the .wav file.
+
+        Returns:
+            tuple: The (fs, beats, taps, couples, n_trials) result as returned by process_file, or None.
+        """
+        row = self.db.execute("SELECT settings, wav_size, wav_mtime, wav_hash, tg_size, tg_mtime, tg_hash, "
+                              "fs, beats, taps, couples, n_trials FROM results WHERE path = ?",
+                              (self._key(file_path),)).fetchone()
+        known = None if row is None else row[1:4]
+        self.states[file_path] = wav_state = get_file_state(file_path, known)
+        if row is None or row[0] != self.settings or wav_state[2] != row[3]:
+            return None
+
+        tg_path = os.path.splitext(file_path)[0] + ".TextGrid"
+        if not os.path.exists(tg_path) or get_file_state(tg_path, row[4:7])[2] != row[6]:
+            return None
+        return (row[7], _from_blob(row[8]), _from_blob(row[9]), _from_blob(row[10]), row[11])
+
+    def store(self, file_path: str, result: tuple) -> None:
+        """
+        Stores the result of a recording, once its TextGrid has been saved.
+
+        Args:
+            file_path (str): The file path of the .wav file.
+            result (tuple): The (fs, beats, taps, couples, n_trials) result returned by process_file.
+        """
+        wav_state = self.states.pop(file_path, None) or get_file_state(file_path)
+        tg_state = get_file_state(os.path.splitext(file_path)[0] + ".TextGrid")
+        fs, beats, taps, couples, n_trials = result
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (self._key(file_path), self.settings, *wav_state, *tg_state,
+                             int(fs), _to_blob(beats), _to_blob(taps), _to_blob(couples), int(n_trials)))
+
+    def close(self) -> None:
+        """
+        Closes the cache database.
+        """
+        self.db.close()
@@ -0,0 +1,162 @@
+import os
+import sys
+import argparse
+
+# The commands import the pipeline when they run, so that a batch job only loads what its
+# command needs: numpy and scipy to process, praatio to read the TextGrids, matplotlib to
+# draw, pandas for the tables. Keep the imports of this module to the standard library.
+
+# Import time budget of the modules a batch job starts with (in seconds), checked by the
+# imports command. Measured at about 0.02 s for this module and 1.2 s for final_script
+# (most of it scipy.signal) on one core, down from 2 s with the modules below.
+IMPORT_BUDGET = {"cli": 0.05,
+                 "final_script": 1.5}
+
+# Modules that must not be loaded by importing the modules of IMPORT_BUDGET
+HEAVY_MODULES = ("matplotlib", "pandas", "praatio")
+
+# Number of fresh interpreters the import time of a module is measured in, the median is kept
+IMPORT_RUNS = 5
+
+
+def measure_import(module: str, runs: int = IMPORT_RUNS) -> tuple:
+    """
+    Measures the import time of a module of this folder in fresh interpreters, with
+    python -X importtime.
+
+    Args:
+        module (str): Name of the module.
+        runs (int): Number of interpreters, the median time is kept.
+
+    Returns:
+        tuple: The import time (in seconds) and the HEAVY_MODULES it loaded.
+    """
+    import subprocess
+
+    code = (f"import sys, {module}; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    times = []
+    for _ in range(runs):
+        run = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        # Lines of -X importtime: "import time: self [us] | cumulative | module", the module itself last
+        line = [line for line in run.stderr.splitlines() if line.split("|")[-1].strip() == module][-1]
+        times.append(int(line.split("|")[1]) / 1e6)
+    return sorted(times)[len(times) // 2], run.stdout.split()
+
+
+def selection(args) -> dict:
+    """
+    Builds the query of the recordings to process from the options of the process command.
+
+    Returns:
+        dict: The query (see final_script.list_recordings), None to process every recording.
+    """
+    select = {name: getattr(args, name) for name in ("groups", "conditions", "subjects", "files")
+              if getattr(args, name) is not None}
+    return select or None
+
+
+def process(args) -> int:
+    """
+    Runs final_script.process_data, 1 if a file could not be processed.
+    """
+    import final_script
+
+    failures = final_script.process_data(args.output, args.data_dir, workers=args.workers, cache=args.cache,
+                                         streaming=args.streaming, profile=args.profile,
+                                         multirate=args.multirate, manifest=args.manifest,
+                                         select=selection(args), synchrony=args.synchrony)
+    return 1 if failures else 0
+
+
+def export(args) -> int:
+    """
+    Runs final_script.export_figures, 1 if a figure could not be saved.
+    """
+    import final_script
+
+    failures = final_script.export_figures(args.data_dir, args.out_dir, workers=args.workers, dpi=args.dpi)
+    return 1 if failures else 0
+
+
+def plot(args) -> int:
+    """
+    Shows the beats and taps of a recording with pyplot, or saves them without it.
+    """
+    import final_script
+    from wav_io import open_wav, read_window
+
+    if args.output is not None:
+        final_script.export_figure(args.recording, args.output, dpi=args.dpi)
+        return 0
+    layout, frames = open_wav(args.recording)
+    if frames is None:
+        frames = read_window(args.recording, layout, 0, layout.n_frames)
+    final_script.plot_taps_with_beats(frames[:, 0], frames[:, 1], layout.fs, start=args.start,
+                                      duration=args.duration, xsamples=args.xsamples)
+    return 0
+
+
+def imports(args) -> int:
+    """
+    Prints the import time of the modules of IMPORT_BUDGET, 1 if one is over its budget
+    or loads one of the HEAVY_MODULES.
+    """
+    over = 0
+    print(f"{'Module':<16}{'Time (s)':>10}{'Budget (s)':>12}  Heavy modules")
+    for module, budget in IMPORT_BUDGET.items():
+        seconds, heavy = measure_import(module, args.runs)
+        failed = seconds > budget or bool(heavy)
+        print(f"{module:<16}{seconds:10.3f}{budget:12.3f}  {' '.join(heavy) or '-'}{'  OVER' if failed else ''}")
+        over += failed
+    return 1 if over else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the TP2 pipeline from the command line.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_process = commands.add_parser("process", help="detect and couple the peaks, write the data file")
+    parser_process.add_argument("--output", nargs="+", default=["datafile.txt"],
+                                help="data files, in the formats of their extensions")
+    parser_process.add_argument("--data-dir", default=".", help="directory of the recordings")
+    parser_process.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser_process.add_argument("--cache", help="cache database of the results of every file")
+    parser_process.add_argument("--streaming", action="store_true", help="detect the peaks block by block")
+    parser_process.add_argument("--multirate", action="store_true", help="detect the peaks from a decimated envelope")
+    parser_process.add_argument("--profile", help="report of the stages of every file (.csv or .json)")
+    parser_process.add_argument("--manifest", help="manifest database indexing the recordings")
+    parser_process.add_argument("--synchrony", help="table of the synchrony of every trial")
+    parser_process.add_argument("--groups", nargs="+", help="only the recordings of these groups")
+    parser_process.add_argument("--conditions", nargs="+", help="only the recordings of these conditions")
+    parser_process.add_argument("--subjects", nargs="+", type=int, help="only the recordings of these subjects")
+    parser_process.add_argument("--files", nargs="+", type=int, help="only the recordings with these file numbers")
+    parser_process.set_defaults(run=process)
+
+    parser_export = commands.add_parser("export", help="save the figure of every recording")
+    parser_export.add_argument("--data-dir", default=".", help="directory of the recordings")
+    parser_export.add_argument("--out-dir", default="figures", help="directory of the images")
+    parser_export.add_argument("--workers", type=int, help="worker processes, one per processor by default")
+    parser_export.add_argument("--dpi", type=int, default=300, help="resolution of the images")
+    parser_export.set_defaults(run=export)
+
+    parser_plot = commands.add_parser("plot", help="plot the beats and taps of a recording")
+    parser_plot.add_argument("recording", help=".wav file of the recording")
+    parser_plot.add_argument("--start", type=float, default=0.0, help="start of the plot (in seconds)")
+    parser_plot.add_argument("--duration", type=float, help="duration of the plot (in seconds)")
+    parser_plot.add_argument("--xsamples", action="store_true", help="time axis in samples")
+    parser_plot.add_argument("--output", help="image file to save the whole recording to instead of showing it")
+    parser_plot.add_argument("--dpi", type=int, default=300, help="resolution of the image")
+    parser_plot.set_defaults(run=plot)
+
+    parser_imports = commands.add_parser("imports", help="check the import times against IMPORT_BUDGET")
+    parser_imports.add_argument("--runs", type=int, default=IMPORT_RUNS, help="interpreters per module")
+    parser_imports.set_defaults(run=imports)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import numpy as np
+
+# Fraction of the inter-beat interval, before the next beat, in which a tap is
+# considered as anticipating the next beat rather than answering the current one
+EARLY_WINDOW = 25
+
+
+def couple_peaks(b, t, cond) -> tuple:
+    """
+    Couples each beat with at most one tap, with the same rules as get_couples.
+
+    The beats and taps must be sorted and without duplicates, as returned by find_peaks.
+    Every beat is located among the taps with a sorted search instead of scanning the
+    taps list, so a train costs O((n + m) log m) for n beats and m taps. The train is
+    coupled by couple_trains, which holds the rules.
+
+    With cond == 1 a beat is coupled with its last tap before the early window of the
+    next beat, and the last beat with the last tap after it (get_couples raises a
+    TypeError on the last beat in that case).
+
+    Otherwise a beat gets the first free tap after the previous beat when one or two
+    taps fall before the early window of the next beat, and that tap is used up. With
+    more than two taps, the beat gets the first tap after that early window (the last
+    tap if there is none) and no tap is used up. The last beat considers all the taps
+    that are still free.
+
+    Args:
+        b (np.ndarray): Sample indices of the beats.
+        t (np.ndarray): Sample indices of the taps.
+        cond: The condition of the trial.
+
+    Returns:
+        tuple: The indices of the coupled beats and the sample indices of their taps.
+    """
+    return couple_trains(b, [len(b)], t, [len(t)], cond)
+
+
+# One beat coupled with a tap: its trial, its index in the trial and both sample indices
+COUPLE_DTYPE = np.dtype([("trial", np.int32),
+                         ("beat", np.int32),
+                         ("beat_sample", np.int64),
+                         ("tap_sample", np.int64)])
+
+
+def couple_trains(beats: np.ndarray, beat_counts, taps: np.ndarray, tap_counts, cond) -> tuple:
+    """
+    Couples the beats and taps of many trains at once, each with the rules of couple_peaks.
+
+    The trains are laid one after the other on a single increasing axis, so every sorted
+    search runs once for all of them. The used-up tap carried from one beat
+    to the next is restarted at the first beat of every train, and the last beat of every
+    train is coupled with the taps still free in its own train.
+
+    Args:
+        beats (np.ndarray): Sample indices of the beats of every train, one train after the other.
+        beat_counts: Number of beats of each train.
+        taps (np.ndarray): Sample indices of the taps of every train, one train after the other.
+        tap_counts: Number of taps of each train.
+        cond: The condition of the trains.
+
+    Returns:
+        tuple: The indices (in beats) of the coupled beats and the sample indices of their taps.
+    """
+    beats, taps = np.asarray(beats, dtype=np.int64), np.asarray(taps, dtype=np.int64)
+    beat_counts, tap_counts = np.asarray(beat_counts, dtype=np.int64), np.asarray(tap_counts, dtype=np.int64)
+
+    # Trains without beats or taps have no couples
+    kept = (beat_counts > 0) & (tap_counts > 0)
+    kept_beats = np.repeat(kept, beat_counts)
+    beat_index = np.flatnonzero(kept_beats)
+    beats, taps = beats[beat_index], taps[np.repeat(kept, tap_counts)]
+    beat_counts, tap_counts = beat_counts[kept], tap_counts[kept]
+    if len(beats) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+
+    # Shift every train past the previous ones
+    beat_start = np.cumsum(beat_counts) - beat_counts
+    tap_start = np.cumsum(tap_counts) - tap_counts
+    tap_end = tap_start + tap_counts
+    low = np.minimum(beats[beat_start], taps[tap_start])
+    high = np.maximum(beats[beat_start + beat_counts - 1], taps[tap_end - 1])
+    base = np.cumsum(high - low + 1) - (high - low + 1)
+    beat_train = np.repeat(np.arange(len(beat_counts)), beat_counts)
+    b = beats - np.repeat(low - base, beat_counts)
+    t = taps - np.repeat(low - base, tap_counts)
+
+    # Beats followed by another beat of their train, and the start of the early window of that beat
+    last = beat_start + beat_counts - 1
+    followed = np.ones(len(b), dtype=bool)
+    followed[last] = False
+    current = np.flatnonzero(followed)
+    next_beats = b[current + 1]
+    thresholds = next_beats - ((next_beats - b[current]) * EARLY_WINDOW / 100)
+    after_window = np.searchsorted(t, thresholds, side='right')  # First tap after the window
+    train = beat_train[current]
+
+    couples = np.full(len(b), -1, dtype=np.intp)
+    if cond == 1:
+        # Last tap between the beat and the early window of the next beat, or the end of the train
+        first_after_beat = np.searchsorted(t, b, side='left')
+        last_in_window = np.empty(len(b), dtype=np.int64)
+        last_in_window[current] = after_window - 1
+        last_in_window[last] = tap_end - 1
+        has_tap = last_in_window >= first_after_beat
+        couples[has_tap] = last_in_window[has_tap]
+    else:
+        # First tap after the previous beat, after 0 for the first beat of a train
+        is_first = np.zeros(len(b), dtype=bool)
+        is_first[beat_start] = True
+        previous = np.where(is_first[current], base[train] + np.maximum(-low[train], 0), b[current - 1])
+        first_after_prev = np.searchsorted(t, previous, side='left')
+        in_window = after_window - first_after_prev
+
+        # A tap used up by beat k can only be the first tap considered by beat k + 1: it is
+        # then counted in its window and beat k + 1 starts one tap later. Whether that happens
+        # follows used[k+1] = used_if_free[k] ^ (depends[k] & used[k]), a xor prefix sum
+        # restarted wherever depends is False, and at the first beat of every train.
+        same_train = train[:-1] == train[1:]
+        same_start = first_after_prev[:-1] == first_after_prev[1:]
+        next_start = first_after_prev[:-1] + 1 == first_after_prev[1:]
+        used_if_free = ((in_window[:-1] == 1) | (in_window[:-1] == 2)) & same_start & same_train
+        used_if_shifted = ((in_window[:-1] == 2) | (in_window[:-1] == 3)) & next_start
+        depends = (used_if_free != used_if_shifted) & same_train
+
+        n = len(current)
+        steps = np.arange(n - 1)
+        restart = np.maximum.accumulate(np.where(depends, 0, steps)) if n > 1 else steps
+        flips = np.concatenate(([0], np.cumsum(used_if_free)))
+        shifted = np.zeros(n, dtype=bool)
+        shifted[1:] = (flips[steps + 1] - flips[restart]) % 2 == 1
+
+        count = in_window - shifted
+        start = first_after_prev + shifted
+        takes_first = (count == 1) | (count == 2)
+        too_many = count > 2
+        couples[current[takes_first]] = start[takes_first]
+        end = tap_end[train[too_many]]
+        couples[current[too_many]] = np.where(after_window[too_many] < end, after_window[too_many], end - 1)
+
+        # The last beat of a train considers every tap still free in the train
+        free = np.ones(len(t), dtype=bool)
+        free[start[takes_first]] = False
+        free_taps = np.flatnonzero(free)
+        lo, hi = np.searchsorted(free_taps, tap_start), np.searchsorted(free_taps, tap_end)
+        has_free = hi > lo
+        lo, hi = lo[has_free], hi[has_free]
+        couples[last[has_free]] = np.where(hi - lo > 2, free_taps[hi - 1], free_taps[lo])
+
+    coupled = np.flatnonzero(couples >= 0)
+    return beat_index[coupled], taps[couples[coupled]]
+
+
+def couple_trials(beats_per_trial: list, taps_per_trial: list, cond) -> np.ndarray:
+    """
+    Couples the beats and taps of every trial of a recording.
+
+    Args:
+        beats_per_trial (list): One array of beat sample indices per trial.
+        taps_per_trial (list): One array of tap sample indices per trial.
+        cond: The condition of the recording.
+
+    Returns:
+        np.ndarray: The COUPLE_DTYPE array of couples, ordered by trial then beat.
+    """
+    beat_counts = np.array([len(beats) for beats in beats_per_trial], dtype=np.int64)
+    tap_counts = np.array([len(taps) for taps in taps_per_trial], dtype=np.int64)
+    beats = np.concatenate([np.asarray(b, dtype=np.int64) for b in beats_per_trial] or [np.empty(0, dtype=np.int64)])
+    taps = np.concatenate([np.asarray(t, dtype=np.int64) for t in taps_per_trial] or [np.empty(0, dtype=np.int64)])
+    beat_index, tap_samples = couple_trains(beats, beat_counts, taps, tap_counts, cond)
+
+    trial = np.repeat(np.arange(len(beat_counts)), beat_counts)[beat_index]
+    couples = np.empty(len(beat_index), dtype=COUPLE_DTYPE)
+    couples["trial"] = trial
+    couples["beat"] = beat_index - (np.cumsum(beat_counts) - beat_counts)[trial]
+    couples["beat_sample"] = beats[beat_index]
+    couples["tap_sample"] = tap_samples
+    return couples
@@ -0,0 +1,543 @@
+import math
+import warnings
+import numpy as np
+
+from scipy.signal import find_peaks, peak_prominences
+from wav_io import BLOCK_FRAMES, open_wav, read_layout, read_window, channel_max
+from profiling import NULL_TIMER
+
+# Peak detection settings, distances are in seconds
+BEATS_PEAKS = {"height": 0.1, "distance": 0.3}
+TAPS_PEAKS = {"height": 0.05, "distance": 0.1, "prominence": 0.1}
+
+# Samples per bin of the coarse envelope of detect_peaks_multirate (625 Hz at 20 kHz)
+DECIMATION = 32
+
+# Above this fraction of bins reaching the peak height, a trial is searched at once rather than run by run
+DENSE_FRACTION = 0.25
+
+# One trial: its interval in the main tier (in seconds)
+TRIAL_DTYPE = np.dtype([("xmin", np.float64),
+                        ("xmax", np.float64)])
+
+# One detected peak: the trial it belongs to and its sample index in the recording
+PEAK_DTYPE = np.dtype([("trial", np.int32),
+                       ("sample", np.int64)])
+
+
+def get_trial_bounds(trials: np.ndarray, fs: int) -> tuple:
+    """
+    Converts the trial boundaries of the main tier to sample indices.
+
+    Args:
+        trials (np.ndarray): The TRIAL_DTYPE array of the trials.
+        fs (int): The sampling rate.
+
+    Returns:
+        tuple: Two arrays with the first and past-the-end sample of each trial (truncated as int() does).
+    """
+    return (trials["xmin"] * fs).astype(np.int64), (trials["xmax"] * fs).astype(np.int64)
+
+
+def find_signal_peaks(signal, fs: int, settings: dict) -> np.ndarray:
+    """
+    Finds the peaks of a normalized signal with the given settings.
+
+    Args:
+        signal (np.ndarray): The normalized signal.
+        fs (int): The sampling rate.
+        settings (dict): Peak settings (height, distance in seconds, optional prominence).
+
+    Returns:
+        np.ndarray: The sample indices of the peaks in the signal.
+    """
+    return find_peaks(signal,
+                      height=settings["height"],
+                      distance=settings["distance"] * fs,
+                      prominence=settings.get("prominence"))[0]
+
+
+def to_peak_array(peaks_per_trial: list) -> np.ndarray:
+    """
+    Packs the peaks of every trial into one PEAK_DTYPE array, ordered by trial then sample.
+
+    Args:
+        peaks_per_trial (list): One array of sample indices per trial.
+
+    Returns:
+        np.ndarray: The structured array of peaks.
+    """
+    peaks = np.empty(sum(len(p) for p in peaks_per_trial), dtype=PEAK_DTYPE)
+    peaks["trial"] = np.repeat(np.arange(len(peaks_per_trial)), [len(p) for p in peaks_per_trial])
+    peaks["sample"] = np.concatenate(peaks_per_trial) if peaks_per_trial else []
+    return peaks
+
+
+def split_trials(peaks: np.ndarray, n_trials: int) -> list:
+    """
+    Splits a PEAK_DTYPE array into the sample indices of each trial.
+
+    Args:
+        peaks (np.ndarray): The structured array of peaks, ordered by trial.
+        n_trials (int): Number of trials of the recording.
+
+    Returns:
+        list: One array of sample indices per trial (views on the peaks array).
+    """
+    edges = np.searchsorted(peaks["trial"], np.arange(n_trials + 1))
+    return [peaks["sample"][edges[t]:edges[t + 1]] for t in range(n_trials)]
+
+
+def detect_peaks(file_path: str, trials: np.ndarray, timer=NULL_TIMER) -> tuple:
+    """
+    Finds the beats and taps of every trial of a recording.
+
+    Both channels are normalized by their maximum over the whole recording, computed
+    once, and each trial window is divided into a buffer reused across trials. The
+    peaks are searched window by window because find_peaks breaks ties between equal
+    peaks depending on the whole array it is given, so a single search over
+    concatenated windows would not always keep the same peaks.
+
+    Args:
+        file_path (str): The file path of the .wav file (beats on channel 0, taps on channel 1).
+        trials (np.ndarray): The TRIAL_DTYPE array of the trials.
+        timer (profiling.StageTimer): Records the wav_decode and find_peaks stages and the bytes read.
+
+    Returns:
+        tuple: The sampling rate, then the beats and taps as PEAK_DTYPE arrays.
+    """
+    with timer.stage("wav_decode"):
+        layout, frames = open_wav(file_path)
+        scale = channel_max(file_path, layout, frames)[:2, np.newaxis]  # Beats then taps channel
+    timer.count("bytes_read", layout.n_frames * layout.channels * layout.sampwidth)
+    fs = layout.fs
+    starts, stops = get_trial_bounds(trials, fs)
+
+    # Channel-major buffer so that each normalized channel is contiguous for find_peaks
+    longest = int(np.max(np.minimum(stops, layout.n_frames) - starts, initial=0))
+    norm_dtype = np.true_divide(np.zeros(1, dtype=layout.dtype or np.int32), scale).dtype
+    buffer = np.empty((2, longest), dtype=norm_dtype)
+
+    beats, taps = [], []
+    for start, stop in zip(starts, stops):
+        with timer.stage("wav_decode"):
+            window = read_window(file_path, layout, start, stop, frames)
+            norm = np.true_divide(window[:, :2].T, scale, out=buffer[:, :len(window)])
+        timer.count("bytes_read", window.nbytes)
+        with timer.stage("find_peaks"):
+            beats.append(find_signal_peaks(norm[0], fs, BEATS_PEAKS) + start)
+            taps.append(find_signal_peaks(norm[1], fs, TAPS_PEAKS) + start)
+
+    return fs, to_peak_array(beats), to_peak_array(taps)
+
+
+class _ChannelReader:
+    """
+    Reads normalized windows of one channel, the same way detect_peaks normalizes them.
+    """
+
+    def __init__(self, file_path: str, layout, frames, channel: int, scale, timer=NULL_TIMER):
+        self.file_path = file_path
+        self.layout = layout
+        self.frames = frames
+        self.channel = channel
+        self.scale = scale
+        self.timer = timer
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        with self.timer.stage("wav_decode"):
+            window = read_window(self.file_path, self.layout, start, stop, self.frames)
+            x = np.true_divide(window[:, self.channel], self.scale)
+        self.timer.count("bytes_read", len(window) * self.layout.channels * self.layout.sampwidth)
+        return x
+
+
+def _edge_run(x: np.ndarray, height: float, from_end: bool) -> int:
+    """
+    Length of the run of equal samples at one end of a segment, 0 if below the peak height.
+
+    Such a run may be part of a plateau whose peak can only be located with more samples.
+    """
+    edge = x[-1] if from_end else x[0]
+    if edge < height:
+        return 0
+    differs = np.flatnonzero((x[::-1] if from_end else x) != edge)
+    return differs[0] if len(differs) else len(x)
+
+
+def _block_candidates(reader: _ChannelReader, height: float, w0: int, w1: int,
+                      core_start: int, core_stop: int) -> tuple:
+    """
+    Finds the local maxima above height of a window that lie in [core_start, core_stop).
+
+    The block is read with a margin on each side, grown until no plateau cut by the
+    margin reaches the block.
+
+    Returns:
+        tuple: The sample indices and the heights of the maxima.
+    """
+    left = right = 2
+    while True:
+        s0, s1 = max(w0, core_start - left), min(w1, core_stop + right)
+        x = reader.read(s0, s1)
+        left_bad = s0 + _edge_run(x, height, False) if s0 > w0 else w0
+        right_bad = s1 - _edge_run(x, height, True) if s1 < w1 else w1
+        if left_bad <= core_start and right_bad >= core_stop:
+            break
+        left, right = left * 2 if left_bad > core_start else left, right * 2 if right_bad < core_stop else right
+
+    peaks = find_peaks(x, height=height)[0]
+    peaks = peaks[(peaks + s0 >= core_start) & (peaks + s0 < core_stop)]
+    return peaks + s0, x[peaks]
+
+
+def _select_by_distance(peaks: np.ndarray, heights: np.ndarray, distance: float) -> np.ndarray:
+    """
+    Keeps the highest peaks at least distance apart, exactly as find_peaks does.
+
+    The peaks are visited in the order of np.argsort on their heights, as in find_peaks,
+    so that equal peaks are settled the same way for the same trial.
+    """
+    gap = math.ceil(distance)
+    keep = np.ones(len(peaks), dtype=bool)
+    for j in np.argsort(heights)[::-1]:
+        if not keep[j]:
+            continue
+        lo = np.searchsorted(peaks, peaks[j] - gap, side='right')
+        hi = np.searchsorted(peaks, peaks[j] + gap, side='left')
+        keep[lo:hi] = False
+        keep[j] = True
+    return keep
+
+
+def _scan_base(reader: _ChannelReader, pos: int, bound: int, height: float,
+               block_frames: int, backward: bool) -> float:
+    """
+    Minimum of the signal from pos towards bound, up to the first sample above height.
+
+    This is the part of a prominence base search that lies outside the block being
+    read, scanned one block at a time.
+    """
+    minimum = np.inf
+    while pos != bound:
+        start, stop = (max(bound, pos - block_frames), pos) if backward else (pos, min(bound, pos + block_frames))
+        x = reader.read(start, stop)
+        higher = np.flatnonzero(x > height)
+        if len(higher):
+            scanned = x[higher[-1] + 1:] if backward else x[:higher[0]]
+            return min(minimum, scanned.min()) if len(scanned) else minimum
+        minimum = min(minimum, x.min())
+        pos = start if backward else stop
+    return minimum
+
+
+def _select_by_prominence(reader: _ChannelReader, peaks: np.ndarray, prominence: float,
+                          w0: int, w1: int, block_frames: int) -> np.ndarray:
+    """
+    Keeps the peaks whose prominence over the window [w0, w1) reaches the threshold.
+
+    The prominences are first computed on the block of each peak. A base search cut by
+    the block can only underestimate the prominence, so only the peaks below the
+    threshold are searched further, outside their block.
+    """
+    keep = np.zeros(len(peaks), dtype=bool)
+    starts = np.arange(w0, w1, block_frames)
+    edges = np.searchsorted(peaks, np.append(starts, w1))
+    for start, b0, b1 in zip(starts, edges[:-1], edges[1:]):
+        if b0 == b1:
+            continue
+        stop = min(start + block_frames, w1)
+        x = reader.read(start, stop)
+        block_peaks = peaks[b0:b1] - start
+        with warnings.catch_warnings():
+            # Peaks at the edge of the block get a null prominence (PeakPropertyWarning) until searched further
+            warnings.simplefilter("ignore", RuntimeWarning)
+            prominences, left_bases, right_bases = peak_prominences(x, block_peaks)
+        for k, p in enumerate(block_peaks):
+            if prominences[k] < prominence:
+                left_min, right_min = x[left_bases[k]], x[right_bases[k]]
+                if start > w0 and not (x[:p] > x[p]).any():
+                    left_min = min(left_min, _scan_base(reader, start, w0, x[p], block_frames, True))
+                if stop < w1 and not (x[p + 1:] > x[p]).any():
+                    right_min = min(right_min, _scan_base(reader, stop, w1, x[p], block_frames, False))
+                prominences[k] = x[p] - max(left_min, right_min)
+        keep[b0:b1] = prominences >= prominence
+    return keep
+
+
+def _stream_channel(reader: _ChannelReader, fs: int, settings: dict, w0: int, w1: int,
+                    block_frames: int) -> np.ndarray:
+    """
+    Finds the peaks of one channel over the window [w0, w1), as find_signal_peaks would.
+    """
+    blocks = [_block_candidates(reader, settings["height"], w0, w1, start, min(start + block_frames, w1))
+              for start in range(w0, w1, block_frames)]
+    peaks = np.concatenate([b[0] for b in blocks]) if blocks else np.empty(0, dtype=np.int64)
+    heights = np.concatenate([b[1] for b in blocks]) if blocks else np.empty(0)
+
+    peaks = peaks[_select_by_distance(peaks, heights, settings["distance"] * fs)]
+    if settings.get("prominence") is not None:
+        peaks = peaks[_select_by_prominence(reader, peaks, settings["prominence"], w0, w1, block_frames)]
+    return peaks
+
+
+def stream_peaks(file_path: str, trials: np.ndarray, block_frames: int = BLOCK_FRAMES, timer=NULL_TIMER):
+    """
+    Finds the beats and taps of a recording trial by trial, reading it one block at a time.
+
+    Gives the same peaks as detect_peaks, but only a block of samples (and the margins
+    needed to locate the peaks at its edges) is held in memory, whatever the length of
+    the recording. The candidate peaks of a trial are gathered block by block before
+    the distance setting is applied to all of them at once, as find_peaks does, because
+    find_peaks settles equal peaks through a sort that depends on every candidate.
+
+    Args:
+        file_path (str): The file path of the .wav file (beats on channel 0, taps on channel 1).
+        trials (np.ndarray): The TRIAL_DTYPE array of the trials.
+        block_frames (int): Number of frames read at once.
+        timer (profiling.StageTimer): Records the wav_decode and find_peaks stages and the bytes read.
+
+    Yields:
+        tuple: The trial index, then the sample indices of its beats and taps.
+    """
+    with timer.stage("wav_decode"):
+        layout, frames = open_wav(file_path)
+        scale = channel_max(file_path, layout, frames, block_frames)
+    timer.count("bytes_read", layout.n_frames * layout.channels * layout.sampwidth)
+    fs = layout.fs
+    beats = _ChannelReader(file_path, layout, frames, 0, scale[0], timer)
+    taps = _ChannelReader(file_path, layout, frames, 1, scale[1], timer)
+
+    for t, (start, stop) in enumerate(zip(*get_trial_bounds(trials, fs))):
+        w0, w1, _ = slice(start, stop).indices(layout.n_frames)
+        # The blocks are read (wav_decode) within the search, their time is left out of find_peaks
+        with timer.stage("find_peaks"):
+            trial_beats = _stream_channel(beats, fs, BEATS_PEAKS, w0, w1, block_frames)
+            trial_taps = _stream_channel(taps, fs, TAPS_PEAKS, w0, w1, block_frames)
+        yield t, trial_beats, trial_taps
+
+
+def detect_peaks_streaming(file_path: str, trials: np.ndarray, block_frames: int = BLOCK_FRAMES,
+                           timer=NULL_TIMER) -> tuple:
+    """
+    Same as detect_peaks, with the peaks found by stream_peaks.
+
+    Args:
+        file_path (str): The file path of the .wav file (beats on channel 0, taps on channel 1).
+        trials (np.ndarray): The TRIAL_DTYPE array of the trials.
+        block_frames (int): Number of frames read at once.
+        timer (profiling.StageTimer): Records the wav_decode and find_peaks stages and the bytes read.
+
+    Returns:
+        tuple: The sampling rate, then the beats and taps as PEAK_DTYPE arrays.
+    """
+    beats, taps = [], []
+    for _, trial_beats, trial_taps in stream_peaks(file_path, trials, block_frames, timer):
+        beats.append(trial_beats)
+        taps.append(trial_taps)
+    return read_layout(file_path).fs, to_peak_array(beats), to_peak_array(taps)
+
+
+def _coarse_envelope(raw: np.ndarray, scale, factor: int, reduce) -> np.ndarray:
+    """
+    Reduces a channel window to one normalized value per bin of factor samples (the last bin may be shorter).
+
+    The normalization only rescales the samples, so the maximum (or minimum) of a bin is
+    the normalized sample that detect_peaks would see.
+    """
+    return np.true_divide(reduce.reduceat(raw, np.arange(0, len(raw), factor)), scale)
+
+
+def _active_candidates(read, active: np.ndarray, factor: int, n: int, height: float) -> tuple:
+    """
+    Finds the local maxima above height of a window, searching only the runs of active bins.
+
+    Every sample outside the active bins is below height, so each run is searched with one
+    sample of margin on each side, which is enough to settle the maxima and plateaus at
+    its edges. The candidates are the ones find_peaks would get on the whole window.
+
+    Returns:
+        tuple: The sample indices and the heights of the maxima.
+    """
+    edges = np.diff(np.concatenate(([0], active.view(np.int8), [0])))
+    peaks, heights = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+    for b0, b1 in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        start, stop = max(b0 * factor - 1, 0), min(b1 * factor + 1, n)
+        x = read(start, stop)
+        run_peaks = find_peaks(x, height=height)[0]
+        peaks.append(run_peaks + start)
+        heights.append(x[run_peaks])
+    return np.concatenate(peaks), np.concatenate(heights)
+
+
+def _sparse_table(values: np.ndarray, reduce) -> np.ndarray:
+    """
+    Table of reduce over values[i:i + 2**level] for every level and index i, for range queries.
+
+    The windows running past the end are reduced over the values they hold.
+    """
+    levels = max(len(values), 1).bit_length()
+    table = np.empty((levels, len(values)))
+    table[0] = values
+    for level in range(1, levels):
+        step = 1 << (level - 1)
+        table[level] = table[level - 1]
+        table[level, :-step] = reduce(table[level - 1, :-step], table[level - 1, step:])
+    return table
+
+
+def _range_reduce(table: np.ndarray, reduce, start: np.ndarray, stop: np.ndarray, fill: float) -> np.ndarray:
+    """
+    Reduces the values of a sparse table over [start, stop) for every pair of indices, fill if empty.
+    """
+    size = np.maximum(stop - start, 1)
+    level = np.floor(np.log2(size)).astype(np.intp)
+    last = len(table[0]) - 1
+    result = reduce(table[level, np.clip(start, 0, last)], table[level, np.clip(stop - (1 << level), 0, last)])
+    return np.where(stop > start, result, fill)
+
+
+def _higher_bin(max_table: np.ndarray, bins: np.ndarray, values: np.ndarray, backward: bool) -> np.ndarray:
+    """
+    Nearest bin before (or after) each bin whose maximum is above the value, -1 (or the
+    number of bins) if there is none.
+
+    The run of bins not above the value is grown by halving steps, from the largest
+    window of the sparse table down to one bin.
+    """
+    n_bins = max_table.shape[1]
+    pos = bins if backward else bins + 1
+    for level in range(len(max_table) - 1, -1, -1):
+        step = 1 << level
+        if backward:
+            ok = (pos - step >= 0) & (max_table[level, np.maximum(pos - step, 0)] <= values)
+            pos = np.where(ok, pos - step, pos)
+        else:
+            ok = (pos < n_bins) & (max_table[level, np.minimum(pos, n_bins - 1)] <= values)
+            pos = np.where(ok, np.minimum(pos + step, n_bins), pos)
+    return pos - 1 if backward else pos
+
+
+def _bin_samples(raw: np.ndarray, scale, bins: np.ndarray, factor: int) -> tuple:
+    """
+    Normalized samples of one bin per row, with their indices and whether they are in the window.
+    """
+    index = np.asarray(bins)[:, np.newaxis] * factor + np.arange(factor)
+    valid = (index >= 0) & (index < len(raw))
+    return np.true_divide(raw[np.clip(index, 0, len(raw) - 1)], scale), index, valid
+
+
+def _masked_min(x: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    return np.where(mask, x, np.inf).min(axis=1)
+
+
+def _envelope_prominences(raw: np.ndarray, scale, peaks: np.ndarray, env_max: np.ndarray,
+                          env_min: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Prominences of peaks over a whole channel window, as peak_prominences measures them.
+
+    The base on each side of a peak is the minimum of the signal up to the first higher
+    sample. It is searched in the bin of the peak, then the nearest bin whose maximum is
+    above the peak is found with a sparse table of the maximum envelope, the minimum
+    envelope gives the minimum of the bins in between, and only that bin is read at full
+    rate. Every peak is searched at once.
+    """
+    n_bins = len(env_max)
+    max_table = _sparse_table(env_max, np.maximum)
+    min_table = _sparse_table(env_min, np.minimum)
+    offsets = np.arange(factor)
+    bins = peaks // factor
+    values = np.true_divide(raw[peaks], scale)[:, np.newaxis]
+    x, index, valid = _bin_samples(raw, scale, bins, factor)
+
+    # Left base: samples of the bin after its last higher one before the peak
+    before = valid & (index < peaks[:, np.newaxis])
+    higher = before & (x > values)
+    last = np.where(higher.any(axis=1), factor - 1 - np.argmax(higher[:, ::-1], axis=1), -1)
+    left_min = _masked_min(x, before & (offsets > last[:, np.newaxis]))
+    j = _higher_bin(max_table, bins, values[:, 0], backward=True)
+    xj, _, valid_j = _bin_samples(raw, scale, j, factor)
+    higher = valid_j & (xj > values)
+    last_j = factor - 1 - np.argmax(higher[:, ::-1], axis=1)
+    outside = np.minimum(_range_reduce(min_table, np.minimum, j + 1, bins, np.inf),
+                         np.where(j >= 0, _masked_min(xj, valid_j & (offsets > last_j[:, np.newaxis])), np.inf))
+    left_min = np.where(last >= 0, left_min, np.minimum(left_min, outside))
+
+    # Right base: samples of the bin before its first higher one after the peak
+    after = valid & (index > peaks[:, np.newaxis])
+    higher = after & (x > values)
+    first = np.where(higher.any(axis=1), np.argmax(higher, axis=1), factor)
+    right_min = _masked_min(x, after & (offsets < first[:, np.newaxis]))
+    j = _higher_bin(max_table, bins, values[:, 0], backward=False)
+    xj, _, valid_j = _bin_samples(raw, scale, j, factor)
+    first_j = np.argmax(valid_j & (xj > values), axis=1)
+    outside = np.minimum(_range_reduce(min_table, np.minimum, bins + 1, j, np.inf),
+                         np.where(j < n_bins, _masked_min(xj, valid_j & (offsets < first_j[:, np.newaxis])), np.inf))
+    right_min = np.where(first < factor, right_min, np.minimum(right_min, outside))
+
+    values = values[:, 0]
+    return values - np.maximum(np.minimum(left_min, values), np.minimum(right_min, values))
+
+
+def _multirate_channel(raw: np.ndarray, scale, fs: int, settings: dict, factor: int) -> np.ndarray:
+    """
+    Finds the peaks of one channel window, as find_signal_peaks would on the normalized window.
+    """
+    raw = np.asarray(raw)  # Plain view of a memory-mapped window, faster to slice
+
+    def read(start, stop):
+        return np.true_divide(raw[start:stop], scale)
+
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.int64)
+    height, distance = settings["height"], settings["distance"] * fs
+    env_max = _coarse_envelope(raw, scale, factor, np.maximum)
+    active = env_max >= height
+    if active.mean() <= DENSE_FRACTION:
+        peaks, heights = _active_candidates(read, active, factor, len(raw), height)
+        peaks = peaks[_select_by_distance(peaks, heights, distance)]
+    else:
+        peaks = find_peaks(read(0, len(raw)), height=height, distance=distance)[0]
+
+    if settings.get("prominence") is not None and len(peaks):
+        env_min = _coarse_envelope(raw, scale, factor, np.minimum)
+        peaks = peaks[_envelope_prominences(raw, scale, peaks, env_max, env_min, factor) >= settings["prominence"]]
+    return peaks
+
+
+def detect_peaks_multirate(file_path: str, trials: np.ndarray, factor: int = DECIMATION, timer=NULL_TIMER) -> tuple:
+    """
+    Same as detect_peaks, with a coarse pass on a decimated envelope before the full rate search.
+
+    Each trial window is first reduced to the maximum of every bin of factor samples. The
+    local maxima above the peak height can only lie in the bins whose maximum reaches it,
+    so on a sparse channel (the beats) only those bins are searched at full rate, and the
+    distance setting is applied to the very candidates find_peaks would get. The
+    prominence of the peaks is measured on the maximum and minimum envelopes, only the
+    bins at both ends of each base are read at full rate instead of every sample up to
+    the next higher peak (often the whole trial when the taps clip), so the time grows
+    linearly with the length of the trials. The peaks are the ones detect_peaks finds.
+
+    Args:
+        file_path (str): The file path of the .wav file (beats on channel 0, taps on channel 1).
+        trials (np.ndarray): The TRIAL_DTYPE array of the trials.
+        factor (int): Number of samples per bin of the envelope.
+        timer (profiling.StageTimer): Records the wav_decode and find_peaks stages and the bytes read.
+
+    Returns:
+        tuple: The sampling rate, then the beats and taps as PEAK_DTYPE arrays.
+    """
+    with timer.stage("wav_decode"):
+        layout, frames = open_wav(file_path)
+        scale = channel_max(file_path, layout, frames)
+    timer.count("bytes_read", layout.n_frames * layout.channels * layout.sampwidth)
+    fs = layout.fs
+
+    beats, taps = [], []
+    for start, stop in zip(*get_trial_bounds(trials, fs)):
+        with timer.stage("wav_decode"):
+            window = read_window(file_path, layout, start, stop, frames)
+        with timer.stage("find_peaks"):
+            beats.append(_multirate_channel(window[:, 0], scale[0], fs, BEATS_PEAKS, factor) + start)
+            taps.append(_multirate_channel(window[:, 1], scale[1], fs, TAPS_PEAKS, factor) + start)
+    return fs, to_peak_array(beats), to_peak_array(taps)
@@ -0,0 +1,99 @@
+import numpy as np
+
+from matplotlib.lines import Line2D
+
+# Number of columns of the envelope drawn before the axes size is known
+INITIAL_COLUMNS = 2000
+
+
+def minmax_envelope(signal, start: int, stop: int, columns: int) -> tuple:
+    """
+    Reduces the samples between two indices to the minimum and maximum of each column.
+
+    Args:
+        signal (np.ndarray): The signal (a memory-mapped array is only read between the indices).
+        start (int): Index of the first sample, clipped to the signal.
+        stop (int): Index after the last sample, clipped to the signal.
+        columns (int): Number of columns (pixels) the samples are drawn on.
+
+    Returns:
+        tuple: The sample index and value of each point, the samples themselves when there
+               are less than two per column, otherwise the min then the max of every column.
+    """
+    start, stop = max(start, 0), min(stop, len(signal))
+    n = stop - start
+    if n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    samples = np.asarray(signal[start:stop])
+    if n <= 2 * columns:
+        return np.arange(start, stop), samples
+
+    edges = (np.arange(columns) * n) // columns  # First sample of each column
+    values = np.empty(2 * columns, dtype=samples.dtype)
+    values[0::2] = np.minimum.reduceat(samples, edges)
+    values[1::2] = np.maximum.reduceat(samples, edges)
+    return np.repeat(edges + start, 2), values
+
+
+class EnvelopeLine(Line2D):
+    """
+    Line drawing a long signal as its min/max envelope over the pixel columns of its axes.
+
+    The envelope is computed again for the visible samples whenever the view or the size in
+    pixels changes (zoom, pan, resize, savefig at another dpi), so the drawing looks like
+    the full signal while only a few thousand points are drawn.
+    """
+
+    def __init__(self, signal, x0: float = 0.0, dx: float = 1.0, **kwargs):
+        """
+        Args:
+            signal (np.ndarray): The signal to draw.
+            x0 (float): x coordinate of the first sample.
+            dx (float): x distance between two samples (1 / fs to draw against time).
+            **kwargs: Line2D properties.
+        """
+        self.signal = signal
+        self.x0 = x0
+        self.dx = dx
+        self._view = None  # (start, stop, columns) of the current envelope
+        super().__init__(*self._envelope(0, len(signal), INITIAL_COLUMNS), **kwargs)
+
+    def _envelope(self, start: int, stop: int, columns: int) -> tuple:
+        index, values = minmax_envelope(self.signal, start, stop, columns)
+        return self.x0 + index * self.dx, values
+
+    def draw(self, renderer):
+        if self.axes is not None:
+            low, high = sorted(self.axes.get_xlim())
+            start = int(np.floor((low - self.x0) / self.dx)) - 1  # One sample beyond each side
+            stop = int(np.ceil((high - self.x0) / self.dx)) + 2
+            view = (max(start, 0), min(stop, len(self.signal)), max(int(self.axes.bbox.width), 1))
+            if view != self._view:
+                self._view = view
+                self.set_data(*self._envelope(*view))
+        super().draw(renderer)
+
+
+def plot_envelope(ax, signal, x0: float = 0.0, dx: float = 1.0, **kwargs) -> EnvelopeLine:
+    """
+    Plots a signal on an axes as an EnvelopeLine, like ax.plot(x0 + dx * np.arange(len(signal)), signal).
+
+    Args:
+        ax (matplotlib.axes.Axes): The axes.
+        signal (np.ndarray): The signal to draw.
+        x0 (float): x coordinate of the first sample.
+        dx (float): x distance between two samples.
+        **kwargs: Line2D properties (label, color...).
+
+    Returns:
+        EnvelopeLine: The added line.
+    """
+    if "color" not in kwargs:
+        # Next color of the property cycle of the axes, as ax.plot would pick it
+        placeholder, = ax.plot([], [])
+        kwargs["color"] = placeholder.get_color()
+        placeholder.remove()
+    line = EnvelopeLine(signal, x0, dx, **kwargs)
+    ax.add_line(line)
+    ax.autoscale_view()
+    return line
@@ -1,14 +1,23 @@
 import os
+import sys
 import glob
 import numpy as np
-import pandas as pd
 
 from io import TextIOWrapper
-from praatio import textgrid
-from scipy.io.wavfile import read
-from scipy.signal import find_peaks
-from matplotlib import pyplot as plt
-import matplotlib.colors as mcolors
+from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
+from detection import TRIAL_DTYPE, detect_peaks, detect_peaks_multirate, detect_peaks_streaming, split_trials
+from coupling import couple_trials
+from synchrony import SYNCHRONY_DTYPE, file_synchrony
+from cache import ResultCache
+from manifest import Manifest, parse_filepath
+from profiling import NULL_TIMER, StageTimer, ProfileReport
+from wav_io import open_wav, read_window
+
+# pandas, praatio and matplotlib are imported by the functions using them, so a batch run
+# (see cli.py) only loads what its command needs
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Dictionary mapping subject groups to integer values
 SUBJECT_GROUPS = {"PWS": 1,   # PWS: People who stutter
@@ -21,19 +30,33 @@ CONDITIONS = {"Aperiodic"    : 1,  # Condition: Aperiodic
 # Header for the output data file
 DATAFILE_HEADER = "Subject\tGroup\tCondition\tFile\tTrain\tBeatNb\tBeatInstant\tTapInstant\n"
 
+# Types of the output data file columns
+DATAFILE_COLUMNS = {"Subject"    : np.int32,
+                    "Group"      : np.int8,
+                    "Condition"  : np.int8,
+                    "File"       : np.int32,
+                    "Train"      : np.int32,
+                    "BeatNb"     : np.int32,
+                    "BeatInstant": np.float64,
+                    "TapInstant" : np.float64}
 
 def plot_taps_with_beats(beats, taps, sample_rate, start: float = .0, 
-                         duration: float = None, xsamples:bool=False) -> None:
+                         duration: float = None, xsamples:bool=False, ax=None) -> None:
     """
     Plots both beats and taps with respect to the time.
 
+    The signals are drawn as their min/max envelope over the pixels of the plot, computed
+    again when zooming (see envelope_plot).
+
     Parameters:
     - beats: The beats signal array.
     - taps: The taps signal array.
     - start: The starting time in the signal (in seconds).
     - duration: Duration of the signal to plot (in seconds), None to plot the full signal.
     - xsamples: If true the signals is ploted as a function of sample number rather than time
+    - ax: The axes to plot on, default is a new pyplot figure which is shown.
     """
+    from envelope_plot import plot_envelope
     
     beats_duration = len(beats) / sample_rate
 
@@ -48,45 +71,40 @@ def plot_taps_with_beats(beats, taps, sample_rate, start: float = .0,
         duration = beats_duration - start
 
     # Time axis
+    first, last = int(start * sample_rate), int((start + duration) * sample_rate)
     if xsamples:
-        t = np.arange(start * sample_rate, int((start + duration) * sample_rate))
+        x0, dx = first, 1
     else:
-        t = np.arange(start, start + duration, 1/sample_rate)
+        x0, dx = start, 1/sample_rate
     
     # Plot the signal
-    _, axs = plt.subplots()
-    axs.plot(t, beats[int(start * sample_rate):int((start + duration) * sample_rate)], label="Beats")
-    axs.plot(t, taps[int(start * sample_rate):int((start + duration) * sample_rate)], label="Taps")
+    if ax is None:
+        from matplotlib import pyplot as plt
+    axs = plt.subplots()[1] if ax is None else ax
+    plot_envelope(axs, beats[first:last], x0, dx, label="Beats")
+    plot_envelope(axs, taps[first:last], x0, dx, label="Taps")
     axs.set_title("Signal")
     if xsamples:
         axs.set_xlabel(f"Time (in samples of {sample_rate}Hz)")
     else:
         axs.set_xlabel(f"Time (s)")
     axs.set_ylabel("Amplitude")
-    plt.legend()
-    plt.show()
+    axs.legend()
+    if ax is None:
+        plt.show()
 
 
-def extractInfosFromTier(Tier):
+def extractInfosFromTier(Tier) -> np.ndarray:
     """
-    Extracts the start times, end times, and labels from a given Tier.
+    Extracts the trials of a given interval Tier, one per entry.
     
     Args:
-        Tier (textgrid.TextGridTier): A tier object from which to extract information.
+        Tier (textgrid.IntervalTier): A tier object from which to extract information.
         
     Returns:
-        tuple: Three lists containing start times (xmi), end times (xma), and labels (lab) respectively.
+        np.ndarray: The start and end times of the entries, as a detection.TRIAL_DTYPE array.
     """
-    xmi = []  # List of start times
-    xma = []  # List of end times
-    lab = []  # List of labels
-
-    # Iterate through the entries in the Tier (start, end, label)
-    for start, end, label in Tier.entries:
-        xmi.append(start)
-        xma.append(end)
-        lab.append(label)
-    return xmi, xma, lab
+    return np.array([(start, end) for start, end, _ in Tier.entries], dtype=TRIAL_DTYPE)
 
 
 def open_datafile(fname: str, overwrite: bool = True) -> TextIOWrapper:
@@ -111,107 +129,497 @@ def open_datafile(fname: str, overwrite: bool = True) -> TextIOWrapper:
     return f
 
 
-def parse_filepath(fpath: str) -> tuple:
+def get_textGrid_path(fpath_wav: str) -> str:
     """
-    Extracts subject, group, condition, and file number from a given file path.
+    Generates the path to the corresponding TextGrid file for a given .wav file.
     
     Args:
-        fpath (str): The file path to parse.
+        fpath_wav (str): The file path of the .wav file.
         
     Returns:
-        tuple: A tuple containing subject (int), group (str), condition (str), and file number (int).
+        str: The file path of the corresponding TextGrid file.
     """
-    parts = os.path.normpath(fpath).split(os.sep)[-3:]  # Get the last three parts of the path
-    subject = int(parts[0][1:3])   # Assumes first part starts with a character followed by subject number
-    group = parts[0][-3:]          # Assumes last three characters of the first part represent the group
-    condition = parts[1]           # Assumes second part of the path is the condition
-    file = int(parts[2][4:8])      # Assumes the file part has a specific format with a 4-digit number
-    return (subject, group, condition, file)
+    base = os.path.splitext(fpath_wav)[0]  # Remove the .wav extension from the file
+    return f"{base}.TextGrid"              # Return the path with .TextGrid extension
 
 
-def get_textGrid_path(fpath_wav: str) -> str:
+def without_blanks(tier):
     """
-    Generates the path to the corresponding TextGrid file for a given .wav file.
+    Removes the entries with an empty label from a tier, as openTextgrid(..., False) does.
     
     Args:
-        fpath_wav (str): The file path of the .wav file.
+        tier (textgrid.TextgridTier): The tier to filter.
         
     Returns:
-        str: The file path of the corresponding TextGrid file.
+        textgrid.TextgridTier: A new tier with the labeled entries only.
     """
-    base = os.path.splitext(fpath_wav)[0]  # Remove the .wav extension from the file
-    return f"{base}.TextGrid"              # Return the path with .TextGrid extension
+    return tier.new(entries=[entry for entry in tier.entries if entry[-1] != ""])
 
 
-def process_data(dtfname: str = "datafile.txt", data_dir: str = "."):
+def merge_tier_points(tier, times: list) -> list:
     """
-    Processes all .wav files in a directory, extracts beat and tap data, and writes results to a data file.
+    Merges new unlabeled points into the entries of a point tier.
+
+    Gives the entries the tier would have after inserting each point with
+    insertEntry(..., collisionMode='replace'), in a single pass over the sorted
+    entries: a new point replaces the first existing point at the same time.
     
     Args:
-        dtfname (str): Name of the output data file.
-        data_dir (str): Directory containing the .wav files to process.
+        tier (textgrid.PointTier): The point tier to update.
+        times (list): Times of the new points (in seconds).
+        
+    Returns:
+        list: The merged entries, sorted by time.
+    """
+    existing = tier.entries  # Sorted by time then label
+    merged = []
+    i = 0
+    for time in sorted(set(times)):
+        while i < len(existing) and existing[i].time < time:
+            merged.append(existing[i])
+            i += 1
+        merged.append(tier.entryType(time, ""))
+        if i < len(existing) and existing[i].time == time:
+            i += 1
+    merged.extend(existing[i:])
+    return merged
+
+
+def file_sort_key(fpath: str) -> tuple:
     """
-    # Open or create the output data file
-    dtfile = open_datafile(dtfname, overwrite=True)
+    Builds the key used to order the processed files in the output data file.
+
+    A path that does not follow the corpus layout is sorted last instead of raising, so it
+    fails on its own when it is processed rather than stopping the whole batch.
     
-    # Process all .wav files in the specified directory recursively
-    for file_path in glob.glob(data_dir + "/**/*.wav", recursive=True):
-        print(file_path)
-        # Load the audio signal
-        fs, audio_signal = read(file_path)
-        bips = audio_signal[:,0]  # First channel for beats
-        taps = audio_signal[:,1]  # Second channel for taps
-        #bips = np.where(bips < 0, 0, bips)
-        #taps = np.where(taps < 0, 0, taps)
-        #bips = bips/ max(bips)
-        #taps = taps/ max(taps)
-        #bips = np.diff(bips)
-        #taps = np.diff(taps)
-
-        # Open the corresponding TextGrid file
-        tg = textgrid.openTextgrid(get_textGrid_path(file_path), False)
+    Args:
+        fpath (str): The file path of the .wav file.
+        
+    Returns:
+        tuple: (0, subject, condition, file number), conditions ordered by their integer value,
+               or (1, 0, 0, 0) for a path that cannot be parsed, then the path.
+    """
+    try:
+        sbj, _, cond, fl = parse_filepath(fpath)
+    except ValueError:
+        return (1, 0, 0, 0, fpath)
+    return (0, sbj, CONDITIONS.get(cond, len(CONDITIONS) + 1), fl, fpath)
+
+
+def list_recordings(data_dir: str = ".", manifest: str = None, select: dict = None) -> list:
+    """
+    Lists the .wav files of a directory, recursively, in the order of the output data file.
+
+    With a manifest the directory is not walked again, only the folders that changed
+    since the last run are listed and the recordings that changed read again (see
+    manifest.Manifest.refresh).
+    
+    Args:
+        data_dir (str): Directory containing the .wav files.
+        manifest (str): Name of the manifest database, None to walk the directory.
+        select (dict): Query on the recordings, given to manifest.Manifest.select, e.g.
+                       {"groups": "PWS", "conditions": "Aperiodic", "subjects": range(13, 23)}.
+                       None to list them all.
         
-        # Extract information from the tiers in the TextGrid
-        xmin, xmax, label = extractInfosFromTier(tg.getTier(tg.tierNames[0]))  # Main tier
-        bips_tier = tg.getTier(tg.tierNames[1])  # Bips tier
-        taps_tier = tg.getTier(tg.tierNames[2])  # Taps tier
+    Returns:
+        list: The file paths of the .wav files.
+    """
+    if manifest is None and select is None:
+        file_paths = glob.glob(data_dir + "/**/*.wav", recursive=True)
+    else:
+        index = Manifest(":memory:" if manifest is None else manifest)
+        try:
+            index.refresh(data_dir)
+            file_paths = [recording.path for recording in index.select(data_dir, **(select or {}))]
+        finally:
+            index.close()
+    return sorted(file_paths, key=file_sort_key)
+
+
+def process_file(file_path: str, streaming: bool = False, timer=NULL_TIMER, multirate: bool = False) -> tuple:
+    """
+    Extracts beat and tap data from a single .wav file and updates its TextGrid.
+    
+    Args:
+        file_path (str): The file path of the .wav file to process.
+        streaming (bool): Read the recording block by block (see detection.stream_peaks)
+                          instead of a whole trial at once, for long recordings.
+        timer (profiling.StageTimer): Records the time of every stage and the counts of the file.
+        multirate (bool): Search the peaks from a decimated envelope first (see
+                          detection.detect_peaks_multirate), for long recordings.
+        
+    Returns:
+        tuple: The sampling rate, the beats and taps of every trial (detection.PEAK_DTYPE arrays),
+               their couples (coupling.COUPLE_DTYPE array) and the number of trials of the main tier.
+    """
+    from praatio import textgrid
+
+    # Parse information from the file path, before any work on a file outside the corpus layout
+    _, _, cond, _ = parse_filepath(file_path)
+
+    # Open the corresponding TextGrid file, blank entries included to compare it with the update
+    with timer.stage("textgrid_read"):
+        tg = textgrid.openTextgrid(get_textGrid_path(file_path), True)
+    timer.count("bytes_read", os.path.getsize(get_textGrid_path(file_path)))
+    
+    # Extract information from the tiers in the TextGrid
+    trials = extractInfosFromTier(without_blanks(tg.getTier(tg.tierNames[0])))  # Main tier
+
+    # Find peaks for bips and taps between xmin and xmax of every trial
+    if streaming:
+        fs, peaks_bips, peaks_taps = detect_peaks_streaming(file_path, trials, timer=timer)
+    elif multirate:
+        fs, peaks_bips, peaks_taps = detect_peaks_multirate(file_path, trials, timer=timer)
+    else:
+        fs, peaks_bips, peaks_taps = detect_peaks(file_path, trials, timer)
+
+    # Couple the peaks of each trial
+    with timer.stage("coupling"):
+        couples = couple_trials(split_trials(peaks_bips, len(trials)), split_trials(peaks_taps, len(trials)), cond)
+    timer.count("trials", len(trials))
+    timer.count("beats", len(peaks_bips))
+    timer.count("taps", len(peaks_taps))
+    timer.count("couples", len(couples))
+    
+    # Update TextGrid tiers with new peaks (Bips then Taps tier), blank points are detected again
+    with timer.stage("textgrid_update"):
+        updated = {}
+        for tier_name, peaks in zip(tg.tierNames[1:3], (peaks_bips, peaks_taps)):
+            tier = tg.getTier(tier_name)
+            updated[tier_name] = merge_tier_points(without_blanks(tier), (peaks["sample"] / fs).tolist())
+        changed = any(entries != list(tg.getTier(tier_name).entries) for tier_name, entries in updated.items())
+        
+    # Save the updated TextGrid file, untouched if the peaks were already there
+    if changed:
+        with timer.stage("textgrid_save"):
+            for tier_name in tg.tierNames:
+                tier = tg.getTier(tier_name)
+                new_tier = tier.new(entries=updated[tier_name]) if tier_name in updated else without_blanks(tier)
+                tg.replaceTier(tier_name, new_tier, reportingMode='silence')
+            tg.save(get_textGrid_path(file_path), format="long_textgrid", includeBlankSpaces=True)
+
+    return fs, peaks_bips, peaks_taps, couples, len(trials)
+
+
+def profile_file(file_path: str, streaming: bool = False, multirate: bool = False) -> tuple:
+    """
+    Runs process_file on a file while recording its stages.
+    
+    Args:
+        file_path (str): The file path of the .wav file to process.
+        streaming (bool): See process_file.
+        multirate (bool): See process_file.
+        
+    Returns:
+        tuple: The result of process_file and the record of its stages (see StageTimer.record).
+    """
+    timer = StageTimer()
+    return process_file(file_path, streaming, timer, multirate), timer.record()
+
+
+def get_datafile_columns(file_path: str, fs: int, couples) -> dict:
+    """
+    Builds the data file columns of a file from its couples.
+    
+    Args:
+        file_path (str): The file path of the .wav file.
+        fs (int): The sampling rate of the file.
+        couples (np.ndarray): The couples of the file (coupling.COUPLE_DTYPE array).
+        
+    Returns:
+        dict: One typed array per data file column (see DATAFILE_COLUMNS).
+    """
+    # Parse information from the file path
+    sbj, grp, cond, fl = parse_filepath(file_path)
+
+    n = len(couples)
+    return {"Subject"    : np.full(n, sbj, dtype=DATAFILE_COLUMNS["Subject"]),
+            "Group"      : np.full(n, SUBJECT_GROUPS[grp], dtype=DATAFILE_COLUMNS["Group"]),
+            "Condition"  : np.full(n, CONDITIONS[cond], dtype=DATAFILE_COLUMNS["Condition"]),
+            "File"       : np.full(n, fl, dtype=DATAFILE_COLUMNS["File"]),
+            "Train"      : (couples["trial"] + 1).astype(DATAFILE_COLUMNS["Train"]),
+            "BeatNb"     : (couples["beat"] + 1).astype(DATAFILE_COLUMNS["BeatNb"]),
+            "BeatInstant": couples["beat_sample"] / fs,
+            "TapInstant" : couples["tap_sample"] / fs}
+
+
+def concat_datafile_columns(columns_list: list) -> dict:
+    """
+    Concatenates the data file columns of several files.
+    
+    Args:
+        columns_list (list): The columns of each file, as returned by get_datafile_columns.
+        
+    Returns:
+        dict: One typed array per data file column.
+    """
+    return {name: np.concatenate([columns[name] for columns in columns_list] or [[]]).astype(dtype, copy=False)
+            for name, dtype in DATAFILE_COLUMNS.items()}
+
+
+def get_synchrony_columns(file_path: str, fs: int, beats, taps, n_trials: int) -> dict:
+    """
+    Builds the synchrony table columns of a file, one row per trial (see synchrony.trial_synchrony).
+    
+    Args:
+        file_path (str): The file path of the .wav file.
+        fs (int): The sampling rate of the file.
+        beats (np.ndarray): The beats of the file (detection.PEAK_DTYPE array).
+        taps (np.ndarray): The taps of the file (detection.PEAK_DTYPE array).
+        n_trials (int): The number of trials of the main tier, trials without peaks included.
         
-        # Loop through each label (trial) in the tier
-        for t in range(len(label)):
-            
-            # Find peaks for bips and taps between xmin and xmax
-            tpeaks_bips = find_peaks(bips[int(xmin[t]*fs):int(xmax[t]*fs)] / max(bips),
-                                     height=0.1,
-                                     distance=0.3 * fs)[0] + int(xmin[t]*fs)
-            tpeaks_taps = find_peaks(taps[int(xmin[t]*fs):int(xmax[t]*fs)] / max(taps),
-                                     height=0.05,
-                                     distance=0.1 * fs,
-                                     prominence=0.1)[0] + int(xmin[t]*fs)
-            #plot_taps_with_beats(bips[int(xmin[t]*fs):int(xmax[t]*fs)] / max(bips), taps[int(xmin[t]*fs):int(xmax[t]*fs)] / max(taps), fs, xsamples=False)
-            # Parse information from the file path
-            sbj, grp, cond, fl = parse_filepath(file_path)
-            # Write peaks data to the data file
-            couples = get_couples(tpeaks_bips, tpeaks_taps,cond)
+    Returns:
+        dict: The Subject, Group, Condition, File and Train columns then one array per synchrony measure.
+    """
+    sbj, grp, cond, fl = parse_filepath(file_path)
+    synchrony = file_synchrony(fs, beats, taps, n_trials)
+
+    n = len(synchrony)
+    columns = {"Subject"  : np.full(n, sbj, dtype=DATAFILE_COLUMNS["Subject"]),
+               "Group"    : np.full(n, SUBJECT_GROUPS[grp], dtype=DATAFILE_COLUMNS["Group"]),
+               "Condition": np.full(n, CONDITIONS[cond], dtype=DATAFILE_COLUMNS["Condition"]),
+               "File"     : np.full(n, fl, dtype=DATAFILE_COLUMNS["File"]),
+               "Train"    : (synchrony["trial"] + 1).astype(DATAFILE_COLUMNS["Train"])}
+    columns.update({name: synchrony[name] for name in SYNCHRONY_DTYPE.names[1:]})
+    return columns
+
+
+def write_synchrony(fname: str, columns_list: list) -> None:
+    """
+    Writes the synchrony tables of several files as one tab separated file, missing values as NaN.
+    
+    Args:
+        fname (str): Name of the synchrony file.
+        columns_list (list): The columns of each file, as returned by get_synchrony_columns.
+    """
+    import pandas as pd
+
+    tables = [pd.DataFrame(columns) for columns in columns_list]
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    table.to_csv(fname, sep="\t", index=False, na_rep="NaN")
+
+
+def format_datafile_rows(columns: dict) -> str:
+    """
+    Formats data file columns as the rows of the tab separated data file.
+    
+    Args:
+        columns (dict): One array per data file column.
         
-            for n,tap in couples.items():
-                dtfile.write(f"{sbj}\t{SUBJECT_GROUPS[grp]}\t{CONDITIONS[cond]}\t{fl}\t{t + 1}\t{n + 1}\t{tpeaks_bips[n] / fs}\t{tap/ fs}\n")
-            
-
-#           for k in range(0, min(len(tpeaks_bips), len(tpeaks_taps))):
-#               dtfile.write(f"{sbj}\t{SUBJECT_GROUPS[grp]}\t{CONDITIONS[cond]}\t{fl}\t{t+1}\t{k+1}\t{tpeaks_bips[k]/fs}\t{tpeaks_taps[k]/fs}\n")
-
-            # Update TextGrid tiers with new peaks
-            for k in range(len(tpeaks_bips)):
-                bips_tier.insertEntry((tpeaks_bips[k] / fs, ""), collisionMode='replace', collisionReportingMode='silence')
-            for k in range(len(tpeaks_taps)):
-                taps_tier.insertEntry((tpeaks_taps[k] / fs, ""), collisionMode='replace', collisionReportingMode='silence')
-            
-        # Save the updated TextGrid file
-        tg.save(get_textGrid_path(file_path), format="long_textgrid", includeBlankSpaces=True)
+    Returns:
+        str: The rows, one line per couple.
+    """
+    return "".join("\t".join(map(str, row)) + "\n"
+                   for row in zip(*(columns[name].tolist() for name in DATAFILE_COLUMNS)))
+
+
+def write_datafile(fname: str, columns: dict) -> None:
+    """
+    Writes data file columns in the format given by the file extension.
+
+    .parquet and .feather files are written with pandas (pyarrow required), .npz files
+    with numpy, anything else as the tab separated data file.
+    
+    Args:
+        fname (str): Name of the output data file.
+        columns (dict): One array per data file column.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == ".npz":
+        np.savez(fname, **columns)
+    elif ext == ".parquet":
+        import pandas as pd
+        pd.DataFrame(columns).to_parquet(fname, index=False)
+    elif ext == ".feather":
+        import pandas as pd
+        pd.DataFrame(columns).to_feather(fname)
+    else:
+        dtfile = open_datafile(fname, overwrite=True)
+        dtfile.write(format_datafile_rows(columns))
+        dtfile.close()
+
+
+def process_data(dtfname: str = "datafile.txt", data_dir: str = ".", workers: int = 1,
+                 cache: str = None, streaming: bool = False, profile: str = None,
+                 multirate: bool = False, manifest: str = None, select: dict = None,
+                 synchrony: str = None) -> list:
+    """
+    Processes all .wav files in a directory, extracts beat and tap data, and writes results to a data file.
+
+    Files are processed in (subject, condition, file) order so the data file is identical
+    whatever the number of workers. A file that fails is reported and skipped.
+
+    With a cache, the results of every file are kept in a local database and only the files
+    whose recording, TextGrid or detection settings changed since the last run are processed
+    again, the data file is then rebuilt from the cache.
+    
+    Args:
+        dtfname (str): Name of the output data file, or a list of names to write it in several
+                       formats (see write_datafile).
+        data_dir (str): Directory containing the .wav files to process.
+        workers (int): Number of worker processes, 1 processes the files in this process.
+        cache (str): Name of the cache database, None to process every file.
+        streaming (bool): Detect the peaks block by block, with a bounded memory use
+                          whatever the length of the recordings (same results).
+        profile (str): Name of a report of the time, bytes read and counts of every file and
+                       stage (CSV if it ends with .csv, JSON otherwise), None to not profile.
+                       A summary of the slowest stages and files is printed at the end.
+        multirate (bool): Detect the peaks from a decimated envelope first, faster on long
+                          recordings (same results).
+        manifest (str): Name of a manifest database indexing the recordings, refreshed
+                        instead of walking the whole directory, None to walk it.
+        select (dict): Only process the recordings matching this query (see list_recordings).
+        synchrony (str): Name of a table of the beat/tap cross-correlation synchrony of every
+                         trial (see synchrony.trial_synchrony), None to not measure it.
         
-    # Close the data file
-    dtfile.close()
+    Returns:
+        list: The (file path, error) pairs of the files that could not be processed.
+    """
+    # Collect all .wav files in the specified directory recursively
+    file_paths = list_recordings(data_dir, manifest, select)
+    failures = []
+    report = ProfileReport() if profile is not None else None
+    run_timer = report.run if report is not None else NULL_TIMER
+    task = profile_file if report is not None else process_file
+
+    results = {}
+    columns = {}
+
+    def fail(file_path, e):
+        print(f"[ERROR] {file_path}: {e!r}", file=sys.stderr)
+        failures.append((file_path, e))
+
+    def keep(file_path, result):
+        # The data file columns are built with the result, so a file whose group or condition
+        # has no code fails on its own, before its result is kept or cached
+        columns[file_path] = get_datafile_columns(file_path, result[0], result[3])
+        results[file_path] = result
+
+    # Reuse the results of the unchanged files
+    pending = file_paths
+    if cache is not None:
+        cache = ResultCache(cache)
+        pending = []
+        with run_timer.stage("cache_lookup"):
+            for file_path in file_paths:
+                result = cache.lookup(file_path)
+                if result is None:
+                    pending.append(file_path)
+                    continue
+                try:
+                    keep(file_path, result)
+                except Exception as e:
+                    fail(file_path, e)
+        run_timer.count("cached_files", len(file_paths) - len(pending))
 
+    def collect(file_path, get_result):
+        print(file_path)
+        try:
+            result = get_result()
+            if report is not None:
+                result, record = result
+                report.add_file(file_path, record)
+            keep(file_path, result)
+            if cache is not None:
+                with run_timer.stage("cache_store"):
+                    cache.store(file_path, result)
+        except Exception as e:
+            fail(file_path, e)
+    
+    if workers is None or workers <= 1:
+        for file_path in pending:
+            collect(file_path, lambda: task(file_path, streaming, multirate=multirate))
+    else:
+        # Results are collected in submission order so the output does not depend on scheduling
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(task, file_path, streaming, multirate=multirate) for file_path in pending]
+            for file_path, future in zip(pending, futures):
+                collect(file_path, future.result)
+
+    if cache is not None:
+        cache.close()
+
+    # Write the columns of every file to the output data files
+    with run_timer.stage("datafile_write"):
+        datafile_columns = concat_datafile_columns([columns[file_path] for file_path in file_paths
+                                                    if file_path in columns])
+        for fname in ([dtfname] if isinstance(dtfname, str) else dtfname):
+            write_datafile(fname, datafile_columns)
+
+    # Measure the synchrony of every trial from the peaks, cached or not
+    if synchrony is not None:
+        with run_timer.stage("synchrony"):
+            synchrony_columns = []
+            for file_path in file_paths:
+                if file_path not in results:
+                    continue
+                try:
+                    fs, beats, taps, _, n_trials = results[file_path]
+                    synchrony_columns.append(get_synchrony_columns(file_path, fs, beats, taps, n_trials))
+                except Exception as e:
+                    fail(file_path, e)
+            write_synchrony(synchrony, synchrony_columns)
+
+    if report is not None:
+        report.write(profile)
+        print(report.summary())
+
+    return failures
+
+
+def export_figure(file_path: str, fname: str, dpi: int = 300) -> None:
+    """
+    Saves the figure of the beats and taps of a recording, without pyplot.
+    
+    Args:
+        file_path (str): The file path of the .wav file.
+        fname (str): Name of the image file.
+        dpi (int): Resolution of the image.
+    """
+    from matplotlib.figure import Figure
+
+    layout, frames = open_wav(file_path)
+    if frames is None:
+        frames = read_window(file_path, layout, 0, layout.n_frames)
+    fig = Figure(figsize=(12, 4))
+    ax = fig.subplots()
+    plot_taps_with_beats(frames[:, 0], frames[:, 1], layout.fs, ax=ax)
+    ax.set_title(os.path.basename(file_path))
+    fig.savefig(fname, dpi=dpi, bbox_inches='tight')
+
+
+def export_figures(data_dir: str = ".", out_dir: str = "figures", workers: int = None, dpi: int = 300) -> list:
+    """
+    Saves the figure of every .wav file of a directory, rendered in parallel.
+
+    The images are named after the recordings, in the same folders under out_dir.
+    
+    Args:
+        data_dir (str): Directory containing the .wav files.
+        out_dir (str): Directory of the images.
+        workers (int): Number of worker processes, None for one per processor.
+        dpi (int): Resolution of the images.
+        
+    Returns:
+        list: The (file path, error) pairs of the files whose figure could not be saved.
+    """
+    file_paths = list_recordings(data_dir)
+    fnames = [os.path.join(out_dir, os.path.splitext(os.path.relpath(file_path, data_dir))[0] + ".png")
+              for file_path in file_paths]
+    for fname in fnames:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_figure, file_path, fname, dpi) for file_path, fname in zip(file_paths, fnames)]
+        for file_path, future in zip(file_paths, futures):
+            try:
+                future.result()
+                print(file_path)
+            except Exception as e:
+                print(f"[ERROR] {file_path}: {e!r}", file=sys.stderr)
+                failures.append((file_path, e))
+    return failures
 
 
 def get_datafile_as_dataframe(dtfname: str):
@@ -224,10 +632,54 @@ def get_datafile_as_dataframe(dtfname: str):
     Returns:
         pd.DataFrame: A DataFrame containing the data from the file.
     """
+    import pandas as pd
     return pd.read_csv(dtfname, sep='\t')
 
 
+def load_datafile(dtfname: str) -> "pd.DataFrame":
+    """
+    Reads a data file, in any of the formats written by write_datafile, with typed columns.
+
+    Group and Condition are returned as categoricals labeled with the SUBJECT_GROUPS and
+    CONDITIONS names, the other columns with their DATAFILE_COLUMNS types.
+    
+    Args:
+        dtfname (str): Name of the data file to read.
+        
+    Returns:
+        pd.DataFrame: A DataFrame containing the data from the file.
+    """
+    import pandas as pd
+
+    ext = os.path.splitext(dtfname)[1].lower()
+    if ext == ".npz":
+        with np.load(dtfname) as npz:
+            df = pd.DataFrame({name: npz[name] for name in DATAFILE_COLUMNS})
+    elif ext == ".parquet":
+        df = pd.read_parquet(dtfname)
+    elif ext == ".feather":
+        df = pd.read_feather(dtfname)
+    else:
+        df = pd.read_csv(dtfname, sep='\t', dtype=DATAFILE_COLUMNS)
+
+    for column, mapping in (("Group", SUBJECT_GROUPS), ("Condition", CONDITIONS)):
+        names = {value: name for name, value in mapping.items()}
+        df[column] = pd.Categorical(df[column].map(names), categories=list(mapping))
+    return df
+
+
 def get_couples(b, t, cond):
+    """
+    Couples each beat with at most one tap (reference implementation of coupling.couple_peaks).
+    
+    Args:
+        b (np.ndarray): Sample indices of the beats.
+        t (np.ndarray): Sample indices of the taps.
+        cond: The condition of the trial.
+        
+    Returns:
+        dict: The sample index of the tap coupled with each beat index.
+    """
     couples = {}
     bips = b.copy().tolist()
     taps = t.copy().tolist()
@@ -275,4 +727,4 @@ def get_couples(b, t, cond):
 
 if __name__ == "__main__":
     process_data()
-    
\ No newline at end of file
+    
\ No newline at end of file
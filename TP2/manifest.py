@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import sqlite3
+
+from typing import NamedTuple
+from wav_io import read_layout
+
+# Name of a subject folder: subject number then group (S13-PWS)
+SUBJECT_DIR = re.compile(r"S(\d+)-(\w+)")
+
+# Name of a recording: file number after the subject number (S13_0019-BaT.wav)
+RECORDING_NAME = re.compile(r"S\d+_(\d+)")
+
+
+def parse_filepath(fpath: str) -> tuple:
+    """
+    Extracts subject, group, condition, and file number from a given file path.
+
+    The path ends with the subject folder, the condition folder and the recording, as in
+    Sxx-GRP/Condition/Sxx_NNNN-BaT.wav.
+
+    Args:
+        fpath (str): The file path to parse.
+
+    Returns:
+        tuple: A tuple containing subject (int), group (str), condition (str), and file number (int).
+
+    Raises:
+        ValueError: If the path does not follow this layout.
+    """
+    parts = os.path.normpath(fpath).split(os.sep)[-3:]  # Get the last three parts of the path
+    subject_dir = SUBJECT_DIR.fullmatch(parts[0]) if len(parts) == 3 else None
+    recording = RECORDING_NAME.match(parts[-1])
+    if subject_dir is None or recording is None:
+        raise ValueError(f"{fpath} does not follow the Sxx-GRP/Condition/Sxx_NNNN layout")
+    return (int(subject_dir[1]), subject_dir[2], parts[1], int(recording[1]))
+
+
+class Recording(NamedTuple):
+    """
+    A recording of a corpus, as indexed by the manifest.
+    """
+    path: str            # File path of the .wav file, under the directory it was selected from
+    subject: int         # Subject number, None if the path could not be parsed
+    group: str           # Group of the subject (PWS, PNS)
+    condition: str       # Condition folder
+    file: int            # File number
+    fs: int              # Sampling rate, None if the header could not be read
+    n_frames: int        # Length in frames
+    has_textgrid: bool   # Whether or not the TextGrid of the recording exists
+
+
+def _list_directory(path: str) -> dict:
+    """
+    Lists the sub-folders, recordings and TextGrids of a folder, hidden entries excluded as glob does.
+    """
+    listing = {"dirs": [], "wavs": [], "textgrids": []}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                listing["dirs"].append(entry.name)
+            elif entry.name.endswith(".wav"):
+                listing["wavs"].append(entry.name)
+            elif entry.name.endswith(".TextGrid"):
+                listing["textgrids"].append(entry.name)
+    return listing
+
+
+class Manifest:
+    """
+    SQLite index of the recordings of one or more corpora and of their metadata.
+
+    The folders are only listed again when their modification time changed (a file was
+    added, removed or renamed in them), and a recording is only parsed and its header
+    read again when it is new or its size or modification time changed, which also
+    catches a recording rewritten in place. Refreshing an unchanged corpus therefore
+    costs one stat per folder and per recording.
+    """
+
+    def __init__(self, fname: str = ":memory:"):
+        """
+        Opens or creates the manifest database.
+
+        Args:
+            fname (str): Name of the database file, ":memory:" for a manifest of this run only.
+        """
+        self.db = sqlite3.connect(fname)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS dirs (
+                               path TEXT PRIMARY KEY, mtime INTEGER, listing TEXT)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS recordings (
+                               path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,
+                               subject INTEGER, grp TEXT, condition TEXT, file INTEGER,
+                               fs INTEGER, n_frames INTEGER, has_textgrid INTEGER)""")
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def _under(self, table: str, columns: str, root: str) -> dict:
+        prefix = os.path.join(root, "")
+        rows = self.db.execute(f"SELECT path, {columns} FROM {table} WHERE path = ? OR substr(path, 1, ?) = ?",
+                               (root, len(prefix), prefix))
+        return {row[0]: row[1:] for row in rows}
+
+    def _index(self, path: str, stat, has_textgrid: bool) -> None:
+        try:
+            subject, group, condition, file = parse_filepath(path)
+        except ValueError:
+            subject = group = condition = file = None  # Still listed, as glob would list it
+        try:
+            layout = read_layout(path)
+            fs, n_frames = layout.fs, layout.n_frames
+        except (OSError, ValueError):
+            fs = n_frames = None
+        self.db.execute("INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, stat.st_size, stat.st_mtime_ns, subject, group, condition, file,
+                         fs, n_frames, has_textgrid))
+
+    def refresh(self, data_dir: str) -> int:
+        """
+        Brings the index of the recordings of a directory up to date.
+
+        Args:
+            data_dir (str): Directory containing the .wav files, searched recursively.
+
+        Returns:
+            int: Number of recordings indexed again.
+        """
+        root = self._key(data_dir)
+        known_dirs = self._under("dirs", "mtime", root)
+        known = self._under("recordings", "size, mtime", root)
+        visited, seen, indexed = set(), set(), 0
+        stack = [root]
+        with self.db:
+            while stack:
+                directory = stack.pop()
+                visited.add(directory)
+                mtime = os.stat(directory).st_mtime_ns
+                changed = known_dirs.get(directory) != (mtime,)
+                if changed:
+                    listing = _list_directory(directory)
+                    self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                                    (directory, mtime, json.dumps(listing)))
+                else:
+                    listing = json.loads(self.db.execute("SELECT listing FROM dirs WHERE path = ?",
+                                                         (directory,)).fetchone()[0])
+                stack.extend(os.path.normcase(os.path.join(directory, name)) for name in listing["dirs"])
+
+                textgrids = set(listing["textgrids"])
+                for name in listing["wavs"]:
+                    path = os.path.normcase(os.path.join(directory, name))
+                    seen.add(path)
+                    stat = os.stat(path)
+                    has_textgrid = os.path.splitext(name)[0] + ".TextGrid" in textgrids
+                    if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                        if changed:  # Its TextGrid may have been added or removed
+                            self.db.execute("UPDATE recordings SET has_textgrid = ? WHERE path = ?",
+                                            (has_textgrid, path))
+                    else:
+                        self._index(path, stat, has_textgrid)
+                        indexed += 1
+
+            # Forget the folders and recordings that disappeared
+            self.db.executemany("DELETE FROM dirs WHERE path = ?", [(d,) for d in known_dirs if d not in visited])
+            self.db.executemany("DELETE FROM recordings WHERE path = ?", [(p,) for p in known if p not in seen])
+        return indexed
+
+    def select(self, data_dir: str, groups=None, conditions=None, subjects=None, files=None,
+               textgrid: bool = None) -> list:
+        """
+        Gets the indexed recordings of a directory matching a query, such as
+        select(".", groups="PWS", conditions="Aperiodic", subjects=range(13, 23)).
+
+        Args:
+            data_dir (str): Directory the recordings were indexed from (see refresh).
+            groups (str or iterable): Group or groups of the subjects, None for every group.
+            conditions (str or iterable): Condition or conditions, None for every condition.
+            subjects (iterable): Subject numbers, None for every subject.
+            files (iterable): File numbers, None for every file.
+            textgrid (bool): Only the recordings with (True) or without (False) a TextGrid,
+                             None for both.
+
+        Returns:
+            list: The matching Recording entries, their path joined to data_dir.
+        """
+        root = self._key(data_dir)
+        prefix = os.path.join(root, "")
+        clauses, params = ["substr(path, 1, ?) = ?"], [len(prefix), prefix]
+        for column, values in (("grp", groups), ("condition", conditions), ("subject", subjects), ("file", files)):
+            if values is None:
+                continue
+            values = [values] if isinstance(values, (str, int)) else list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if textgrid is not None:
+            clauses.append("has_textgrid = ?")
+            params.append(bool(textgrid))
+
+        rows = self.db.execute("SELECT path, subject, grp, condition, file, fs, n_frames, has_textgrid "
+                               f"FROM recordings WHERE {' AND '.join(clauses)} ORDER BY path", params)
+        return [Recording(os.path.join(data_dir, os.path.relpath(row[0], root)), *row[1:7], bool(row[7]))
+                for row in rows]
+
+    def close(self) -> None:
+        """
+        Closes the manifest database.
+        """
+        self.db.close()
@@ -0,0 +1,142 @@
+import csv
+import json
+import time
+
+from contextlib import contextmanager, nullcontext
+
+
+class StageTimer:
+    """
+    Records the wall time spent in named stages and counters (bytes read, trials, peaks...).
+    """
+
+    def __init__(self):
+        self.stages = {}  # Stage name -> seconds
+        self.counts = {}  # Counter name -> total
+        self._nested = []  # Time of the stages nested in each open stage
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the enclosed block, adding its duration to the stage.
+
+        Stages may be nested: the time of an inner stage is only added to the inner one.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def count(self, name: str, n: int) -> None:
+        """
+        Adds n to a counter.
+
+        Args:
+            name (str): Name of the counter.
+            n (int): Value to add.
+        """
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def record(self) -> dict:
+        """
+        Returns:
+            dict: The stage times and the counters, as plain (picklable, JSON) values.
+        """
+        return {"stages": dict(self.stages), "counts": dict(self.counts)}
+
+
+class NullTimer:
+    """
+    StageTimer that records nothing, used when profiling is off.
+    """
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def count(self, name: str, n: int) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class ProfileReport:
+    """
+    Per-file and per-run stage times and counters of a process_data run.
+    """
+
+    def __init__(self):
+        self.files = {}         # File path -> record of StageTimer.record
+        self.run = StageTimer()  # Stages that are not specific to a file
+
+    def add_file(self, file_path: str, record: dict) -> None:
+        self.files[file_path] = record
+
+    def stage_totals(self) -> dict:
+        """
+        Returns:
+            dict: The total time of each stage over the files and the run, slowest first.
+        """
+        totals = dict(self.run.stages)
+        for record in self.files.values():
+            for stage, seconds in record["stages"].items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def slowest_files(self, n: int = 5) -> list:
+        """
+        Returns:
+            list: The (file path, total seconds, slowest stage) of the n slowest files.
+        """
+        rows = [(file_path, sum(record["stages"].values()),
+                 max(record["stages"], key=record["stages"].get, default=""))
+                for file_path, record in self.files.items()]
+        return sorted(rows, key=lambda row: -row[1])[:n]
+
+    def write_json(self, fname: str) -> None:
+        with open(fname, "w") as f:
+            json.dump({"files": self.files, "run": self.run.record(), "stage_totals": self.stage_totals()},
+                      f, indent=2)
+
+    def write_csv(self, fname: str) -> None:
+        """
+        Writes one row per file, with a column per stage (seconds) and per counter.
+        """
+        stages = sorted({s for record in self.files.values() for s in record["stages"]})
+        counts = sorted({c for record in self.files.values() for c in record["counts"]})
+        with open(fname, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file"] + [f"{s}_s" for s in stages] + counts)
+            for file_path, record in self.files.items():
+                writer.writerow([file_path] + [record["stages"].get(s, 0.0) for s in stages]
+                                + [record["counts"].get(c, 0) for c in counts])
+
+    def write(self, fname: str) -> None:
+        """
+        Writes the report as CSV if fname ends with .csv, as JSON otherwise.
+        """
+        if fname.lower().endswith(".csv"):
+            self.write_csv(fname)
+        else:
+            self.write_json(fname)
+
+    def summary(self, n: int = 5) -> str:
+        """
+        Returns:
+            str: A table of the stage totals and of the n slowest files.
+        """
+        totals = self.stage_totals()
+        whole = sum(totals.values()) or 1.0
+        lines = ["Stage                      Time (s)      %"]
+        lines += [f"{stage:<24}{seconds:12.3f}{100 * seconds / whole:7.1f}" for stage, seconds in totals.items()]
+        lines += ["", "Slowest files   Time (s)  Slowest stage     File"]
+        lines += [f"{seconds:24.3f}  {stage:<18}{file_path}" for file_path, seconds, stage in self.slowest_files(n)]
+        return "\n".join(lines)
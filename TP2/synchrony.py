@@ -0,0 +1,158 @@
+import numpy as np
+
+from scipy import fft
+from detection import split_trials
+
+# Sampling rate of the onset envelopes (1 ms lags)
+ENVELOPE_RATE = 1000
+
+# Standard deviation of the gaussian pulse of an onset in the envelopes (in seconds)
+ONSET_WIDTH = 0.025
+
+# Lags searched on each side of 0 for the cross-correlation peak, and kept on each side of
+# the peak for the lag distribution, as a fraction of the median inter-beat interval of the
+# trial: a tap further than half an interval from its beat is closer to another one
+LAG_FRACTION = 0.5
+
+# Synchrony of one trial: its beats and taps, the peak of the smoothed cross-correlation and
+# the distribution of the tap - beat lags of the pairs around the peak (in seconds)
+SYNCHRONY_DTYPE = np.dtype([("trial", np.int32),
+                            ("beats", np.int32),
+                            ("taps", np.int32),
+                            ("asynchrony", np.float64),   # Mean lag
+                            ("lag_std", np.float64),
+                            ("lag_q25", np.float64),
+                            ("lag_median", np.float64),
+                            ("lag_q75", np.float64),
+                            ("peak_lag", np.float64),     # Lag of the cross-correlation peak
+                            ("strength", np.float64)])    # Peak of the normalized cross-correlation (1 when locked)
+
+
+def onset_envelopes(peaks_per_trial: list, starts: np.ndarray, fs: int, length: int,
+                    rate: int = ENVELOPE_RATE) -> np.ndarray:
+    """
+    Places the peaks of every trial as unit impulses on envelopes sampled at a low rate.
+
+    Args:
+        peaks_per_trial (list): One array of sample indices per trial.
+        starts (np.ndarray): Sample index of the first envelope bin of each trial.
+        fs (int): The sampling rate of the peaks.
+        length (int): Number of bins of the envelopes.
+        rate (int): The sampling rate of the envelopes.
+
+    Returns:
+        np.ndarray: The (trials, length) envelopes, the number of peaks in every bin.
+    """
+    envelopes = np.zeros((len(peaks_per_trial), length))
+    counts = [len(peaks) for peaks in peaks_per_trial]
+    if sum(counts):
+        trial = np.repeat(np.arange(len(peaks_per_trial)), counts)
+        samples = np.concatenate(peaks_per_trial) - np.repeat(starts, counts)
+        np.add.at(envelopes, (trial, np.rint(samples * rate / fs).astype(np.int64)), 1)
+    return envelopes
+
+
+def _weighted_quantiles(weights: np.ndarray, lags: np.ndarray, q: float) -> np.ndarray:
+    """
+    Lag below which a fraction q of the weight of every row lies.
+    """
+    cumulated = np.cumsum(weights, axis=1)
+    first = np.argmax(cumulated >= q * cumulated[:, -1:], axis=1)
+    return lags[first]
+
+
+def trial_synchrony(beats_per_trial: list, taps_per_trial: list, fs: int, rate: int = ENVELOPE_RATE,
+                    width: float = ONSET_WIDTH) -> np.ndarray:
+    """
+    Measures the synchrony of the taps with the beats of every trial from the cross-correlation
+    of their onset envelopes.
+
+    The envelopes of all the trials are correlated at once with FFTs, which costs
+    O(n log n) per trial whatever the number of beats and taps and whatever the
+    coupling would do with missing or extra taps. The cross-correlation of the impulse
+    envelopes counts the beat and tap pairs at every lag, which gives the distribution
+    of the lags. Smoothed by gaussian onsets and normalized, its peak gives the coupling
+    strength: 1 when every tap follows its beat by the same lag, lower with jitter,
+    missing or extra taps. The lag distribution is taken around the peak lag, so the
+    reactions of the aperiodic trials are not mixed with the taps of the previous beats.
+
+    Args:
+        beats_per_trial (list): One array of beat sample indices per trial.
+        taps_per_trial (list): One array of tap sample indices per trial.
+        fs (int): The sampling rate of the peaks.
+        rate (int): The sampling rate of the envelopes, the resolution of the lags.
+        width (float): Standard deviation of the gaussian onsets (in seconds).
+
+    Returns:
+        np.ndarray: The SYNCHRONY_DTYPE array, one entry per trial, NaN when a trial has no beat or no tap.
+    """
+    n = len(beats_per_trial)
+    result = np.zeros(n, dtype=SYNCHRONY_DTYPE)
+    result["trial"] = np.arange(n)
+    result["beats"] = [len(beats) for beats in beats_per_trial]
+    result["taps"] = [len(taps) for taps in taps_per_trial]
+    for name in SYNCHRONY_DTYPE.names[3:]:
+        result[name] = np.nan
+    valid = np.flatnonzero((result["beats"] > 0) & (result["taps"] > 0))
+    if len(valid) == 0:
+        return result
+    beats = [np.asarray(beats_per_trial[t], dtype=np.int64) for t in valid]
+    taps = [np.asarray(taps_per_trial[t], dtype=np.int64) for t in valid]
+
+    # Lag window of every trial, in envelope bins
+    step = fs / rate
+    starts = np.array([min(b[0], t[0]) for b, t in zip(beats, taps)])
+    stops = np.array([max(b[-1], t[-1]) for b, t in zip(beats, taps)])
+    intervals = np.array([np.median(np.diff(b)) if len(b) > 1 else stop - start
+                          for b, start, stop in zip(beats, starts, stops)])
+    windows = np.maximum(np.rint(LAG_FRACTION * intervals / step).astype(np.int64), 1)
+
+    # Zero padding beyond the largest lag so the circular correlation does not wrap
+    span = int(np.rint((stops - starts).max() / step)) + 1
+    length = fft.next_fast_len(span + 2 * windows.max() + 1, real=True)
+    beat_spectra = fft.rfft(onset_envelopes(beats, starts, fs, length, rate), axis=1)
+    tap_spectra = fft.rfft(onset_envelopes(taps, starts, fs, length, rate), axis=1)
+    cross = np.conj(beat_spectra) * tap_spectra
+    smoothing = np.exp(-(2 * np.pi * fft.rfftfreq(length) * width * rate) ** 2)  # Both onsets gaussian
+    pairs = np.rint(fft.irfft(cross, length, axis=1))  # Pair counts, rounded from the FFT
+    smoothed = fft.irfft(cross * smoothing, length, axis=1)
+    norms = np.sqrt(fft.irfft(np.abs(beat_spectra) ** 2 * smoothing, length, axis=1)[:, 0]
+                    * fft.irfft(np.abs(tap_spectra) ** 2 * smoothing, length, axis=1)[:, 0])
+
+    # Peak within the window of every trial, then the pairs within a window around the peak
+    lags = np.arange(-2 * windows.max(), 2 * windows.max() + 1)
+    seconds = lags / rate
+    correlation = np.where(np.abs(lags) <= windows[:, None], smoothed[:, lags % length], -np.inf)
+    peak = np.argmax(correlation, axis=1)
+    around = np.abs(lags - lags[peak][:, None]) <= windows[:, None]
+    counts = np.where(around, pairs[:, lags % length], 0)
+    total = counts.sum(axis=1)
+    paired = total > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = counts @ seconds / total
+        variance = counts @ seconds ** 2 / total - mean ** 2
+    result["asynchrony"][valid[paired]] = mean[paired]
+    result["lag_std"][valid[paired]] = np.sqrt(np.maximum(variance[paired], 0))
+    for name, q in (("lag_q25", 0.25), ("lag_median", 0.5), ("lag_q75", 0.75)):
+        result[name][valid[paired]] = _weighted_quantiles(counts[paired], seconds, q)
+    result["peak_lag"][valid] = seconds[peak]
+    result["strength"][valid] = correlation[np.arange(len(valid)), peak] / norms
+    return result
+
+
+def file_synchrony(fs: int, beats: np.ndarray, taps: np.ndarray, n_trials: int = None) -> np.ndarray:
+    """
+    Measures the synchrony of every trial of a recording (see trial_synchrony).
+
+    Args:
+        fs (int): The sampling rate of the recording.
+        beats (np.ndarray): The beats of the recording (detection.PEAK_DTYPE array).
+        taps (np.ndarray): The taps of the recording (detection.PEAK_DTYPE array).
+        n_trials (int): Number of trials, None for the last trial with a peak.
+
+    Returns:
+        np.ndarray: The SYNCHRONY_DTYPE array, one entry per trial.
+    """
+    if n_trials is None:
+        n_trials = int(max(beats["trial"].max(initial=-1), taps["trial"].max(initial=-1))) + 1
+    return trial_synchrony(split_trials(beats, n_trials), split_trials(taps, n_trials), fs)
@@ -0,0 +1,160 @@
+import os
+import numpy as np
+
+from scipy.io import wavfile
+from praatio import textgrid
+
+# Group of each synthetic subject, in turn
+GROUPS = ("PWS", "PNS")
+
+# Condition folders, as parsed by manifest.parse_filepath
+CONDITIONS = ("Aperiodic", "PeriodicAlong")
+
+PERIODIC_IOI = 0.5           # Inter-onset interval of the periodic trains (in seconds)
+APERIODIC_IOI = (0.45, 1.0)  # Range of the inter-onset intervals of the aperiodic trains (in seconds)
+
+BEAT_FREQ = 1000       # Frequency of the beat tone (in Hz)
+BEAT_DURATION = 0.05   # Duration of a beat (in seconds)
+TAP_DURATION = 0.03    # Duration of the impulse of a tap (in seconds)
+TAP_NOISE = 0.01       # Standard deviation of the tap channel noise (full scale is 1)
+TAP_HUM = (50, 0.02)   # Frequency and amplitude of the mains hum picked up by the tap sensor
+BEAT_NOISE = 0.003     # Standard deviation of the beat channel noise
+
+ASYNCHRONY = {"PeriodicAlong": (-0.03, 0.04),  # Mean and deviation of tap - beat (in seconds):
+              "Aperiodic": (0.15, 0.06)}       # anticipation when periodic, reaction otherwise
+MISSED_TAP = 0.05      # Probability that a beat gets no tap
+EXTRA_TAP = 0.03       # Probability of an extra tap between two beats
+
+
+def make_trains(cond: str, trains_per_file: int, train_length: int, rng) -> tuple:
+    """
+    Draws the beat times of the trains of a recording and the intervals of its main tier.
+
+    Periodic recordings are split into contiguous "rep k" intervals, one per train, as in
+    Grp5. Aperiodic recordings have their trains in a single "train" interval.
+
+    Args:
+        cond (str): The condition of the recording.
+        trains_per_file (int): Number of trains of the recording.
+        train_length (int): Number of beats of each train.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        tuple: The beat times, the (start, end, label) intervals and the duration of the recording.
+    """
+    time = rng.uniform(1, 3)  # Silence before the first train
+    beats, intervals = [], []
+    for k in range(trains_per_file):
+        if cond == "PeriodicAlong":
+            iois = np.full(train_length - 1, PERIODIC_IOI)
+        else:
+            iois = rng.uniform(*APERIODIC_IOI, train_length - 1)
+        train = time + 0.3 + np.concatenate(([0], np.cumsum(iois)))
+        intervals.append((time, train[-1] + 0.5, f"rep {k + 1}"))
+        beats.append(train)
+        time = train[-1] + 0.5 + (0 if cond == "PeriodicAlong" else rng.uniform(1, 2))
+
+    if cond != "PeriodicAlong":
+        intervals = [(intervals[0][0], intervals[-1][1], "train")]
+    return np.concatenate(beats), intervals, time + 1
+
+
+def render_recording(beats: np.ndarray, cond: str, duration: float, fs: int, rng) -> np.ndarray:
+    """
+    Renders the stereo signal of a recording: beat tones on channel 0, noisy taps on channel 1.
+
+    Args:
+        beats (np.ndarray): The beat times (in seconds).
+        cond (str): The condition of the recording, which sets the tap asynchrony.
+        duration (float): The duration of the recording (in seconds).
+        fs (int): The sampling rate.
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        np.ndarray: A (samples, 2) int16 array.
+    """
+    n = int(duration * fs)
+    signal = np.empty((n, 2))
+    signal[:, 0] = rng.normal(0, BEAT_NOISE, n)
+    signal[:, 1] = rng.normal(0, TAP_NOISE, n) + TAP_HUM[1] * np.sin(2 * np.pi * TAP_HUM[0] * np.arange(n) / fs)
+
+    # Beats: tone bursts with a short attack and an exponential decay
+    t = np.arange(int(BEAT_DURATION * fs)) / fs
+    tone = 0.9 * np.sin(2 * np.pi * BEAT_FREQ * t) * np.minimum(t / 0.005, 1) * np.exp(-t / 0.02)
+    for beat in beats:
+        start = int(beat * fs)
+        signal[start:start + len(tone), 0] += tone[:n - start]
+
+    # Taps: one per beat unless missed, plus a few extra taps, as decaying noise bursts
+    mean, std = ASYNCHRONY[cond]
+    taps = beats[rng.random(len(beats)) >= MISSED_TAP]
+    taps = taps + rng.normal(mean, std, len(taps))
+    extra = beats[:-1][rng.random(len(beats) - 1) < EXTRA_TAP]
+    extra = extra + rng.uniform(0.1, 0.3, len(extra))  # Each extra tap at its own delay after its beat
+    t = np.arange(int(TAP_DURATION * fs)) / fs
+    for tap in np.concatenate((taps, extra)):
+        start = int(tap * fs)
+        if 0 <= start < n:
+            burst = rng.uniform(0.6, 1.2) * np.exp(-t / 0.005) * rng.normal(0, 1, len(t))
+            signal[start:start + len(t), 1] += burst[:n - start]
+
+    return np.round(np.clip(signal, -1, 32767 / 32768) * 32768).astype(np.int16)
+
+
+def write_textgrid(fname: str, intervals: list, duration: float) -> None:
+    """
+    Writes the 3-tier TextGrid of a recording, with empty Bips and Taps tiers.
+
+    Args:
+        fname (str): Name of the TextGrid file.
+        intervals (list): The (start, end, label) intervals of the main tier.
+        duration (float): The duration of the recording (in seconds).
+    """
+    tg = textgrid.Textgrid()
+    tg.addTier(textgrid.IntervalTier("Useful", intervals, 0, duration))
+    tg.addTier(textgrid.PointTier("Bips", [], 0, duration))
+    tg.addTier(textgrid.PointTier("Taps", [], 0, duration))
+    tg.save(fname, format="long_textgrid", includeBlankSpaces=True)
+
+
+def generate_corpus(out_dir: str, n_subjects: int = 4, files_per_condition: int = 3,
+                    trains_per_file: int = 4, train_length: int = 8, fs: int = 20000,
+                    seed: int = 0) -> list:
+    """
+    Generates a synthetic corpus with the Sxx-GRP/Condition/Sxx_NNNN-BaT layout of Grp5.
+
+    Subjects are numbered from 1 and alternate between the groups, every subject has the
+    same number of recordings in each condition.
+
+    Args:
+        out_dir (str): Directory in which the subject folders are created.
+        n_subjects (int): Number of subjects.
+        files_per_condition (int): Number of recordings per subject and condition.
+        trains_per_file (int): Number of trains per recording.
+        train_length (int): Number of beats per train.
+        fs (int): The sampling rate.
+        seed (int): Seed of the random generator, the corpus only depends on it and the settings.
+
+    Returns:
+        list: The file paths of the generated .wav files.
+    """
+    rng = np.random.default_rng(seed)
+    file_paths = []
+    for sbj in range(1, n_subjects + 1):
+        group = GROUPS[(sbj - 1) % len(GROUPS)]
+        fl = 0
+        for cond in CONDITIONS:
+            folder = os.path.join(out_dir, f"S{sbj:02d}-{group}", cond)
+            os.makedirs(folder, exist_ok=True)
+            for _ in range(files_per_condition):
+                fl += 1
+                base = os.path.join(folder, f"S{sbj:02d}_{fl:04d}-BaT")
+                beats, intervals, duration = make_trains(cond, trains_per_file, train_length, rng)
+                wavfile.write(base + ".wav", fs, render_recording(beats, cond, duration, fs, rng))
+                write_textgrid(base + ".TextGrid", intervals, duration)
+                file_paths.append(base + ".wav")
+    return file_paths
+
+
+if __name__ == "__main__":
+    generate_corpus("Synthetic")
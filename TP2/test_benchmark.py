@@ -0,0 +1,28 @@
+import os
+
+from benchmark import run_benchmark
+from synthetic import generate_corpus
+
+
+def snapshot(directory: str) -> dict:
+    """
+    Reads every file of a directory, by path relative to it.
+    """
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            file_path = os.path.join(root, name)
+            with open(file_path, "rb") as f:
+                files[os.path.relpath(file_path, directory)] = f.read()
+    return files
+
+
+def test_benchmark_leaves_the_corpus_untouched(tmp_path):
+    corpus = str(tmp_path / "corpus")
+    file_paths = generate_corpus(corpus, n_subjects=1, files_per_condition=1, trains_per_file=2)
+    before = snapshot(corpus)
+
+    results = run_benchmark(corpus)
+    assert results["files"] == len(file_paths) and results["failures"] == 0
+    assert results["beats_per_s"] > 0
+    assert snapshot(corpus) == before
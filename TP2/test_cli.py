@@ -0,0 +1,18 @@
+from cli import IMPORT_BUDGET, main, measure_import
+
+
+def test_batch_imports_leave_out_heavy_modules():
+    for module in IMPORT_BUDGET:
+        assert measure_import(module, runs=1)[1] == []
+
+
+def test_process_command_selects_recordings(monkeypatch):
+    import final_script
+
+    calls = []
+    monkeypatch.setattr(final_script, "process_data", lambda *args, **kwargs: calls.append((args, kwargs)) or [])
+    assert main(["process", "--data-dir", "Grp5", "--subjects", "13", "14", "--groups", "PWS", "--streaming"]) == 0
+    args, kwargs = calls[0]
+    assert args == (["datafile.txt"], "Grp5")
+    assert kwargs["select"] == {"groups": ["PWS"], "subjects": [13, 14]}
+    assert kwargs["streaming"] and not kwargs["multirate"] and kwargs["profile"] is None
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from coupling import couple_peaks, couple_trials
+from final_script import get_couples
+
+SEEDS = range(200)
+
+
+def random_train(rng, n_beats: int, periodic: bool, fs: int = 20000) -> tuple:
+    """
+    Builds sorted beat and tap sample indices with missing, doubled and spurious taps.
+    """
+    intervals = np.full(n_beats, int(0.5 * fs)) if periodic else rng.integers(int(0.3 * fs), int(1.2 * fs), n_beats)
+    beats = np.cumsum(intervals) + rng.integers(0, fs)
+    taps = beats + rng.normal(0.02 * fs, 0.08 * fs, n_beats).astype(np.int64)
+    taps = taps[rng.random(n_beats) > rng.uniform(0, 0.4)]                            # Missing taps
+    doubled = taps[rng.random(len(taps)) < 0.1] + rng.integers(1, int(0.15 * fs))     # Doubled taps
+    spurious = rng.integers(0, beats[-1] + fs, rng.integers(0, 4))                     # Random taps
+    taps = np.unique(np.concatenate((taps, doubled, spurious)))
+    return beats, taps[taps >= 0]
+
+
+def reference_last_in_window(b, t) -> dict:
+    """
+    The cond == 1 branch of get_couples, with the last beat checked before its (missing) next beat.
+    """
+    couples = {}
+    bips, taps = b.tolist(), t.tolist()
+    for n, bip in enumerate(bips):
+        next_bip = bips[n + 1] if n < len(bips) - 1 else None
+        for tap in taps:
+            if next_bip is not None and tap > next_bip - ((next_bip - bip) * 25 / 100):
+                break
+            elif next_bip is None and bip <= tap:
+                couples.update({n: tap})
+            elif next_bip is not None and bip <= tap < next_bip:
+                couples.update({n: tap})
+    return couples
+
+
+def as_dict(coupled) -> dict:
+    beat_nb, taps = coupled
+    return dict(zip(beat_nb.tolist(), taps.tolist()))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("periodic", [True, False])
+@pytest.mark.parametrize("cond", [2, "PeriodicAlong", "Aperiodic"])
+def test_first_free_matches_get_couples(seed, periodic, cond):
+    rng = np.random.default_rng(seed)
+    beats, taps = random_train(rng, int(rng.integers(1, 60)), periodic)
+    assert as_dict(couple_peaks(beats, taps, cond)) == get_couples(beats, taps, cond)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("periodic", [True, False])
+def test_last_in_window_matches_reference(seed, periodic):
+    rng = np.random.default_rng(seed)
+    beats, taps = random_train(rng, int(rng.integers(1, 60)), periodic)
+    assert as_dict(couple_peaks(beats, taps, 1)) == reference_last_in_window(beats, taps)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_crowded_train_matches_get_couples(seed):
+    # Many taps per beat exercise the used-up tap carried from one beat to the next
+    rng = np.random.default_rng(seed)
+    beats = np.unique(rng.integers(0, 400, rng.integers(1, 30)))
+    taps = np.unique(rng.integers(0, 450, rng.integers(0, 80)))
+    assert as_dict(couple_peaks(beats, taps, 2)) == get_couples(beats, taps, 2)
+
+
+@pytest.mark.parametrize("cond", [1, 2])
+def test_empty_inputs(cond):
+    empty = np.array([], dtype=np.int64)
+    for beats, taps in [(empty, empty), (np.array([10, 20]), empty), (empty, np.array([5, 15]))]:
+        assert as_dict(couple_peaks(beats, taps, cond)) == {}
+    assert as_dict(couple_peaks(np.array([10, 20]), np.array([]), 2)) == get_couples(np.array([10, 20]), np.array([]), 2)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("cond", [1, 2, "PeriodicAlong"])
+def test_trials_coupled_at_once_match_each_train(seed, cond):
+    # Trains of any length, empty ones included, coupled together as the references do one by one
+    rng = np.random.default_rng(seed)
+    empty = np.array([], dtype=np.int64)
+    beats_per_trial, taps_per_trial = [], []
+    for _ in range(rng.integers(0, 6)):
+        beats, taps = random_train(rng, int(rng.integers(1, 40)), rng.random() < 0.5)
+        beats_per_trial.append(beats if rng.random() > 0.1 else empty)
+        taps_per_trial.append(taps if rng.random() > 0.1 else empty)
+
+    expected = []
+    for t, (beats, taps) in enumerate(zip(beats_per_trial, taps_per_trial)):
+        if len(beats) == 0 or len(taps) == 0:
+            continue
+        couples = reference_last_in_window(beats, taps) if cond == 1 else get_couples(beats, taps, cond)
+        expected += [(t, n, beats[n], tap) for n, tap in sorted(couples.items())]
+    assert couple_trials(beats_per_trial, taps_per_trial, cond).tolist() == expected
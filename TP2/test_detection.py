@@ -0,0 +1,85 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from scipy.io import wavfile
+from praatio import textgrid
+from detection import TRIAL_DTYPE, detect_peaks, detect_peaks_multirate, detect_peaks_streaming
+from final_script import extractInfosFromTier, get_textGrid_path, without_blanks
+from profiling import StageTimer
+
+GRP5 = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Grp5", "**", "*.wav"),
+                        recursive=True))
+
+
+def read_trials(file_path: str) -> np.ndarray:
+    tg = textgrid.openTextgrid(get_textGrid_path(file_path), False)
+    return extractInfosFromTier(without_blanks(tg.getTier(tg.tierNames[0])))
+
+
+def random_recording(fname: str, rng, fs: int = 1000, n_trials: int = 4, trial: int = 3000) -> np.ndarray:
+    """
+    Writes a stereo recording of pulses and noise held over runs of samples, so that the
+    channels have plateaus and equal peaks, and returns its trials.
+    """
+    n = n_trials * trial + fs
+    density = rng.uniform(0.002, 0.3)  # Sparse or dense channels
+    channels = []
+    for level in (20, 6):  # Fewer levels, so more ties, on the taps
+        runs = rng.integers(1, 6, n)
+        values = rng.integers(0, level, n) * (rng.random(n) < density)
+        channels.append(np.repeat(values, runs)[:n] * (30000 // level))
+    wavfile.write(fname, fs, np.stack(channels, axis=1).astype(np.int16))
+    xmin = fs // 2 / fs + np.arange(n_trials) * trial / fs + rng.uniform(0, 0.2, n_trials)
+    return np.array(list(zip(xmin, xmin + rng.uniform(0.5, 1, n_trials) * trial / fs)), dtype=TRIAL_DTYPE)
+
+
+def assert_same_peaks(expected: tuple, result: tuple) -> None:
+    assert result[0] == expected[0]
+    for peaks, expected_peaks in zip(result[1:], expected[1:]):
+        np.testing.assert_array_equal(peaks, expected_peaks)
+
+
+@pytest.mark.parametrize("file_path", GRP5, ids=os.path.basename)
+def test_grp5_peaks_match_detect_peaks(file_path):
+    trials = read_trials(file_path)
+    expected = detect_peaks(file_path, trials)
+    assert_same_peaks(expected, detect_peaks_streaming(file_path, trials))
+    assert_same_peaks(expected, detect_peaks_streaming(file_path, trials, block_frames=1 << 14))
+    assert_same_peaks(expected, detect_peaks_multirate(file_path, trials))
+    assert_same_peaks(expected, detect_peaks_multirate(file_path, trials, factor=5))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_peaks_match_detect_peaks(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    fname = str(tmp_path / "random.wav")
+    trials = random_recording(fname, rng)
+    expected = detect_peaks(fname, trials)
+    for block_frames in (7, 64, 1000):
+        assert_same_peaks(expected, detect_peaks_streaming(fname, trials, block_frames))
+    for factor in (2, 3, 16):
+        assert_same_peaks(expected, detect_peaks_multirate(fname, trials, factor))
+
+
+@pytest.mark.parametrize("detect", [detect_peaks, detect_peaks_multirate, detect_peaks_streaming])
+def test_detectors_record_the_same_stages(detect):
+    file_path = GRP5[0]
+    timer = StageTimer()
+    detect(file_path, read_trials(file_path), timer=timer)
+    record = timer.record()
+    assert set(record["stages"]) == {"wav_decode", "find_peaks"}
+    assert all(seconds > 0 for seconds in record["stages"].values())
+    # The maxima scan reads the whole file, then the trials are read again
+    assert record["counts"]["bytes_read"] > os.path.getsize(file_path) - 100
+
+
+def test_nested_stage_is_left_out_of_the_outer_one():
+    timer = StageTimer()
+    with timer.stage("outer"):
+        with timer.stage("inner"):
+            sum(range(200000))
+    stages = timer.record()["stages"]
+    assert stages["inner"] > 0 and stages["outer"] < stages["inner"]
@@ -0,0 +1,107 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scipy.io import wavfile
+from praatio import textgrid
+from final_script import (CONDITIONS, DATAFILE_COLUMNS, SUBJECT_GROUPS, load_datafile, merge_tier_points,
+                          process_data, write_datafile)
+from synthetic import generate_corpus
+
+# Recording of the Grp5 corpus the test corpora are made of
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Grp5", "S14-PNS", "PeriodicAlong",
+                         "S14_0008-BaT.wav")
+
+
+def add_recording(file_path: str, fpath: str) -> None:
+    """
+    Copies a recording and its TextGrid to another path.
+    """
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    shutil.copy(file_path, fpath)
+    shutil.copy(os.path.splitext(file_path)[0] + ".TextGrid", os.path.splitext(fpath)[0] + ".TextGrid")
+
+
+def test_stray_recording_fails_alone(tmp_path):
+    corpus = str(tmp_path / "corpus")
+    add_recording(RECORDING, os.path.join(corpus, "S14-PNS", "PeriodicAlong", "S14_0008-BaT.wav"))
+    stray = os.path.join(corpus, "stray.wav")
+    add_recording(RECORDING, stray)
+
+    dtfname = str(tmp_path / "datafile.txt")
+    failures = process_data(dtfname, corpus)
+    assert [(file_path, type(e)) for file_path, e in failures] == [(stray, ValueError)]
+    assert set(load_datafile(dtfname)["Subject"]) == {14}
+
+
+def test_unknown_group_fails_alone_with_cache(tmp_path):
+    corpus = str(tmp_path / "corpus")
+    add_recording(RECORDING, os.path.join(corpus, "S14-PNS", "PeriodicAlong", "S14_0008-BaT.wav"))
+    unknown = os.path.join(corpus, "S41-XYZ", "Aperiodic", "S41_0001-BaT.wav")
+
+    dtfname, cache = str(tmp_path / "datafile.txt"), str(tmp_path / "cache.db")
+    synchrony = str(tmp_path / "synchrony.txt")
+    for _ in range(2):  # Processed, then from the cache, the unknown recording afresh as it is never cached
+        add_recording(RECORDING, unknown)
+        failures = process_data(dtfname, corpus, cache=cache, synchrony=synchrony)
+        assert [(file_path, type(e)) for file_path, e in failures] == [(unknown, KeyError)]
+        assert set(load_datafile(dtfname)["Subject"]) == {14}
+
+
+def test_synchrony_has_a_row_per_trial(tmp_path):
+    corpus = str(tmp_path / "corpus")
+    file_paths = generate_corpus(corpus, n_subjects=1, files_per_condition=1, trains_per_file=2)
+    # A last trial at the end of a recording, silenced so that it has no peak
+    tg_path = os.path.splitext(file_paths[-1])[0] + ".TextGrid"
+    tg = textgrid.openTextgrid(tg_path, False)
+    main = tg.getTier(tg.tierNames[0])
+    end = main.entries[-1].end
+    fs, signal = wavfile.read(file_paths[-1])
+    signal[int((end + 0.1) * fs):] = 0
+    wavfile.write(file_paths[-1], fs, signal)
+    tg.replaceTier(main.name, main.new(entries=[*main.entries, (end + 0.2, tg.maxTimestamp - 0.2, "empty")]))
+    tg.save(tg_path, format="long_textgrid", includeBlankSpaces=True)
+
+    synchrony, cache = str(tmp_path / "synchrony.txt"), str(tmp_path / "cache.db")
+    for _ in range(2):  # Processed, then from the cache
+        assert process_data(str(tmp_path / "datafile.txt"), corpus, cache=cache, synchrony=synchrony) == []
+        table = pd.read_table(synchrony, na_values="NaN")
+        assert table.groupby("File").size().tolist() == [1, 3]  # One aperiodic interval, two periodic trains and the empty trial
+        assert table["beats"].iloc[-1] == 0 and table["asynchrony"].isna().iloc[-1]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_merged_points_match_praatio_insert(seed):
+    # Times on a grid of centiseconds, so that new points fall on existing ones
+    rng = np.random.default_rng(seed)
+    existing = rng.choice(1000, rng.integers(0, 40), replace=False) / 100
+    tier = textgrid.PointTier("Taps", [(time, str(rng.choice(["1", "2", "x"]))) for time in existing], 0, 10)
+    times = (rng.integers(0, 1000, rng.integers(0, 60)) / 100).tolist()
+
+    expected = tier.new()
+    for time in times:
+        expected.insertEntry((time, ""), collisionMode="replace", collisionReportingMode="silence")
+    assert merge_tier_points(tier, times) == list(expected.entries)
+
+
+@pytest.mark.parametrize("n_rows", [0, 200])
+@pytest.mark.parametrize("ext", [".txt", ".npz", ".parquet", ".feather"])
+def test_datafile_formats_round_trip(tmp_path, ext, n_rows):
+    rng = np.random.default_rng(n_rows)
+    columns = {name: rng.integers(1, 100, n_rows).astype(dtype) for name, dtype in DATAFILE_COLUMNS.items()}
+    columns["Group"] = rng.choice(list(SUBJECT_GROUPS.values()), n_rows).astype(np.int8)
+    columns["Condition"] = rng.choice(list(CONDITIONS.values()), n_rows).astype(np.int8)
+    columns["BeatInstant"] = rng.uniform(0, 600, n_rows)
+    columns["TapInstant"] = columns["BeatInstant"] + rng.normal(0, 0.05, n_rows)
+
+    expected = pd.DataFrame(columns)
+    for column, mapping in (("Group", SUBJECT_GROUPS), ("Condition", CONDITIONS)):
+        names = {value: name for name, value in mapping.items()}
+        expected[column] = pd.Categorical([names[value] for value in columns[column]], categories=list(mapping))
+
+    dtfname = str(tmp_path / f"datafile{ext}")
+    write_datafile(dtfname, columns)
+    pd.testing.assert_frame_equal(load_datafile(dtfname), expected)
@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from scipy.io import wavfile
+from manifest import Manifest
+from synthetic import generate_corpus
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """
+    Four subjects (PWS and PNS in turn), two recordings per condition.
+    """
+    corpus = str(tmp_path / "corpus")
+    generate_corpus(corpus, n_subjects=4, files_per_condition=2, trains_per_file=1, train_length=4, fs=2000)
+    return corpus
+
+
+def names(recordings: list) -> set:
+    return {os.path.basename(recording.path) for recording in recordings}
+
+
+def test_refresh_indexes_only_what_changed(corpus, tmp_path):
+    index = Manifest(str(tmp_path / "manifest.db"))
+    assert index.refresh(corpus) == 16
+    assert index.refresh(corpus) == 0
+    index.close()
+
+    # A new manifest on the same database starts from the stored index
+    index = Manifest(str(tmp_path / "manifest.db"))
+    assert index.refresh(corpus) == 0
+
+    folder = os.path.join(corpus, "S01-PWS", "Aperiodic")
+    added = os.path.join(folder, "S01_0009-BaT.wav")
+    shutil.copy(os.path.join(folder, "S01_0001-BaT.wav"), added)
+    os.remove(os.path.join(folder, "S01_0002-BaT.wav"))
+    assert index.refresh(corpus) == 1
+    recordings = index.select(corpus, subjects=[1], conditions="Aperiodic")
+    assert names(recordings) == {"S01_0001-BaT.wav", "S01_0009-BaT.wav"}
+    assert len(index.select(corpus)) == 16
+
+    # Rewritten in place: its folder keeps its time, the size and time of the file change
+    rewritten = os.path.join(corpus, "S02-PNS", "PeriodicAlong", "S02_0003-BaT.wav")
+    mtime = os.stat(os.path.dirname(rewritten)).st_mtime_ns
+    wavfile.write(rewritten, 4000, np.zeros((10, 2), dtype=np.int16))
+    os.utime(rewritten, ns=(mtime + 10**9, mtime + 10**9))
+    assert os.stat(os.path.dirname(rewritten)).st_mtime_ns == mtime
+    assert index.refresh(corpus) == 1
+    recording, = index.select(corpus, subjects=[2], files=[3])
+    assert (recording.fs, recording.n_frames) == (4000, 10)
+    assert index.refresh(corpus) == 0
+    index.close()
+
+
+def test_select_filters(corpus):
+    os.remove(os.path.join(corpus, "S03-PWS", "Aperiodic", "S03_0001-BaT.TextGrid"))
+    shutil.copy(os.path.join(corpus, "S03-PWS", "Aperiodic", "S03_0001-BaT.wav"), os.path.join(corpus, "stray.wav"))
+    index = Manifest()
+    assert index.refresh(corpus) == 17
+
+    assert len(index.select(corpus)) == 17
+    assert {r.subject for r in index.select(corpus, groups="PWS")} == {1, 3}
+    assert {r.group for r in index.select(corpus, subjects=range(2, 5))} == {"PWS", "PNS"}
+    assert {r.condition for r in index.select(corpus, conditions=["PeriodicAlong"])} == {"PeriodicAlong"}
+    assert len(index.select(corpus, groups="PNS", conditions="Aperiodic", files=[1, 2])) == 4
+    assert names(index.select(corpus, textgrid=False)) == {"S03_0001-BaT.wav", "stray.wav"}
+    assert names(index.select(corpus, subjects=[3], textgrid=True)) == {"S03_0002-BaT.wav", "S03_0003-BaT.wav",
+                                                                        "S03_0004-BaT.wav"}
+    # The recording outside the corpus layout is listed, but matches no query on the layout
+    stray, = [r for r in index.select(corpus) if r.subject is None]
+    assert stray.path == os.path.join(corpus, "stray.wav") and stray.fs == 2000
+    assert "stray.wav" not in names(index.select(corpus, files=range(100)))
+
+    # A TextGrid added back is seen when its folder is refreshed
+    shutil.copy(os.path.join(corpus, "S03-PWS", "Aperiodic", "S03_0002-BaT.TextGrid"),
+                os.path.join(corpus, "S03-PWS", "Aperiodic", "S03_0001-BaT.TextGrid"))
+    assert index.refresh(corpus) == 0
+    assert names(index.select(corpus, textgrid=False)) == {"stray.wav"}
+    index.close()
@@ -0,0 +1,187 @@
+import os
+import struct
+import numpy as np
+
+from typing import NamedTuple
+
+# Format tags of the fmt chunk
+WAVE_FORMAT_PCM = 0x0001         # Integer PCM samples
+WAVE_FORMAT_IEEE_FLOAT = 0x0003  # Floating point samples
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE  # Actual format given by the sub-format GUID
+
+# Number of frames read at once when a file has to be scanned
+BLOCK_FRAMES = 1 << 18
+
+
+class WavLayout(NamedTuple):
+    """
+    Describes where and how the samples are stored in a .wav file.
+    """
+    fs: int            # Sampling rate (in Hz)
+    channels: int      # Number of interleaved channels
+    sampwidth: int     # Bytes per sample
+    is_float: bool     # True for IEEE float samples, False for integer PCM
+    big_endian: bool   # True for RIFX files
+    data_offset: int   # Offset of the first sample in the file (in bytes)
+    n_frames: int      # Number of complete frames in the data chunk
+
+    @property
+    def dtype(self):
+        """
+        The numpy dtype of one sample, or None when it has no numpy equivalent (24-bit PCM).
+        """
+        order = '>' if self.big_endian else '<'
+        if self.is_float:
+            return np.dtype(f"{order}f{self.sampwidth}") if self.sampwidth in (4, 8) else None
+        if self.sampwidth == 1:
+            return np.dtype('u1')  # 8-bit PCM is unsigned
+        return np.dtype(f"{order}i{self.sampwidth}") if self.sampwidth in (2, 4, 8) else None
+
+
+def read_layout(file_path: str) -> WavLayout:
+    """
+    Reads the header of a .wav file without touching its samples.
+
+    The data chunk size is clamped to the file size, so a file whose writer died
+    before updating the header still exposes the frames it contains.
+
+    Args:
+        file_path (str): The file path of the .wav file.
+
+    Returns:
+        WavLayout: The layout of the samples in the file.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b'RIFF', b'RIFX') or riff[8:12] != b'WAVE':
+            raise ValueError(f"{file_path} is not a RIFF/RIFX WAVE file")
+        order = '>' if riff[:4] == b'RIFX' else '<'
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{file_path} has no data chunk")
+            chunk_id, chunk_size = header[:4], struct.unpack(f"{order}I", header[4:])[0]
+
+            if chunk_id == b'fmt ':
+                body = f.read(chunk_size)
+                tag, channels, fs, _, block_align, bits = struct.unpack(f"{order}HHIIHH", body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack(f"{order}H", body[24:26])[0]  # First bytes of the sub-format GUID
+                if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                    raise ValueError(f"{file_path}: unsupported wav format tag {tag:#x}")
+                fmt = (fs, channels, block_align // channels, tag == WAVE_FORMAT_IEEE_FLOAT)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{file_path}: data chunk found before fmt chunk")
+                fs, channels, sampwidth, is_float = fmt
+                data_offset = f.tell()
+                data_size = min(chunk_size, file_size - data_offset)
+                return WavLayout(fs, channels, sampwidth, is_float, order == '>',
+                                 data_offset, data_size // (sampwidth * channels))
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)  # Chunks are word aligned
+
+
+def map_frames(file_path: str, layout: WavLayout = None):
+    """
+    Memory-maps the samples of a .wav file.
+
+    Slicing the returned array gives views on the file, nothing is read until the
+    samples are actually used.
+
+    Args:
+        file_path (str): The file path of the .wav file.
+        layout (WavLayout): The layout of the file, read from its header if None.
+
+    Returns:
+        np.memmap: A (frames, channels) array, or None when the sample format cannot
+                   be viewed directly (24-bit PCM) or the file holds no frame.
+    """
+    if layout is None:
+        layout = read_layout(file_path)
+    if layout.dtype is None or layout.n_frames == 0:
+        return None
+    return np.memmap(file_path, dtype=layout.dtype, mode='r', offset=layout.data_offset,
+                     shape=(layout.n_frames, layout.channels))
+
+
+def open_wav(file_path: str) -> tuple:
+    """
+    Opens a .wav file for window-only access.
+
+    Args:
+        file_path (str): The file path of the .wav file.
+
+    Returns:
+        tuple: The layout of the file and its memory-mapped frames (see map_frames).
+    """
+    layout = read_layout(file_path)
+    return layout, map_frames(file_path, layout)
+
+
+def read_window(file_path: str, layout: WavLayout, start: int, stop: int, frames=None) -> np.ndarray:
+    """
+    Gets the frames between two sample indices, with the bounds handled like a slice.
+
+    When the frames are memory-mapped the window is a zero-copy view, otherwise only the
+    window is read and decoded. 24-bit samples are returned left-justified in int32, as
+    scipy.io.wavfile.read does.
+
+    Args:
+        file_path (str): The file path of the .wav file.
+        layout (WavLayout): The layout of the file.
+        start (int): Index of the first frame of the window.
+        stop (int): Index after the last frame of the window.
+        frames (np.memmap): The memory-mapped frames of the file, if available.
+
+    Returns:
+        np.ndarray: A (stop - start, channels) array.
+    """
+    if frames is not None:
+        return frames[start:stop]
+
+    start, stop, _ = slice(start, stop).indices(layout.n_frames)
+    count = max(stop - start, 0)
+    frame_size = layout.sampwidth * layout.channels
+    with open(file_path, 'rb') as f:
+        f.seek(layout.data_offset + start * frame_size)
+        raw = f.read(count * frame_size)
+
+    if layout.dtype is not None:
+        return np.frombuffer(raw, dtype=layout.dtype).reshape(count, layout.channels)
+
+    # 24-bit PCM: place the three bytes of each sample in the upper bytes of an int32
+    packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+    samples = np.zeros((len(packed), 4), dtype=np.uint8)
+    if layout.big_endian:
+        samples[:, :3] = packed
+        samples = samples.view('>i4')
+    else:
+        samples[:, 1:] = packed
+        samples = samples.view('<i4')
+    return samples.astype(np.int32).reshape(count, layout.channels)
+
+
+def channel_max(file_path: str, layout: WavLayout, frames=None, block_frames: int = BLOCK_FRAMES) -> np.ndarray:
+    """
+    Computes the maximum of each channel, scanning the file block by block.
+
+    Args:
+        file_path (str): The file path of the .wav file.
+        layout (WavLayout): The layout of the file.
+        frames (np.memmap): The memory-mapped frames of the file, if available.
+        block_frames (int): Number of frames scanned at once.
+
+    Returns:
+        np.ndarray: The maximum sample value of each channel.
+    """
+    maxima = None
+    for start in range(0, layout.n_frames, block_frames):
+        block_max = read_window(file_path, layout, start, start + block_frames, frames).max(axis=0)
+        maxima = block_max if maxima is None else np.maximum(maxima, block_max)
+    if maxima is None:
+        raise ValueError(f"{file_path} contains no frame")
+    return maxima
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+# Cells the tap table is summarised in, the coarser tables are merged from these
+CELL_KEYS = ("Group", "Pattern", "Sujet")
+
+# Variables summarised in every cell
+VARIABLES = ("IRI", "RT")
+
+# Maximum number of centroids of a quantile sketch, the quantiles are exact up to this many values.
+# Past it, the rank of a quantile among the values is off by at most count / SKETCH_SIZE
+SKETCH_SIZE = 1024
+
+# Rows read at once from a table file
+CHUNK_SIZE = 100000
+
+# Quantiles of the descriptive tables
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def tap_number(table: pd.DataFrame) -> pd.Series:
+    """
+    Number of a tap over the trains of a file, as the TapNb column of tp3.ipynb.
+    """
+    return table["BeatNumber"] + 8 * (table["TrainNumber"] + 1)
+
+
+def compress(values: np.ndarray, weights: np.ndarray, size: int) -> tuple:
+    """
+    Reduces sorted weighted values to at most size centroids of about equal weight.
+
+    Args:
+        values (np.ndarray): The sorted values.
+        weights (np.ndarray): Their weights.
+        size (int): Maximum number of centroids.
+
+    Returns:
+        tuple: The values and weights of the centroids, the input itself when it is small enough.
+    """
+    if len(values) <= size:
+        return values, weights
+    total = np.cumsum(weights)
+    bucket = np.minimum(((total - weights / 2) / total[-1] * size).astype(np.int64), size - 1)
+    edges = np.flatnonzero(np.diff(bucket, prepend=-1))
+    sums = np.add.reduceat(weights, edges)
+    return np.add.reduceat(values * weights, edges) / sums, sums
+
+
+class Summary:
+    """
+    Mergeable summary of a variable in a cell: count, mean and sum of squared deviations
+    (Welford), extrema, a quantile sketch, and the co-moments with the tap number used
+    for the regression lines of tp3.ipynb.
+
+    Two summaries merge into the summary of the union of their values (Chan et al.), so a
+    table is summarised chunk by chunk, or site by site, in memory bounded by the cells.
+    """
+
+    __slots__ = ("count", "mean", "m2", "minimum", "maximum", "x_mean", "x_m2", "c_xy", "centroids", "weights")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = self.m2 = self.x_mean = self.x_m2 = self.c_xy = 0.0
+        self.minimum, self.maximum = np.inf, -np.inf
+        self.centroids, self.weights = np.empty(0), np.empty(0)
+
+    @classmethod
+    def of(cls, values: np.ndarray, taps: np.ndarray, size: int = SKETCH_SIZE) -> "Summary":
+        """
+        Summarises values, with the tap number of each of them.
+
+        Args:
+            values (np.ndarray): The values, without missing values.
+            taps (np.ndarray): The tap number of every value.
+            size (int): Maximum number of centroids of the quantile sketch.
+
+        Returns:
+            Summary: The summary.
+        """
+        summary = cls()
+        if len(values) == 0:
+            return summary
+        summary.count = len(values)
+        summary.mean, summary.x_mean = values.mean(), taps.mean()
+        dy, dx = values - summary.mean, taps - summary.x_mean
+        summary.m2, summary.x_m2, summary.c_xy = dy @ dy, dx @ dx, dx @ dy
+        summary.minimum, summary.maximum = values.min(), values.max()
+        summary.centroids, summary.weights = compress(np.sort(values), np.ones(len(values)), size)
+        return summary
+
+    def merge(self, other: "Summary", size: int = SKETCH_SIZE) -> "Summary":
+        """
+        Adds the values of another summary to this one.
+
+        Args:
+            other (Summary): The summary to add.
+            size (int): Maximum number of centroids of the quantile sketch.
+
+        Returns:
+            Summary: This summary.
+        """
+        if other.count == 0:
+            return self
+        n = self.count + other.count
+        dy, dx = other.mean - self.mean, other.x_mean - self.x_mean
+        share = self.count * other.count / n
+        self.m2 += other.m2 + dy * dy * share
+        self.x_m2 += other.x_m2 + dx * dx * share
+        self.c_xy += other.c_xy + dx * dy * share
+        self.mean += dy * other.count / n
+        self.x_mean += dx * other.count / n
+        self.count = n
+        self.minimum, self.maximum = min(self.minimum, other.minimum), max(self.maximum, other.maximum)
+        values = np.concatenate([self.centroids, other.centroids])
+        order = np.argsort(values, kind="stable")
+        self.centroids, self.weights = compress(values[order], np.concatenate([self.weights, other.weights])[order], size)
+        return self
+
+    def std(self, ddof: int = 1) -> float:
+        return np.sqrt(self.m2 / (self.count - ddof)) if self.count > ddof else np.nan
+
+    def quantile(self, q: float) -> float:
+        """
+        Quantile of the values, interpolated as pandas does, exact while the sketch holds every value.
+
+        Once the values are compressed, the rank of the quantile among them is off by at most
+        count / size for a sketch of size centroids, however many summaries were merged.
+        """
+        if self.count == 0:
+            return np.nan
+        positions = np.cumsum(self.weights) - self.weights / 2
+        value = np.interp(0.5 + q * (self.count - 1), positions, self.centroids)
+        return min(max(value, self.minimum), self.maximum)
+
+    def slope(self) -> float:
+        """
+        Slope of the least squares line of the values over the tap number, as lmplot draws.
+        """
+        return self.c_xy / self.x_m2 if self.x_m2 > 0 else np.nan
+
+
+class TapAggregator:
+    """
+    Streams tap tables (Res-AllTaps) into the summaries of every Group x Pattern x Sujet cell.
+
+    The tables are read by chunks and every chunk is dropped once summarised, so the memory
+    only depends on the number of cells. The descriptive tables of tp3.ipynb are merged from
+    the cells without reading the rows again.
+    """
+
+    def __init__(self, variables=VARIABLES, keys=CELL_KEYS, sketch_size: int = SKETCH_SIZE):
+        """
+        Args:
+            variables (iterable): The variables to summarise.
+            keys (iterable): The columns defining the cells.
+            sketch_size (int): Maximum number of centroids of the quantile sketches.
+        """
+        self.variables = list(variables)
+        self.keys = list(keys)
+        self.sketch_size = sketch_size
+        self.cells = {variable: {} for variable in self.variables}
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """
+        Adds the rows of a chunk of the tap table.
+
+        Args:
+            chunk (pd.DataFrame): Rows of the table, missing values as NaN.
+        """
+        self.rows += len(chunk)
+        if {"BeatNumber", "TrainNumber"} <= set(chunk.columns):
+            taps = tap_number(chunk).to_numpy(dtype=np.float64)
+        else:
+            taps = np.zeros(len(chunk))  # Res-StdIRI has a row per train, no regression line
+        codes, keys = pd.MultiIndex.from_frame(chunk[self.keys]).factorize()
+        keys = [tuple(key) for key in keys]
+        for variable in self.variables:
+            values = chunk[variable].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            index = codes[valid]
+            order = np.argsort(index, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(index, minlength=len(keys)))])
+            cell_values, cell_taps = values[valid][order], taps[valid][order]
+            summaries = self.cells[variable]
+            for key, start, stop in zip(keys, bounds[:-1], bounds[1:]):
+                if start == stop:
+                    continue
+                summary = Summary.of(cell_values[start:stop], cell_taps[start:stop], self.sketch_size)
+                if key in summaries:
+                    summaries[key].merge(summary, self.sketch_size)
+                else:
+                    summaries[key] = summary
+
+    def merge(self, other: "TapAggregator") -> "TapAggregator":
+        """
+        Adds the cells of another aggregator (another site or another part of a table).
+
+        Args:
+            other (TapAggregator): An aggregator with the same variables and keys.
+
+        Returns:
+            TapAggregator: This aggregator.
+        """
+        self.rows += other.rows
+        for variable in self.variables:
+            summaries = self.cells[variable]
+            for key, summary in other.cells[variable].items():
+                if key in summaries:
+                    summaries[key].merge(summary, self.sketch_size)
+                else:
+                    summaries[key] = Summary().merge(summary, self.sketch_size)
+        return self
+
+    def summaries(self, variable: str, by=("Group", "Pattern")) -> dict:
+        """
+        Merges the cells into coarser cells.
+
+        Args:
+            variable (str): The variable.
+            by (iterable): The keys to keep, a subset of the keys of the cells, () for a single cell.
+
+        Returns:
+            dict: The summary of every coarser cell, keyed by the tuple of its keys.
+        """
+        positions = [self.keys.index(key) for key in by]
+        merged = {}
+        for key, summary in sorted(self.cells[variable].items()):
+            coarse = tuple(key[i] for i in positions)
+            merged.setdefault(coarse, Summary()).merge(summary, self.sketch_size)
+        return merged
+
+    def table(self, variable: str, by=("Group", "Pattern")) -> pd.DataFrame:
+        """
+        Descriptive table of a variable: count, mean, standard deviation, extrema, quantiles
+        and regression line over the tap number of every cell.
+
+        Args:
+            variable (str): The variable.
+            by (iterable): The keys of the rows of the table (see summaries).
+
+        Returns:
+            pd.DataFrame: One row per cell, indexed by its keys.
+        """
+        rows = []
+        for key, s in self.summaries(variable, by).items():
+            slope = s.slope()
+            rows.append((*key, s.count, s.mean, s.std(), s.minimum, *(s.quantile(q) for q in QUANTILES),
+                         s.maximum, slope, s.mean - slope * s.x_mean))
+        quantiles = [f"{100 * q:g}%" for q in QUANTILES]
+        columns = list(by) + ["count", "mean", "std", "min"] + quantiles + ["max", "slope", "intercept"]
+        table = pd.DataFrame(rows, columns=columns)
+        return table.set_index(list(by)) if by else table
+
+
+def aggregate_files(fnames, variables=VARIABLES, keys=CELL_KEYS, chunksize: int = CHUNK_SIZE,
+                    sketch_size: int = SKETCH_SIZE) -> TapAggregator:
+    """
+    Summarises one or more tap table files, such as the Res-AllTaps.txt of several sites.
+
+    Args:
+        fnames (str or iterable): The tab separated tables.
+        variables (iterable): The variables to summarise.
+        keys (iterable): The columns defining the cells.
+        chunksize (int): Number of rows read at once.
+        sketch_size (int): Maximum number of centroids of the quantile sketches.
+
+    Returns:
+        TapAggregator: The summaries of the cells.
+    """
+    aggregator = TapAggregator(variables, keys, sketch_size)
+    for fname in [fnames] if isinstance(fnames, str) else fnames:
+        for chunk in pd.read_table(fname, na_values="NaN", chunksize=chunksize):
+            aggregator.update(chunk)
+    return aggregator
+
+
+if __name__ == "__main__":
+    taps = aggregate_files("Res-AllTaps.txt")
+    print(taps.table("IRI").loc[(slice(None), 1), :].to_string())
+    print(taps.table("RT").to_string())
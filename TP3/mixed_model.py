@@ -0,0 +1,297 @@
+import itertools
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from scipy import optimize, stats
+
+# Seed of the quasi Monte Carlo integration of the adjusted p-values, so that they are repeatable
+# as after set.seed in R
+CONTRAST_SEED = 0
+
+
+def design_matrix(table: pd.DataFrame, factors, interaction: bool = True) -> tuple:
+    """
+    Builds the fixed effects design matrix of factors with treatment contrasts, as R does
+    for a formula such as RT ~ Pattern * Group with factors made of the columns.
+
+    The first level (in sorted order) of every factor is the reference, so the columns of
+    Pattern * Group are (Intercept), Pattern2, Group1 and Pattern2:Group1.
+
+    Args:
+        table (pd.DataFrame): The table, with a column per factor.
+        factors (iterable): The names of the factors.
+        interaction (bool): Whether to add the interactions of the factors (*) or not (+).
+
+    Returns:
+        tuple: The (rows, coefficients) design matrix and the names of its columns.
+    """
+    columns, names = [np.ones(len(table))], ["(Intercept)"]
+    dummies = []
+    for factor in factors:
+        values = table[factor].to_numpy()
+        levels = np.unique(values)
+        dummies.append([(f"{factor}{level}", (values == level).astype(np.float64)) for level in levels[1:]])
+    terms = [[term] for term in itertools.chain.from_iterable(dummies)]
+    if interaction:
+        for order in range(2, len(dummies) + 1):
+            for combination in itertools.combinations(dummies, order):
+                terms.extend(itertools.product(*combination))
+    for term in terms:
+        names.append(":".join(name for name, _ in term))
+        columns.append(np.prod([column for _, column in term], axis=0))
+    return np.column_stack(columns), names
+
+
+class MixedModel:
+    """
+    Linear mixed model with random intercepts and slopes per subject, as lme4 and nlme fit
+    lmer(RT ~ Pattern * Group + (1 + Pattern | Sujet)) or lme(..., random=~Pattern|Sujet).
+
+    The random effects design matrix is built as a sparse matrix and only its cross products
+    are kept, so the rows are read once. The random effects of a subject only involve its own
+    rows, so the sparse Cholesky factor of the penalised system is block diagonal: every
+    evaluation of the profiled deviance updates the small factor of each subject as a batch,
+    and costs nothing per row. Without a grouping factor the model is the linear model of lm.
+    """
+
+    def __init__(self, table: pd.DataFrame, outcome: str, factors=("Pattern", "Group"), interaction: bool = True,
+                 slopes=(), group: str = "Sujet"):
+        """
+        Args:
+            table (pd.DataFrame): The table (Res-AllTaps or Res-StdIRI), the rows where the
+                                  outcome is missing are left out as na.exclude does.
+            outcome (str): The column to model (RT, IRI, stdIRI).
+            factors (iterable): The fixed effects factors.
+            interaction (bool): Whether the fixed effects have the interactions of the factors (*) or not (+).
+            slopes (iterable): Names of the design matrix columns with a random slope per subject (Pattern2).
+            group (str): The grouping column of the random effects, None for a linear model without them.
+        """
+        table = table[table[outcome].notna()]
+        self.X, self.names = design_matrix(table, factors, interaction)
+        self.y = table[outcome].to_numpy(dtype=np.float64)
+        self.n, self.p = self.X.shape
+        self.slopes = list(slopes)
+        self.group = group
+
+        # Sufficient statistics, every later step only uses these
+        self.XtX = self.X.T @ self.X
+        self.Xty = self.X.T @ self.y
+        self.yty = self.y @ self.y
+        if group is None:
+            self.levels, self.q = np.empty(0), 0
+        else:
+            self.levels, subject = np.unique(table[group].to_numpy(), return_inverse=True)
+            self.q = 1 + len(self.slopes)
+            Z = self.random_design(subject)
+            m = len(self.levels)
+            ZtZ = (Z.T @ Z).tocoo()
+            self.ZtZ = np.zeros((m, self.q, self.q))
+            self.ZtZ[ZtZ.row // self.q, ZtZ.row % self.q, ZtZ.col % self.q] = ZtZ.data
+            self.ZtX = np.asarray(Z.T @ self.X).reshape(m, self.q, self.p)
+            self.Zty = np.asarray(Z.T @ self.y).reshape(m, self.q, 1)
+        self.method = None
+
+    def random_design(self, subject: np.ndarray) -> sp.csr_matrix:
+        """
+        Builds the sparse random effects design matrix, q columns per subject (intercept then slopes).
+
+        Args:
+            subject (np.ndarray): Index of the subject of every row.
+
+        Returns:
+            sp.csr_matrix: The (rows, subjects * q) matrix with q non-zero values per row.
+        """
+        slopes = [self.X[:, self.names.index(name)] for name in self.slopes]
+        values = np.column_stack([np.ones(self.n)] + slopes)
+        columns = subject[:, None] * self.q + np.arange(self.q)
+        indptr = np.arange(self.n + 1) * self.q
+        return sp.csr_matrix((values.ravel(), columns.ravel(), indptr), shape=(self.n, len(self.levels) * self.q))
+
+    def _lower(self, theta: np.ndarray) -> np.ndarray:
+        """
+        Relative covariance factor of the random effects of a subject, theta holding its
+        lower triangle column by column as in lme4.
+        """
+        T = np.zeros((self.q, self.q))
+        rows, columns = np.triu_indices(self.q)
+        T[columns, rows] = theta  # Column by column
+        return T
+
+    def _solve(self, theta: np.ndarray) -> dict:
+        """
+        Solves the penalised least squares problem for the covariance parameters theta.
+        """
+        XtX, Xty, r2, logdet_z = self.XtX, self.Xty, self.yty, 0.0
+        out = {}
+        if self.q:
+            T = self._lower(theta)
+            M = T.T @ self.ZtZ @ T + np.eye(self.q)  # (subjects, q, q) blocks of L L'
+            L = np.linalg.cholesky(M)
+            RZX = np.linalg.solve(L, T.T @ self.ZtX)
+            cu = np.linalg.solve(L, T.T @ self.Zty)
+            XtX = XtX - np.einsum("mqi,mqj->ij", RZX, RZX)
+            Xty = Xty - np.einsum("mqi,mq->i", RZX, cu[..., 0])
+            r2 = r2 - np.sum(cu ** 2)
+            logdet_z = 2 * np.sum(np.log(np.diagonal(L, axis1=1, axis2=2)))
+            out.update(T=T, L=L, RZX=RZX, cu=cu)
+        LX = np.linalg.cholesky(XtX)
+        cb = np.linalg.solve(LX, Xty)
+        out.update(LX=LX, beta=np.linalg.solve(LX.T, cb), r2=r2 - cb @ cb, logdet_z=logdet_z,
+                   logdet_x=2 * np.sum(np.log(np.diag(LX))))
+        return out
+
+    def deviance(self, theta: np.ndarray, method: str = "REML") -> float:
+        """
+        Profiled deviance (-2 log likelihood) of the model for covariance parameters theta.
+
+        Args:
+            theta (np.ndarray): Lower triangle of the relative covariance factor, column by column.
+            method (str): "REML" for the REML criterion, "ML" for the deviance.
+
+        Returns:
+            float: The deviance, the variance of the residuals profiled out.
+        """
+        s = self._solve(theta)
+        if method == "ML":
+            return s["logdet_z"] + self.n * (1 + np.log(2 * np.pi * s["r2"] / self.n))
+        dof = self.n - self.p
+        return s["logdet_z"] + s["logdet_x"] + dof * (1 + np.log(2 * np.pi * s["r2"] / dof))
+
+    def fit(self, method: str = "REML"):
+        """
+        Fits the model by minimising the profiled deviance over the covariance parameters.
+
+        Args:
+            method (str): "REML" as lmer does by default, or "ML" as the lme calls of tp3.R.
+
+        Returns:
+            MixedModel: The fitted model.
+
+        Raises:
+            ValueError: If the method is neither REML nor ML.
+        """
+        if method not in ("REML", "ML"):
+            raise ValueError(f"unknown method {method}")
+        self.method = method
+        n_theta = self.q * (self.q + 1) // 2
+        theta = np.zeros(n_theta)
+        if self.q:
+            # The deviance is flat in a zero diagonal of the factor, so the factor is first searched
+            # with the logarithms of its diagonal as nlme does, then refined up to the boundary
+            rows, columns = np.triu_indices(self.q)
+            diagonal = rows == columns
+            log_cholesky = optimize.minimize(lambda z: self.deviance(np.where(diagonal, np.exp(z), z), method),
+                                             np.zeros(n_theta), method="BFGS")
+            start = np.where(diagonal, np.exp(log_cholesky.x), log_cholesky.x)
+            bounds = [(0, None) if d else (None, None) for d in diagonal]
+            theta = optimize.minimize(self.deviance, start, args=(method,), method="L-BFGS-B", bounds=bounds).x
+        self.theta = theta
+        s = self._solve(theta)
+        dof = self.n if method == "ML" else self.n - self.p
+        self.sigma2 = s["r2"] / dof
+        self.coef = pd.Series(s["beta"], index=self.names)
+        LX_inv = np.linalg.inv(s["LX"])
+        self.cov = pd.DataFrame(self.sigma2 * LX_inv.T @ LX_inv, index=self.names, columns=self.names)
+        self.deviance_ = self.deviance(theta, method)
+        if self.q:
+            # Conditional modes of the random effects of every subject
+            T = s["T"]
+            u = np.linalg.solve(np.swapaxes(s["L"], 1, 2), s["cu"] - s["RZX"] @ s["beta"][:, None])
+            self.random_cov = self.sigma2 * T @ T.T
+            random_names = ["(Intercept)"] + self.slopes
+            self.random_effects = pd.DataFrame((T @ u)[..., 0], index=self.levels, columns=random_names)
+        return self
+
+    @property
+    def n_parameters(self) -> int:
+        """
+        Number of parameters of the model: coefficients, covariances of the random effects and residual variance.
+        """
+        return self.p + self.q * (self.q + 1) // 2 + 1
+
+    @property
+    def loglik(self) -> float:
+        return -self.deviance_ / 2
+
+    @property
+    def aic(self) -> float:
+        return self.deviance_ + 2 * self.n_parameters
+
+    @property
+    def bic(self) -> float:
+        n = self.n if self.method == "ML" else self.n - self.p  # As nlme counts REML observations
+        return self.deviance_ + self.n_parameters * np.log(n)
+
+    def contrast(self, K, names=None, adjust: str = "single-step") -> pd.DataFrame:
+        """
+        Tests linear combinations of the coefficients equal to 0, as summary(glht(M, linfct=K)).
+
+        Mixed models are tested with z statistics and linear models with t statistics on
+        their residual degrees of freedom, as multcomp does. The adjusted p-values integrate
+        the joint distribution of the statistics with CONTRAST_SEED.
+
+        Args:
+            K: The (contrasts, coefficients) matrix, or a single row, such as [0, 0, 1, 1].
+            names (iterable): Names of the contrasts, None to number them.
+            adjust (str): "single-step" for the p-values adjusted over the contrasts as glht
+                          does by default, "none" for the p-values of each contrast alone.
+
+        Returns:
+            pd.DataFrame: Estimate, standard error, statistic and p-value of every contrast.
+        """
+        K = np.atleast_2d(np.asarray(K, dtype=np.float64))
+        estimate = K @ self.coef.to_numpy()
+        cov = K @ self.cov.to_numpy() @ K.T
+        se = np.sqrt(np.diag(cov))
+        statistic = estimate / se
+        df = None if self.q else self.n - self.p
+        distribution = stats.norm if df is None else stats.t(df)
+        if adjust == "none" or len(K) == 1:
+            p_values = 2 * distribution.sf(np.abs(statistic))
+        else:
+            corr = cov / np.outer(se, se)
+            p_values = np.empty(len(K))
+            for i, z in enumerate(np.abs(statistic)):
+                limit = np.full(len(K), z)
+                if df is None:
+                    joint = stats.multivariate_normal(cov=corr, seed=CONTRAST_SEED)
+                else:
+                    joint = stats.multivariate_t(shape=corr, df=df, seed=CONTRAST_SEED)
+                inside = joint.cdf(limit, lower_limit=-limit)
+                p_values[i] = 1 - inside
+        index = list(names) if names is not None else [f"{i + 1} == 0" for i in range(len(K))]
+        label = "z" if df is None else "t"
+        return pd.DataFrame({"Estimate": estimate, "Std. Error": se, f"{label} value": statistic,
+                             f"Pr(>|{label}|)": p_values}, index=index)
+
+
+def likelihood_ratio(small: MixedModel, large: MixedModel) -> dict:
+    """
+    Compares two nested models fitted with the same method, as anova(M1, M2) does.
+
+    Models with different fixed effects are only compared when they were fitted by ML.
+
+    Args:
+        small (MixedModel): The model with fewer parameters.
+        large (MixedModel): The model it is nested in.
+
+    Returns:
+        dict: The statistic, degrees of freedom and p-value of the test.
+
+    Raises:
+        ValueError: If the models were fitted with different methods, or by REML with different fixed effects.
+    """
+    if small.method != large.method or (small.method == "REML" and small.names != large.names):
+        raise ValueError("models with different fixed effects must both be fitted by ML")
+    statistic = max(small.deviance_ - large.deviance_, 0.0)
+    df = large.n_parameters - small.n_parameters
+    return {"L.Ratio": statistic, "df": df, "p-value": stats.chi2.sf(statistic, df)}
+
+
+if __name__ == "__main__":
+    data = pd.read_table("Res-AllTaps.txt", na_values="NaN")
+    model = MixedModel(data, "RT").fit("ML")  # lme(RT ~ Pattern * Group, random=~1|Sujet, method="ML")
+    print(model.coef.to_string())
+    print(model.contrast([[0, 0, 1, 0], [0, 0, 1, 1]], names=["PWS-PNS | Periodic", "PWS-PNS | Aperiodic"]))
+    print(model.contrast([[0, 1, 0, 0], [0, 1, 0, 1]], names=["Aperiodic-Periodic | PNS", "Aperiodic-Periodic | PWS"]))
@@ -0,0 +1,312 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+
+# The simulated taps go through the detection distance and the coupling of TP2, with the beat
+# grids of its synthetic corpus. Run this script from the folder above TP3 (python -m TP3.power)
+# so that the TP2 package is found
+from TP2.coupling import couple_trains
+from TP2.detection import TAPS_PEAKS
+from TP2.synthetic import APERIODIC_IOI, PERIODIC_IOI
+from TP3.res_tables import PATTERN_CODES, TP3_DIR
+
+# Tables the tapping model is fitted to by default
+ALL_TAPS = os.path.join(TP3_DIR, "Res-AllTaps.txt")
+STD_IRI = os.path.join(TP3_DIR, "Res-StdIRI.txt")
+
+# Shortest reaction to an aperiodic beat kept in the tables (in seconds), the earlier taps have no RT
+REACTION_FLOOR = 0.1
+
+# Sampling rate the beats and taps are placed at, as in the recordings
+FS = 20000
+
+# Standard deviation of the detected beats around their grid (in seconds)
+BEAT_JITTER = 0.001
+
+# Replications simulated from one seed, the replications are split across the workers by chunks
+CHUNK_SIZE = 100
+
+# Group tests of a replication: the outcome and the pattern (TP2 condition) it is tested in
+TESTS = {"RT Periodic": ("RT", "PeriodicAlong"),
+         "RT Aperiodic": ("RT", "Aperiodic"),
+         "stdIRI": ("stdIRI", "PeriodicAlong")}
+
+
+class Design(NamedTuple):
+    """
+    Trains recorded per subject, as in Grp5: periodic trains of 8 beats and aperiodic trains of 33 beats.
+    """
+    periodic_trains: int = 12
+    aperiodic_trains: int = 3
+    periodic_length: int = 8
+    aperiodic_length: int = 33
+
+    def minutes(self) -> float:
+        """
+        Tapping time of a subject (in minutes), from the mean inter-onset interval of each pattern.
+        """
+        aperiodic_ioi = sum(APERIODIC_IOI) / 2
+        return (self.periodic_trains * (self.periodic_length - 1) * PERIODIC_IOI
+                + self.aperiodic_trains * (self.aperiodic_length - 1) * aperiodic_ioi) / 60
+
+
+class Tapping(NamedTuple):
+    """
+    Taps of the PNS in one pattern (see fit_tapping). The asynchrony (tap - beat, in seconds)
+    is normal, or with a floor, the floor plus a log-normal reaction time: the location and
+    the deviations are then those of the logarithm of the asynchrony minus the floor.
+    """
+    location: float           # Mean asynchrony of the subjects
+    subject_sd: float         # Deviation of the mean asynchrony of a subject around the mean of its group
+    train_sd: float           # Deviation of the mean asynchrony of a train around the one of its subject
+    tap_sd: float             # Deviation of a tap around the asynchrony of its train
+    jitter_sd: float          # Deviation of the logarithm of tap_sd from one subject to another
+    missed: float             # Probability that a beat gets no tap
+    extra: float              # Probability of an extra tap between two beats
+    floor: float = None       # Shortest asynchrony kept in the tables, None for a normal asynchrony
+
+    def asynchrony(self, deviation: np.ndarray) -> np.ndarray:
+        """
+        Asynchrony (in seconds) of taps deviating from the location of the pattern.
+        """
+        if self.floor is None:
+            return self.location + deviation
+        return self.floor + np.exp(self.location + deviation)
+
+
+def fit_tapping(all_taps=ALL_TAPS, std_iri=STD_IRI) -> dict:
+    """
+    Fits the tapping of every pattern to the TP3 tables.
+
+    The aperiodic taps are reactions to the beats, kept from REACTION_FLOOR on, so they are
+    fitted on the logarithm of the RT minus this floor. The location is the mean of the PNS,
+    the deviations of the subjects are taken around the mean of their group. In the periodic
+    pattern the deviation of the taps comes from the stdIRI (an IRI is the difference of two
+    taps), in the aperiodic one from the RT of the trains. The deviation of the subjects
+    includes their sampling noise, so it is an upper bound. The missed taps are the beats
+    without RT, the extra taps the periodic IRI off the inter-onset interval by more than the
+    coupling window (25 %), as a tap between two beats splits an interval.
+
+    Args:
+        all_taps: The Res-AllTaps table, or the name of its file.
+        std_iri: The Res-StdIRI table, or the name of its file.
+
+    Returns:
+        dict: The Tapping of every TP2 condition (PeriodicAlong, Aperiodic).
+    """
+    if not isinstance(all_taps, pd.DataFrame):
+        all_taps = pd.read_table(all_taps, na_values="NaN")
+    if not isinstance(std_iri, pd.DataFrame):
+        std_iri = pd.read_table(std_iri, na_values="NaN")
+
+    def around_groups(values: pd.Series, groups: pd.Series) -> pd.Series:
+        return values - values.groupby(groups).transform("mean")
+
+    iri = all_taps.loc[all_taps["Pattern"] == PATTERN_CODES["PeriodicAlong"], "IRI"].dropna()
+    extra = np.mean(np.abs(iri - PERIODIC_IOI) > PERIODIC_IOI / 4)
+    fitted = {}
+    for cond, code in PATTERN_CODES.items():
+        taps = all_taps[all_taps["Pattern"] == code].copy()
+        floor = None if cond == "PeriodicAlong" else REACTION_FLOOR
+        if floor is not None:
+            taps["RT"] = np.log(taps["RT"].where(taps["RT"] > floor) - floor)
+        subjects = taps.groupby("Sujet").agg(group=("Group", "first"), rt=("RT", "mean"))
+        trains = taps.groupby(["Sujet", "File", "TrainNumber"])["RT"].agg(["mean", "var", "count"]).reset_index()
+        if floor is None:
+            periodic = std_iri.dropna(subset=["stdIRI"])
+            tap_var = np.mean(periodic.loc[periodic["Group"] == 0, "stdIRI"] ** 2) / 2
+            subject_sd = periodic.groupby("Sujet").agg(group=("Group", "first"), sd=("stdIRI", "mean"))
+        else:
+            tap_var = np.mean(trains.loc[trains["Sujet"].map(subjects["group"]) == 0, "var"])
+            subject_sd = trains.groupby("Sujet").agg(sd=("var", "mean"))
+            subject_sd["group"], subject_sd["sd"] = subjects["group"], np.sqrt(subject_sd["sd"])
+        train_offsets = trains["mean"] - trains["Sujet"].map(subjects["rt"])
+        fitted[cond] = Tapping(
+            location=subjects.loc[subjects["group"] == 0, "rt"].mean(),
+            subject_sd=around_groups(subjects["rt"], subjects["group"]).std(),
+            train_sd=np.sqrt(max(np.var(train_offsets, ddof=1) - tap_var / trains["count"].mean(), 0)),
+            tap_sd=np.sqrt(tap_var),
+            jitter_sd=around_groups(np.log(subject_sd["sd"]), subject_sd["group"]).std(),
+            missed=all_taps.loc[all_taps["Pattern"] == code, "RT"].isna().mean(),
+            extra=extra,
+            floor=floor)
+    return fitted
+
+
+class Effects(NamedTuple):
+    """
+    Differences of the PWS from the PNS in the simulated taps.
+    """
+    rt: float = 0.02       # Added to the asynchrony of the PWS in both patterns (in seconds)
+    jitter: float = 1.3    # Factor of the deviation of the taps of the PWS, which raises their stdIRI
+
+
+def simulate_pattern(rng, cond: str, n_per_group: int, n_trains: int, length: int, tapping: Tapping,
+                     effects: Effects, replications: int) -> dict:
+    """
+    Simulates the trains of one pattern for every subject of several replications and
+    derives their RT and stdIRI as res_tables does from the coupled beats and taps.
+
+    A tap follows its beat by the asynchrony of its subject and of its train, with a
+    deviation drawn for every subject (see Tapping). Some beats get no tap, a few extra taps
+    fall between the beats and the taps stop an inter-onset interval after the last beat,
+    then the later of two taps closer than the TAPS_PEAKS distance is dropped, as the
+    detection keeps a single peak. The beats and taps of all the trains are coupled at once
+    by coupling.couple_trains, given the condition name as process_file gives it, so they
+    are paired by the same rule, and the RT under the floor of the pattern are dropped as
+    in the tables.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        cond (str): The TP2 condition (PeriodicAlong or Aperiodic).
+        n_per_group (int): Number of subjects of each group, the PNS then the PWS.
+        n_trains (int): Number of trains of every subject.
+        length (int): Number of beats of every train.
+        tapping (Tapping): The taps of the PNS in this pattern.
+        effects (Effects): The differences of the PWS.
+        replications (int): Number of replications.
+
+    Returns:
+        dict: The (replications, subjects) mean RT and mean stdIRI (NaN for an aperiodic pattern) of every subject.
+    """
+    shape = (replications, 2 * n_per_group, n_trains, length)
+    pws = (np.arange(2 * n_per_group) >= n_per_group)[None, :, None, None]
+    if cond == "PeriodicAlong":
+        iois = np.full(shape[:-1] + (length - 1,), PERIODIC_IOI)
+    else:
+        iois = rng.uniform(*APERIODIC_IOI, shape[:-1] + (length - 1,))
+    grid = 1.0 + np.concatenate([np.zeros(shape[:-1] + (1,)), np.cumsum(iois, axis=-1)], axis=-1)
+    beats = grid + rng.normal(0, BEAT_JITTER, shape)
+
+    subject = rng.normal(0, tapping.subject_sd, shape[:2])[..., None, None]
+    train = rng.normal(0, tapping.train_sd, shape[:3])[..., None]
+    log_sd = rng.normal(-tapping.jitter_sd ** 2 / 2, tapping.jitter_sd, shape[:2])[..., None, None]  # Mean sd kept
+    tap_sd = tapping.tap_sd * np.exp(log_sd) * np.where(pws, effects.jitter, 1)
+    taps = grid + tapping.asynchrony(subject + train + rng.normal(0, 1, shape) * tap_sd) + effects.rt * pws
+    extra = grid[..., :-1] + rng.random(iois.shape) * iois
+    # The recording of a train stops the longest inter-onset interval after its last beat
+    end = grid[..., -1:] + (PERIODIC_IOI if cond == "PeriodicAlong" else APERIODIC_IOI[1])
+
+    # Taps of every train, sorted, missed and late taps dropped and extra taps added
+    n_trains_total = np.prod(shape[:-1])
+    train_index = np.broadcast_to(np.arange(n_trains_total).reshape(shape[:-1] + (1,)), shape)
+    tapped = (rng.random(shape) >= tapping.missed) & (taps < end)
+    added = rng.random(extra.shape) < tapping.extra
+    tap_train = np.concatenate([train_index[tapped], train_index[..., :-1][added]])
+    tap_samples = np.rint(np.concatenate([taps[tapped], extra[added]]) * FS).astype(np.int64)
+    order = np.lexsort((tap_samples, tap_train))
+    tap_train, tap_samples = tap_train[order], tap_samples[order]
+    too_close = np.zeros(len(tap_samples), dtype=bool)
+    too_close[1:] = (tap_train[1:] == tap_train[:-1]) & (np.diff(tap_samples) < TAPS_PEAKS["distance"] * FS)
+    tap_train, tap_samples = tap_train[~too_close], tap_samples[~too_close]
+
+    beat_samples = np.rint(beats * FS).astype(np.int64).ravel()
+    beat_index, coupled_taps = couple_trains(beat_samples, np.full(n_trains_total, length),
+                                             tap_samples, np.bincount(tap_train, minlength=n_trains_total), cond)
+
+    # Tap of every beat, NaN without one, then the RT and IRI of res_tables
+    tap_times = np.full(beat_samples.shape, np.nan)
+    tap_times[beat_index] = coupled_taps / FS
+    tap_times = tap_times.reshape(shape)
+    rt = tap_times - beat_samples.reshape(shape) / FS
+    if tapping.floor is not None:
+        rt[rt < tapping.floor] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # Subjects or trains without any tap
+        subject_rt = np.nanmean(rt, axis=(2, 3))
+        if cond == "PeriodicAlong":
+            iri = np.diff(tap_times, axis=-1)
+            std_iri = np.where(np.sum(~np.isnan(iri), axis=-1) >= 2, np.nanstd(iri, axis=-1, ddof=1), np.nan)
+            subject_std_iri = np.nanmean(std_iri, axis=2)
+        else:
+            subject_std_iri = np.full(shape[:2], np.nan)
+    return {"RT": subject_rt, "stdIRI": subject_std_iri}
+
+
+def welch_test(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Two-sided Welch t-tests of the rows of two arrays, missing values left out.
+
+    Args:
+        a (np.ndarray): The (replications, subjects) values of the first group.
+        b (np.ndarray): The (replications, subjects) values of the second group.
+
+    Returns:
+        np.ndarray: The p-value of every replication.
+    """
+    na, nb = np.sum(~np.isnan(a), axis=1), np.sum(~np.isnan(b), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        va, vb = np.nanvar(a, axis=1, ddof=1) / na, np.nanvar(b, axis=1, ddof=1) / nb
+        t = (np.nanmean(b, axis=1) - np.nanmean(a, axis=1)) / np.sqrt(va + vb)
+        df = (va + vb) ** 2 / (va ** 2 / (na - 1) + vb ** 2 / (nb - 1))
+    return 2 * stats.t.sf(np.abs(t), df)
+
+
+def _simulate_chunk(seed, size: int, n_per_group: int, design: Design, tapping: dict, effects: Effects) -> np.ndarray:
+    """
+    p-values of the TESTS in size replications of a study with n_per_group subjects per group.
+    """
+    rng = np.random.default_rng(seed)
+    patterns = {"PeriodicAlong": simulate_pattern(rng, "PeriodicAlong", n_per_group, design.periodic_trains,
+                                                  design.periodic_length, tapping["PeriodicAlong"], effects, size),
+                "Aperiodic": simulate_pattern(rng, "Aperiodic", n_per_group, design.aperiodic_trains,
+                                              design.aperiodic_length, tapping["Aperiodic"], effects, size)}
+    p_values = []
+    for outcome, cond in TESTS.values():
+        values = patterns[cond][outcome]
+        p_values.append(welch_test(values[:, :n_per_group], values[:, n_per_group:]))
+    return np.column_stack(p_values)
+
+
+def power_curve(sample_sizes, effects: Effects = Effects(), design: Design = Design(), tapping: dict = None,
+                replications: int = 1000, alpha: float = 0.05, seed: int = 0, workers: int = None) -> pd.DataFrame:
+    """
+    Estimates the power of the group tests of TP3 for several numbers of subjects.
+
+    Every replication simulates a study, couples its beats and taps, derives the RT and
+    stdIRI of every subject, and tests the PWS against the PNS with Welch t-tests on the
+    subject means (the subjects are the units, as the random intercepts of tp3.R make them).
+    The replications are simulated as batches of arrays, split across worker processes
+    by chunks with their own seeds, so the curves only depend on the seed.
+
+    Args:
+        sample_sizes (iterable): Numbers of subjects per group.
+        effects (Effects): The differences of the PWS.
+        design (Design): The trains recorded per subject.
+        tapping (dict): The Tapping of every TP2 condition, None to fit it to the tables of this folder.
+        replications (int): Number of simulated studies per sample size.
+        alpha (float): Significance level of the tests.
+        seed (int): Seed of the simulations.
+        workers (int): Number of worker processes, 1 to run in this process, None for one per processor.
+
+    Returns:
+        pd.DataFrame: One row per sample size with the tapping minutes of the study and the power of every test.
+    """
+    sample_sizes = list(sample_sizes)
+    tapping = fit_tapping() if tapping is None else tapping
+    sizes = [min(CHUNK_SIZE, replications - start) for start in range(0, replications, CHUNK_SIZE)]
+    seeds = [seed_sequence.spawn(len(sizes)) for seed_sequence in np.random.SeedSequence(seed).spawn(len(sample_sizes))]
+    jobs = [(chunk_seed, size, n, design, tapping, effects)
+            for n, chunk_seeds in zip(sample_sizes, seeds) for chunk_seed, size in zip(chunk_seeds, sizes)]
+    if workers is not None and workers <= 1:
+        results = [_simulate_chunk(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_simulate_chunk, *job) for job in jobs]
+            results = [future.result() for future in futures]
+
+    rows = []
+    for i, n in enumerate(sample_sizes):
+        p_values = np.concatenate(results[i * len(sizes):(i + 1) * len(sizes)])
+        rows.append([n, 2 * n * design.minutes(), *np.mean(p_values < alpha, axis=0)])
+    return pd.DataFrame(rows, columns=["n_per_group", "minutes", *TESTS])
+
+
+if __name__ == "__main__":
+    print(power_curve(range(5, 45, 5)).to_string(index=False))
@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import pandas as pd
+
+# The data file of TP2 is read with its own loader, in any of its formats. Run this script
+# from the folder above TP3 (python -m TP3.res_tables) so that the TP2 package is found
+from TP2.final_script import load_datafile
+
+# Folder of this script, where the tables are
+TP3_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Columns of the tables, in the order tp3.R and tp3.ipynb read them
+ALLTAPS_COLUMNS = ["Sujet", "Group", "Severity", "SSI", "Music", "Pattern", "File", "TrainNumber",
+                   "BeatNumber", "IRI", "RT"]
+STDIRI_COLUMNS = ["Sujet", "Group", "Severity", "SSI", "Music", "File", "TrainNumber", "stdIRI"]
+
+# Subject information that is not in the TP2 data file
+SUBJECT_COLUMNS = ["Severity", "SSI", "Music"]
+
+# TP3 codes of the TP2 groups and conditions
+GROUP_CODES = {"PNS": 0, "PWS": 1}
+PATTERN_CODES = {"PeriodicAlong": 1, "Aperiodic": 2}
+
+# Pattern whose trains are paced, the only one with inter-response intervals
+PERIODIC = PATTERN_CODES["PeriodicAlong"]
+
+# Columns identifying a train in the tables
+TRAIN_KEYS = ["Sujet", "Pattern", "File", "TrainNumber"]
+
+
+def load_subjects(subjects) -> pd.DataFrame:
+    """
+    Reads the subject information (Severity, SSI, Music) of every subject.
+
+    Args:
+        subjects: A tab separated file with a Sujet column and the SUBJECT_COLUMNS, one or
+                  more rows per subject (an existing Res-AllTaps.txt works), or a DataFrame
+                  with these columns.
+
+    Returns:
+        pd.DataFrame: One row per subject, indexed by Sujet, the first row of each subject is kept.
+    """
+    table = subjects if isinstance(subjects, pd.DataFrame) else pd.read_table(subjects, na_values="NaN")
+    return table.drop_duplicates("Sujet").set_index("Sujet")[SUBJECT_COLUMNS]
+
+
+def all_taps_table(data: pd.DataFrame, subjects=None) -> pd.DataFrame:
+    """
+    Builds the Res-AllTaps table, one row per beat, from a TP2 data file.
+
+    The TP2 data file only holds the beats coupled with a tap, so the beats missing
+    before the last coupled beat of a train are added back with no tap. Files are
+    numbered from 1 within each subject and pattern, in the order of their TP2 number.
+    RT is the tap instant minus the beat instant. IRI is the interval between the tap
+    of the beat and the tap of the previous beat of the train, for periodic trains only.
+
+    Args:
+        data (pd.DataFrame): The TP2 data file, as read by final_script.load_datafile.
+        subjects: The subject information (see load_subjects), None to leave it missing.
+
+    Returns:
+        pd.DataFrame: The table with the ALLTAPS_COLUMNS, ordered by subject, pattern, file, train and beat.
+    """
+    couples = pd.DataFrame({
+        "Sujet": data["Subject"].to_numpy(),
+        "Group": data["Group"].map(GROUP_CODES).astype(np.int64).to_numpy(),
+        "Pattern": data["Condition"].map(PATTERN_CODES).astype(np.int64).to_numpy(),
+        "TP2File": data["File"].to_numpy(),
+        "TrainNumber": data["Train"].to_numpy(),
+        "BeatNumber": data["BeatNb"].to_numpy(),
+        "RT": (data["TapInstant"] - data["BeatInstant"]).to_numpy(),
+        "Tap": data["TapInstant"].to_numpy()})
+    couples["File"] = couples.groupby(["Sujet", "Pattern"])["TP2File"].rank(method="dense").astype(np.int64)
+
+    # Every beat from 1 to the last coupled beat of each train
+    trains = couples.groupby(TRAIN_KEYS, sort=True).agg(Group=("Group", "first"), last=("BeatNumber", "max"))
+    trains = trains.reset_index()
+    lengths = trains["last"].to_numpy()
+    beats = trains.loc[trains.index.repeat(lengths), TRAIN_KEYS + ["Group"]].reset_index(drop=True)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    beats["BeatNumber"] = np.arange(len(beats)) - starts + 1
+    table = beats.merge(couples[TRAIN_KEYS + ["BeatNumber", "RT", "Tap"]], on=TRAIN_KEYS + ["BeatNumber"], how="left")
+
+    # Beats follow each other within a train, the first beat of a train has no previous tap
+    tap = table["Tap"].to_numpy()
+    iri = np.full(len(table), np.nan)
+    iri[1:] = tap[1:] - tap[:-1]
+    iri[table["BeatNumber"].to_numpy() == 1] = np.nan
+    iri[table["Pattern"].to_numpy() != PERIODIC] = np.nan
+    table["IRI"] = iri
+
+    info = load_subjects(subjects) if subjects is not None else pd.DataFrame(columns=SUBJECT_COLUMNS, dtype=float)
+    for column in SUBJECT_COLUMNS:
+        table[column] = table["Sujet"].map(info[column]).astype(float)
+    return table[ALLTAPS_COLUMNS]
+
+
+def std_iri_table(all_taps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds the Res-StdIRI table, the standard deviation of the IRIs of every periodic train.
+
+    Args:
+        all_taps (pd.DataFrame): The Res-AllTaps table (see all_taps_table).
+
+    Returns:
+        pd.DataFrame: The table with the STDIRI_COLUMNS, one row per periodic train, NaN
+                      when the train has less than two IRIs.
+    """
+    periodic = all_taps[all_taps["Pattern"] == PERIODIC]
+    keys = STDIRI_COLUMNS[:-1]
+    table = periodic.groupby(keys, sort=True, dropna=False)["IRI"].std(ddof=1)
+    return table.rename("stdIRI").reset_index().sort_values(["Sujet", "File", "TrainNumber"], kind="stable")
+
+
+def format_column(values, trim: bool) -> np.ndarray:
+    """
+    Formats a column with 6 decimals, missing values as NaN.
+
+    Args:
+        values: The values of the column.
+        trim (bool): Remove the trailing zeros and point (0.538500 gives 0.5385, 2.000000 gives 2).
+
+    Returns:
+        np.ndarray: The formatted values.
+    """
+    values = np.asarray(values, dtype=np.float64) + 0.0  # -0.0 is written as 0
+    text = np.char.mod("%.6f", values)
+    if trim:
+        text = np.char.rstrip(np.char.rstrip(text, "0"), ".")
+        text[text == "-0"] = "0"
+    text[np.isnan(values)] = "NaN"
+    return text
+
+
+def write_table(fname: str, table: pd.DataFrame, trim: bool) -> None:
+    """
+    Writes a table as tab separated lines with CRLF line endings, as the TP3 tables are.
+
+    Args:
+        fname (str): Name of the file.
+        table (pd.DataFrame): The table.
+        trim (bool): Remove the trailing zeros of the values (Res-AllTaps) or not (Res-StdIRI).
+    """
+    columns = [format_column(table[name], trim) for name in table.columns]
+    lines = ["\t".join(table.columns)] + ["\t".join(row) for row in zip(*columns)]
+    with open(fname, "w", newline="") as f:
+        f.write("\r\n".join(lines))
+
+
+def generate_tables(datafile: str = os.path.join(TP3_DIR, "..", "TP2", "datafile.txt"), out_dir: str = TP3_DIR,
+                    subjects=None) -> tuple:
+    """
+    Regenerates Res-AllTaps.txt and Res-StdIRI.txt from a TP2 data file.
+
+    Args:
+        datafile (str): The TP2 data file, in any format written by final_script.write_datafile.
+        out_dir (str): Directory of the tables.
+        subjects: The subject information (see load_subjects), None to leave it missing.
+
+    Returns:
+        tuple: The Res-AllTaps and Res-StdIRI tables.
+    """
+    all_taps = all_taps_table(load_datafile(datafile), subjects)
+    std_iri = std_iri_table(all_taps)
+    write_table(os.path.join(out_dir, "Res-AllTaps.txt"), all_taps, trim=True)
+    write_table(os.path.join(out_dir, "Res-StdIRI.txt"), std_iri, trim=False)
+    return all_taps, std_iri
+
+
+if __name__ == "__main__":
+    generate_tables()
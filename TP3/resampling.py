@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Cells of the design: Group (rows, 0 = PNS, 1 = PWS) by Pattern (columns, 1 = periodic, 2 = aperiodic)
+GROUPS = (0, 1)
+PATTERNS = (1, 2)
+
+# Contrasts between the cell means: weights of the cells and the resampling that tests them.
+# Contrasts involving the groups permute the group of the subjects, contrasts between the
+# patterns of a group swap the patterns within the subjects.
+CONTRASTS = {"PWS-PNS | Periodic":        ([[-1, 0], [1, 0]], "group"),
+             "PWS-PNS | Aperiodic":       ([[0, -1], [0, 1]], "group"),
+             "Aperiodic-Periodic | PNS":  ([[-1, 1], [0, 0]], "pattern"),
+             "Aperiodic-Periodic | PWS":  ([[0, 0], [-1, 1]], "pattern"),
+             "Group x Pattern":           ([[1, -1], [-1, 1]], "group")}
+
+# Number of resamples drawn from one seed, the resamples are split across the workers by chunks
+CHUNK_SIZE = 2000
+
+
+def subject_cells(table: pd.DataFrame, outcome: str) -> tuple:
+    """
+    Reduces a Res-AllTaps table to the sum and count of an outcome per subject and pattern.
+
+    Every resample only recombines these per-subject totals, so the subjects (Sujet) are
+    resampled as whole clusters.
+
+    Args:
+        table (pd.DataFrame): The Res-AllTaps table.
+        outcome (str): The column to compare (IRI or RT), missing values are left out.
+
+    Returns:
+        tuple: The subjects, their group, and the (subjects, patterns) sums and counts.
+    """
+    valid = table[table[outcome].notna() & table["Pattern"].isin(PATTERNS)]
+    subjects = np.unique(table["Sujet"].to_numpy())
+    groups = table.groupby("Sujet")["Group"].first().reindex(subjects).to_numpy()
+    rows = np.searchsorted(subjects, valid["Sujet"].to_numpy())
+    cols = np.searchsorted(PATTERNS, valid["Pattern"].to_numpy())
+    sums = np.zeros((len(subjects), len(PATTERNS)))
+    counts = np.zeros((len(subjects), len(PATTERNS)))
+    np.add.at(sums, (rows, cols), valid[outcome].to_numpy(dtype=np.float64))
+    np.add.at(counts, (rows, cols), 1)
+    return subjects, groups, sums, counts
+
+
+def cell_means(sums: np.ndarray, counts: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """
+    Means of every Group x Pattern cell over the taps of the subjects of each group.
+
+    Args:
+        sums (np.ndarray): The (subjects, patterns) sums, or a (resamples, subjects, patterns) batch.
+        counts (np.ndarray): The counts, with the same shape.
+        groups (np.ndarray): The group of each subject, (subjects,) or (resamples, subjects).
+
+    Returns:
+        np.ndarray: The (groups, patterns) means, with a leading resample axis for a batch, NaN for an empty cell.
+    """
+    member = np.stack([groups == g for g in GROUPS], axis=-2).astype(np.float64)  # (..., groups, subjects)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (member @ sums) / (member @ counts)
+
+
+def contrast_weights(contrasts: dict = CONTRASTS) -> np.ndarray:
+    """
+    Stacks the cell weights of contrasts into a (contrasts, groups, patterns) array.
+    """
+    return np.array([weights for weights, _ in contrasts.values()], dtype=np.float64)
+
+
+def contrast_values(weights: np.ndarray, means: np.ndarray) -> np.ndarray:
+    """
+    Values of contrasts over cell means, the cells a contrast does not weight are left out
+    (the aperiodic cells have no IRI).
+
+    Args:
+        weights (np.ndarray): The (contrasts, groups, patterns) weights (see contrast_weights).
+        means (np.ndarray): The (groups, patterns) cell means, with leading resample axes for a batch.
+
+    Returns:
+        np.ndarray: The value of every contrast, along the last axis.
+    """
+    terms = np.where(weights != 0, weights * means[..., None, :, :], 0.0)
+    return terms.sum(axis=(-2, -1))
+
+
+def _bootstrap_chunk(seed, size: int, sums, counts, groups) -> np.ndarray:
+    """
+    Cell means of size bootstrap resamples, the subjects of each group drawn with replacement.
+    """
+    rng = np.random.default_rng(seed)
+    batch_sums = np.zeros((size, len(GROUPS), len(PATTERNS)))
+    batch_counts = np.zeros((size, len(GROUPS), len(PATTERNS)))
+    for g in GROUPS:
+        members = np.flatnonzero(groups == g)
+        if len(members) == 0:
+            continue
+        draws = members[rng.integers(0, len(members), size=(size, len(members)))]  # Index matrix
+        batch_sums[:, g] = sums[draws].sum(axis=1)
+        batch_counts[:, g] = counts[draws].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return batch_sums / batch_counts
+
+
+def _permutation_chunk(seed, size: int, sums, counts, groups, scheme: str) -> np.ndarray:
+    """
+    Cell means of size resamples under the null hypothesis of a scheme: the groups of the
+    subjects permuted ("group") or the patterns of each subject swapped at random ("pattern").
+    """
+    rng = np.random.default_rng(seed)
+    if scheme == "group":
+        permuted = rng.permuted(np.broadcast_to(groups, (size, len(groups))), axis=1)
+        return cell_means(sums, counts, permuted)
+    swap = rng.random((size, len(groups), 1)) < 0.5
+    swapped_sums = np.where(swap, sums[:, ::-1], sums)
+    swapped_counts = np.where(swap, counts[:, ::-1], counts)
+    return cell_means(swapped_sums, swapped_counts, groups)
+
+
+def _run_chunks(task, args: tuple, n_resamples: int, seed_sequence, workers: int) -> np.ndarray:
+    """
+    Runs task(seed, size, *args) over chunks of CHUNK_SIZE resamples and stacks their results.
+
+    Every chunk gets its own child seed, so the resamples do not depend on the number of workers.
+    """
+    sizes = [min(CHUNK_SIZE, n_resamples - start) for start in range(0, n_resamples, CHUNK_SIZE)]
+    seeds = seed_sequence.spawn(len(sizes))
+    if workers is not None and workers <= 1:
+        results = [task(seed, size, *args) for seed, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(task, seed, size, *args) for seed, size in zip(seeds, sizes)]
+            results = [future.result() for future in futures]
+    return np.concatenate(results) if results else np.empty((0, len(GROUPS), len(PATTERNS)))
+
+
+def group_pattern_contrasts(table: pd.DataFrame, outcome: str = "RT", n_resamples: int = 10000,
+                            seed: int = 0, workers: int = None, alpha: float = 0.05,
+                            contrasts: dict = CONTRASTS) -> pd.DataFrame:
+    """
+    Tests Group x Pattern contrasts of an outcome with subject-clustered resampling.
+
+    The confidence intervals are percentile intervals of a bootstrap that draws the subjects
+    of each group with replacement. The p-values are two-sided permutation p-values, from
+    resamples where the groups of the subjects are permuted, or where the patterns of each
+    subject are swapped for the contrasts within a group. The resamples are drawn as batches
+    of index matrices, split across worker processes by chunks with their own seeds, so the
+    results only depend on the seed.
+
+    Args:
+        table (pd.DataFrame): The Res-AllTaps table.
+        outcome (str): The column to compare (IRI or RT).
+        n_resamples (int): Number of bootstrap resamples, and of permutation resamples.
+        seed (int): Seed of the resamples.
+        workers (int): Number of worker processes, 1 to run in this process, None for one per processor.
+        alpha (float): The intervals have a 1 - alpha coverage.
+        contrasts (dict): The contrasts to test, as in CONTRASTS.
+
+    Returns:
+        pd.DataFrame: One row per contrast with its estimate, confidence interval and p-value.
+    """
+    _, groups, sums, counts = subject_cells(table, outcome)
+    weights = contrast_weights(contrasts)
+    estimates = contrast_values(weights, cell_means(sums, counts, groups))
+    boot_seed, group_seed, pattern_seed = np.random.SeedSequence(seed).spawn(3)
+
+    boot = contrast_values(weights,
+                           _run_chunks(_bootstrap_chunk, (sums, counts, groups), n_resamples, boot_seed, workers))
+    low, high = np.quantile(boot, [alpha / 2, 1 - alpha / 2], axis=0)
+
+    p_values = np.full(len(contrasts), np.nan)
+    for scheme, scheme_seed in (("group", group_seed), ("pattern", pattern_seed)):
+        tested = np.array([s == scheme for _, s in contrasts.values()])
+        if not tested.any():
+            continue
+        null = contrast_values(weights[tested],
+                               _run_chunks(_permutation_chunk, (sums, counts, groups, scheme), n_resamples,
+                                           scheme_seed, workers))
+        extreme = (np.abs(null) >= np.abs(estimates[tested]) - 1e-12).sum(axis=0)
+        p_values[tested] = (1 + extreme) / (1 + n_resamples)
+    p_values[np.isnan(estimates)] = np.nan
+
+    return pd.DataFrame({"contrast": list(contrasts), "estimate": estimates,
+                         "ci_low": low, "ci_high": high, "p_value": p_values})
+
+
+if __name__ == "__main__":
+    data = pd.read_table("Res-AllTaps.txt", na_values="NaN")
+    for outcome in ("IRI", "RT"):
+        print(outcome)
+        print(group_pattern_contrasts(data, outcome).to_string(index=False))
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import QUANTILES, Summary, TapAggregator, aggregate_files
+
+# Baseline table of this folder
+ALL_TAPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Res-AllTaps.txt")
+
+
+def merged_in_random_order(rng, summaries: list, merge):
+    """
+    Merges summaries two at a time, in a random order, into a single one.
+    """
+    summaries = list(summaries)
+    while len(summaries) > 1:
+        i, j = sorted(rng.choice(len(summaries), 2, replace=False))
+        merged = merge(summaries[i], summaries[j])
+        summaries = summaries[:i] + summaries[i + 1:j] + summaries[j + 1:] + [merged]
+    return summaries[0]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("variable", ["IRI", "RT"])
+def test_merged_partitions_match_describe(seed, variable):
+    rng = np.random.default_rng(seed)
+    data = pd.read_table(ALL_TAPS, na_values="NaN")
+    rows = rng.permutation(len(data))
+    parts = np.split(rows, np.sort(rng.choice(len(data), rng.integers(1, 40), replace=False)))
+    aggregators = []
+    for part in parts:
+        aggregator = TapAggregator()
+        aggregator.update(data.iloc[part])
+        aggregators.append(aggregator)
+    aggregator = merged_in_random_order(rng, aggregators, TapAggregator.merge)
+
+    expected = data.groupby(["Group", "Pattern"])[variable].describe(percentiles=QUANTILES).dropna(subset=["mean"])
+    table = aggregator.table(variable)
+    assert aggregator.rows == len(data)
+    pd.testing.assert_frame_equal(table[expected.columns], expected, check_dtype=False, check_names=False)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_sketch_quantiles_stay_within_the_bound(seed):
+    rng = np.random.default_rng(seed)
+    size, n = 64, int(rng.integers(5000, 30000))
+    values = rng.exponential(1, n) if seed % 2 else rng.normal(0, rng.uniform(0.01, 1), n)
+    parts = np.split(values, np.sort(rng.choice(n, rng.integers(1, 100), replace=False)))
+    summaries = [Summary.of(part, np.zeros(len(part)), size) for part in parts if len(part)]
+    summary = merged_in_random_order(rng, summaries, lambda a, b: a.merge(b, size))
+    assert len(summary.centroids) <= size
+
+    ordered = np.sort(values)
+    for q in np.linspace(0, 1, 41):
+        estimate = summary.quantile(q)
+        low, high = np.searchsorted(ordered, estimate, "left"), np.searchsorted(ordered, estimate, "right")
+        rank = q * (n - 1)
+        assert max(low - rank, rank - high, 0) <= n / size
+
+
+def test_files_read_by_chunks():
+    whole = aggregate_files(ALL_TAPS)
+    chunks = aggregate_files([ALL_TAPS, ALL_TAPS], chunksize=100)
+    assert chunks.rows == 2 * whole.rows
+    by_chunks, expected = chunks.table("RT"), whole.table("RT")
+    pd.testing.assert_series_equal(by_chunks["count"], 2 * expected["count"])
+    pd.testing.assert_frame_equal(by_chunks[["mean", "min", "max", "slope", "intercept"]],
+                                  expected[["mean", "min", "max", "slope", "intercept"]])
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mixed_model import MixedModel, likelihood_ratio
+
+# Baseline table of this folder, the one tp3.R reads
+ALL_TAPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Res-AllTaps.txt")
+
+
+@pytest.fixture(scope="module")
+def data() -> pd.DataFrame:
+    return pd.read_table(ALL_TAPS, na_values="NaN")
+
+
+def test_linear_model_of_a_subject_matches_tp3_r(data):
+    # lm(VD~Pattern, data=Data_subject) and its glht contrasts
+    model = MixedModel(data[data["Sujet"] == 9], "RT", factors=("Pattern",), group=None).fit()
+    assert model.coef["Pattern2"] == pytest.approx(0.4435, abs=5e-5)
+    tests = model.contrast([[1, 0], [1, 1]])
+    assert tests["Pr(>|t|)"].iloc[0] == pytest.approx(0.302, abs=5e-4)
+    assert tests["Pr(>|t|)"].iloc[1] < 1e-10
+
+
+def test_mixed_models_match_tp3_r(data):
+    # lme(VD~Pattern, random=~1|Sujet, data=Data_PNS, method="ML")
+    model = MixedModel(data[data["Group"] == 0], "RT", factors=("Pattern",)).fit("ML")
+    assert model.coef["Pattern2"] == pytest.approx(0.3005, abs=5e-5)
+
+    # anova(M3, M2): Pattern + Group against Pattern alone
+    additive = MixedModel(data, "RT", interaction=False).fit("ML")
+    pattern = MixedModel(data, "RT", factors=("Pattern",)).fit("ML")
+    assert likelihood_ratio(pattern, additive)["p-value"] == pytest.approx(0.7092, abs=5e-5)
+    with pytest.raises(ValueError):
+        likelihood_ratio(pattern, MixedModel(data, "RT").fit("REML"))
+
+
+def test_one_row_per_subject_is_the_linear_model(data):
+    # The subject and residual variances cannot be told apart (lmer refuses such a model),
+    # only their sum is estimated, and the fixed effects are the ones of the linear model
+    rows = data.dropna(subset=["RT"]).groupby("Sujet").head(1)
+    model = MixedModel(rows, "RT", factors=("Group",)).fit("ML")
+    linear = MixedModel(rows, "RT", factors=("Group",), group=None).fit("ML")
+    np.testing.assert_allclose(model.coef, linear.coef, atol=1e-12)
+    assert model.deviance_ == pytest.approx(linear.deviance_)
+    assert model.sigma2 + model.random_cov[0, 0] == pytest.approx(linear.sigma2)
+    assert model.n_parameters == linear.n_parameters + 1
+
+
+@pytest.mark.parametrize("group", [None, "Sujet"])
+def test_adjusted_p_values_are_repeatable(data, group):
+    model = MixedModel(data, "RT", group=group).fit("ML")
+    K = [[1, 0, 0, 0], [1, 1, 0, 0], [0, 0, 1, 1]]
+    pd.testing.assert_frame_equal(model.contrast(K), model.contrast(K))
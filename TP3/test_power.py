@@ -0,0 +1,66 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from power import Design, Effects, fit_tapping, power_curve, simulate_pattern, welch_test
+
+# Baseline tables of this folder
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+ALL_TAPS = os.path.join(FOLDER, "Res-AllTaps.txt")
+STD_IRI = os.path.join(FOLDER, "Res-StdIRI.txt")
+
+
+def observed_subjects() -> dict:
+    """
+    Mean RT of every PNS in each pattern and mean stdIRI of every PNS, as in the baseline tables.
+    """
+    all_taps = pd.read_table(ALL_TAPS, na_values="NaN")
+    std_iri = pd.read_table(STD_IRI, na_values="NaN")
+    pns = all_taps[all_taps["Group"] == 0]
+    return {("RT", "PeriodicAlong"): pns[pns["Pattern"] == 1].groupby("Sujet")["RT"].mean(),
+            ("RT", "Aperiodic"): pns[pns["Pattern"] == 2].groupby("Sujet")["RT"].mean(),
+            ("stdIRI", "PeriodicAlong"): std_iri[std_iri["Group"] == 0].groupby("Sujet")["stdIRI"].mean()}
+
+
+@pytest.mark.parametrize("outcome, cond", [("RT", "PeriodicAlong"), ("RT", "Aperiodic"), ("stdIRI", "PeriodicAlong")])
+def test_simulated_subjects_fall_in_the_observed_ranges(outcome, cond):
+    observed = observed_subjects()[outcome, cond]
+    design = Design()
+    n_trains, length = ((design.periodic_trains, design.periodic_length) if cond == "PeriodicAlong"
+                        else (design.aperiodic_trains, design.aperiodic_length))
+    simulated = simulate_pattern(np.random.default_rng(0), cond, 10, n_trains, length, fit_tapping()[cond],
+                                 Effects(rt=0, jitter=1), 50)[outcome]
+    low, high = np.nanpercentile(simulated, [25, 75])
+    assert observed.min() <= low and high <= observed.max()
+    assert abs(np.nanmedian(simulated) - observed.median()) < observed.std()
+
+
+def test_power_rises_with_the_subjects():
+    curve = power_curve([5, 20], replications=200, workers=1)
+    assert (curve.iloc[1, 2:] > curve.iloc[0, 2:]).all()
+
+
+def test_workers_give_the_same_curve():
+    tapping = fit_tapping()
+    serial = power_curve([4, 8], tapping=tapping, replications=150, seed=3, workers=1)
+    parallel = power_curve([4, 8], tapping=tapping, replications=150, seed=3, workers=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_welch_test_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    a, b = rng.normal(0, 1, (40, 8)), rng.normal(0.5, 2, (40, 11))
+    a[rng.random(a.shape) < 0.2] = np.nan
+    b[rng.random(b.shape) < 0.2] = np.nan
+    a[0, 1:] = np.nan  # A single value, no p-value
+    b[1] = np.nan      # No value at all
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected = [stats.ttest_ind(row_a, row_b, equal_var=False, nan_policy="omit").pvalue
+                    for row_a, row_b in zip(a, b)]
+    np.testing.assert_allclose(welch_test(a, b), expected, rtol=1e-10, equal_nan=True)
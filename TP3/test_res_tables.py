@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from res_tables import SUBJECT_COLUMNS, TP3_DIR, all_taps_table, generate_tables, std_iri_table, write_table
+from TP2.final_script import load_datafile
+
+# Baseline tables of this folder, and whether their values are trimmed (see write_table)
+BASELINE = {"Res-AllTaps.txt": True, "Res-StdIRI.txt": False}
+
+# Data file of TP2, from a few recordings of the subjects of the baseline
+DATAFILE = os.path.join(TP3_DIR, "..", "TP2", "datafile.txt")
+
+
+def read_baseline(name: str) -> pd.DataFrame:
+    return pd.read_table(os.path.join(TP3_DIR, name), na_values="NaN")
+
+
+def read_bytes(fname: str) -> bytes:
+    with open(fname, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, trim", BASELINE.items())
+def test_baseline_tables_are_written_back_unchanged(tmp_path, name, trim):
+    write_table(str(tmp_path / name), read_baseline(name), trim)
+    assert read_bytes(tmp_path / name) == read_bytes(os.path.join(TP3_DIR, name))
+
+
+def test_std_iri_of_the_baseline_taps_is_the_baseline_one():
+    # Severity, SSI and Music of a few subjects differ between the two baseline tables
+    expected = read_baseline("Res-StdIRI.txt")
+    std_iri = std_iri_table(read_baseline("Res-AllTaps.txt")).reset_index(drop=True)
+    keys = ["Sujet", "Group", "File", "TrainNumber"]
+    pd.testing.assert_frame_equal(std_iri[keys], expected[keys], check_dtype=False)
+    # The baseline IRIs are rounded to 4 decimals
+    np.testing.assert_allclose(std_iri["stdIRI"], expected["stdIRI"], atol=1e-6)
+
+
+def test_tables_of_the_tp2_datafile_have_the_baseline_layout(tmp_path):
+    all_taps, _ = generate_tables(DATAFILE, str(tmp_path), os.path.join(TP3_DIR, "Res-AllTaps.txt"))
+    for name in BASELINE:
+        table, expected = read_bytes(tmp_path / name), read_bytes(os.path.join(TP3_DIR, name))
+        assert table.split(b"\r\n")[0] == expected.split(b"\r\n")[0]
+        assert not table.endswith(b"\r\n") and b"\n" not in table.replace(b"\r\n", b"")
+        assert pd.read_table(tmp_path / name, na_values="NaN").dtypes.equals(read_baseline(name).dtypes)
+
+    # The group and the subject information of every subject are the baseline ones
+    baseline = read_baseline("Res-AllTaps.txt").drop_duplicates("Sujet").set_index("Sujet")
+    subjects = all_taps.drop_duplicates("Sujet").set_index("Sujet")
+    columns = ["Group", *SUBJECT_COLUMNS]
+    pd.testing.assert_frame_equal(subjects[columns], baseline.loc[subjects.index, columns],
+                                  check_dtype=False, check_index_type=False)
+
+
+def test_tp2_datafile_gives_the_baseline_taps_of_a_recording():
+    # The baseline was made with an earlier detection, which split the other recordings into
+    # trains differently. The first periodic recording of subject 13 has the same trains and
+    # taps, its beats are found about 2 ms later.
+    all_taps = all_taps_table(load_datafile(DATAFILE))
+    baseline = read_baseline("Res-AllTaps.txt")
+    recording = [(table["Sujet"] == 13) & (table["Pattern"] == 1) & (table["File"] == 1) & (table["TrainNumber"] <= 2)
+                 for table in (all_taps, baseline)]
+    result, expected = all_taps[recording[0]], baseline[recording[1]]
+    assert result["BeatNumber"].tolist() == expected["BeatNumber"].tolist()
+    np.testing.assert_allclose(result["IRI"], expected["IRI"], atol=1e-4)
+    np.testing.assert_allclose(result["RT"], expected["RT"], atol=5e-3)
@@ -0,0 +1,70 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from resampling import CONTRASTS, cell_means, contrast_values, contrast_weights, group_pattern_contrasts, subject_cells
+
+# Baseline table of this folder
+ALL_TAPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Res-AllTaps.txt")
+
+
+def small_table(seed: int, n_per_group: int = 3) -> pd.DataFrame:
+    """
+    A few taps of each pattern for n_per_group subjects of each group, with an effect of both.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for subject in range(2 * n_per_group):
+        group = subject % 2
+        for pattern in (1, 2):
+            for rt in rng.normal(-0.04 + 0.02 * group - 0.01 * pattern, 0.02, rng.integers(2, 6)):
+                rows.append((subject + 1, group, pattern, rt))
+    return pd.DataFrame(rows, columns=["Sujet", "Group", "Pattern", "RT"])
+
+
+def exact_p_values(table: pd.DataFrame) -> np.ndarray:
+    """
+    Permutation p-values of the CONTRASTS over every group assignment or pattern swap.
+    """
+    _, groups, sums, counts = subject_cells(table, "RT")
+    weights = contrast_weights()
+    observed = np.abs(contrast_values(weights, cell_means(sums, counts, groups)))
+
+    assignments = []
+    for members in itertools.combinations(range(len(groups)), int(groups.sum())):
+        permuted = np.zeros(len(groups), dtype=groups.dtype)
+        permuted[list(members)] = 1
+        assignments.append(cell_means(sums, counts, permuted))
+    swaps = []
+    for swap in itertools.product((False, True), repeat=len(groups)):
+        swap = np.array(swap)[:, None]
+        swaps.append(cell_means(np.where(swap, sums[:, ::-1], sums), np.where(swap, counts[:, ::-1], counts), groups))
+
+    p_values = []
+    for k, (_, scheme) in enumerate(CONTRASTS.values()):
+        null = np.abs(contrast_values(weights[k:k + 1], np.array(assignments if scheme == "group" else swaps)))
+        p_values.append(np.mean(null[:, 0] >= observed[k] - 1e-12))
+    return np.array(p_values)
+
+
+def test_results_only_depend_on_the_seed():
+    table = pd.read_table(ALL_TAPS, na_values="NaN")
+    results = [group_pattern_contrasts(table, "IRI", n_resamples=5000, seed=3, workers=workers)
+               for workers in (1, 2, 3)]
+    for result in results[1:]:
+        pd.testing.assert_frame_equal(result, results[0])
+    other = group_pattern_contrasts(table, "IRI", n_resamples=5000, seed=4, workers=1)
+    assert not other["ci_low"].equals(results[0]["ci_low"])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_permutation_p_values_match_the_enumeration(seed):
+    table = small_table(seed)
+    result = group_pattern_contrasts(table, "RT", n_resamples=40000, seed=seed, workers=1)
+    # Sampling error of 40000 resamples, at most 0.0025 for a p-value
+    np.testing.assert_allclose(result["p_value"], exact_p_values(table), atol=0.01)
+    # The point estimates are the observed contrasts, inside their intervals
+    assert ((result["ci_low"] <= result["estimate"]) & (result["estimate"] <= result["ci_high"])).all()